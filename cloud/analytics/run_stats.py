@@ -0,0 +1,269 @@
+# run_stats.py
+
+# Columnar, vectorised summaries of run history. Runs are held as NumPy
+# arrays (profile dimensions as integer category codes, latencies and phase
+# timings as float columns) and grouped with bincount / lexsort instead of
+# row-by-row Python loops. New runs are appended incrementally as the run
+# store commits them.
+#
+# CLI (from cloud/):
+#     python -m analytics.run_stats --by browser os viewport webgl_renderer
+
+import argparse
+import json
+import sqlite3
+import threading
+
+import numpy as np
+
+from storage.run_store import RUN_DB_PATH
+
+DIMENSIONS = ("browser", "version", "os", "hardware_type", "language",
+              "timezone", "viewport", "webgl_vendor", "webgl_renderer", "result_type")
+PERCENTILES = (50, 90, 95, 99)
+
+_INITIAL_CAPACITY = 1024
+
+
+class RunAnalytics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.n = 0
+        self._capacity = _INITIAL_CAPACITY
+        self._max_rowid = 0
+        self._seen = set()      # run ids, so history load + live feed never double count
+
+        # Categorical columns: codes plus the value <-> code vocabulary
+        self._codes = {d: np.zeros(self._capacity, dtype=np.int32) for d in DIMENSIONS}
+        self._vocab = {d: {} for d in DIMENSIONS}
+        self._labels = {d: [] for d in DIMENSIONS}
+
+        self._created_at = np.zeros(self._capacity, dtype=np.float64)
+        self._total_ms = np.full(self._capacity, np.nan)
+        self._success = np.zeros(self._capacity, dtype=bool)
+        self._failed = np.zeros(self._capacity, dtype=bool)
+
+        # Phase timings: one column per phase name, NaN where a run has no such phase
+        self._phase_index = {}
+        self._phases = np.full((self._capacity, 0), np.nan)
+
+    # ---- Ingest ----
+
+    def _grow(self, needed):
+        if needed <= self._capacity:
+            return
+        cap = self._capacity
+        while cap < needed:
+            cap *= 2
+
+        def grow(arr, fill):
+            out = np.full((cap,) + arr.shape[1:], fill, dtype=arr.dtype)
+            out[:self.n] = arr[:self.n]
+            return out
+
+        self._codes = {d: grow(a, 0) for d, a in self._codes.items()}
+        self._created_at = grow(self._created_at, 0.0)
+        self._total_ms = grow(self._total_ms, np.nan)
+        self._success = grow(self._success, False)
+        self._failed = grow(self._failed, False)
+        self._phases = grow(self._phases, np.nan)
+        self._capacity = cap
+
+    def _code(self, dim, value):
+        vocab = self._vocab[dim]
+        code = vocab.get(value)
+        if code is None:
+            code = vocab[value] = len(self._labels[dim])
+            self._labels[dim].append(value)
+        return code
+
+    def _phase_column(self, phase):
+        col = self._phase_index.get(phase)
+        if col is None:
+            col = self._phase_index[phase] = self._phases.shape[1]
+            self._phases = np.hstack([self._phases, np.full((self._capacity, 1), np.nan)])
+        return col
+
+    def append(self, rows):
+        """Add run rows (RunStore row dicts). Safe to call from the store's writer thread."""
+        with self._lock:
+            rows = [r for r in rows if r["run_id"] not in self._seen]
+            if not rows:
+                return
+            self._seen.update(r["run_id"] for r in rows)
+
+            start = self.n
+            self._grow(start + len(rows))
+
+            for d in DIMENSIONS:
+                self._codes[d][start:start + len(rows)] = [self._code(d, r.get(d)) for r in rows]
+
+            self._created_at[start:start + len(rows)] = [r["created_at"] for r in rows]
+            self._total_ms[start:start + len(rows)] = [
+                r["total_ms"] if r.get("total_ms") is not None and r["status"] == "ok" else np.nan
+                for r in rows
+            ]
+            self._success[start:start + len(rows)] = [r.get("result_type") == "success" for r in rows]
+            self._failed[start:start + len(rows)] = [r["status"] != "ok" for r in rows]
+
+            for i, r in enumerate(rows, start):
+                timings = r.get("timings") or {}
+                if isinstance(timings, str):
+                    timings = json.loads(timings)
+                for phase, ms in timings.items():
+                    if phase != "total":
+                        col = self._phase_column(phase)     # may widen self._phases
+                        self._phases[i, col] = ms
+
+            self.n = start + len(rows)
+
+    def load_sqlite(self, path=RUN_DB_PATH):
+        """Pull rows committed since the last load (incremental by rowid)."""
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cur = conn.execute("SELECT rowid, * FROM runs WHERE rowid > ? ORDER BY rowid", (self._max_rowid,))
+            while True:
+                batch = [dict(r) for r in cur.fetchmany(5000)]
+                if not batch:
+                    break
+                self._max_rowid = batch[-1]["rowid"]
+                self.append(batch)
+        except sqlite3.OperationalError:
+            pass        # no runs table yet
+        finally:
+            conn.close()
+        return self
+
+    # ---- Queries ----
+
+    def summary(self, by, since=None, until=None):
+        """Grouped success rate, latency percentiles and mean phase breakdown per value of `by`."""
+        if by not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {by!r}; expected one of {list(DIMENSIONS)}")
+
+        with self._lock:
+            n = self.n
+            mask = np.ones(n, dtype=bool)
+            if since is not None:
+                mask &= self._created_at[:n] >= since
+            if until is not None:
+                mask &= self._created_at[:n] < until
+
+            codes = self._codes[by][:n][mask]
+            total_ms = self._total_ms[:n][mask]
+            success = self._success[:n][mask]
+            failed = self._failed[:n][mask]
+            phases = self._phases[:n][mask]
+            labels = list(self._labels[by])
+            phase_names = sorted(self._phase_index, key=self._phase_index.get)
+
+        k = len(labels)
+        if k == 0 or codes.size == 0:
+            return []
+
+        runs = np.bincount(codes, minlength=k)
+        successes = np.bincount(codes, weights=success, minlength=k)
+        failures = np.bincount(codes, weights=failed, minlength=k)
+
+        pct = _grouped_percentiles(codes, total_ms, k, PERCENTILES)
+
+        # Mean per phase per group, ignoring runs that never reached the phase
+        present = ~np.isnan(phases)
+        phase_sum = np.zeros((k, phases.shape[1]))
+        phase_cnt = np.zeros((k, phases.shape[1]))
+        np.add.at(phase_sum, codes, np.where(present, phases, 0.0))
+        np.add.at(phase_cnt, codes, present)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            phase_mean = phase_sum / phase_cnt
+
+        out = []
+        for code in np.flatnonzero(runs):
+            out.append({
+                "value": labels[code],
+                "runs": int(runs[code]),
+                "successes": int(successes[code]),
+                "failures": int(failures[code]),
+                "success_rate": round(float(successes[code] / runs[code]), 4),
+                "latency_ms": {f"p{p}": _num(pct[p][code]) for p in PERCENTILES},
+                "phases_ms": {name: _num(phase_mean[code, col]) for col, name in enumerate(phase_names)},
+            })
+        out.sort(key=lambda g: g["runs"], reverse=True)
+        return out
+
+    def overview(self, dimensions=("browser", "os", "viewport", "webgl_renderer"), since=None, until=None):
+        return {"runs": self.n, "by": {d: self.summary(d, since, until) for d in dimensions}}
+
+
+def _grouped_percentiles(codes, values, k, percentiles):
+    """Nearest-rank percentiles of `values` per group code, computed in one lexsort pass."""
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    result = {p: np.full(k, np.nan) for p in percentiles}
+    if values.size == 0:
+        return result
+
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=k)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has = counts > 0
+
+    for p in percentiles:
+        rank = np.maximum(np.ceil(p / 100 * counts).astype(np.int64) - 1, 0)
+        result[p][has] = sorted_values[(starts + rank)[has]]
+    return result
+
+
+def _num(x):
+    return None if np.isnan(x) else round(float(x), 1)
+
+
+# ---- Process-wide singleton fed by the run store ----
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_run_analytics(store=None):
+    """Load history once, then stay current by subscribing to the store's committed batches."""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            analytics = RunAnalytics()
+            if store is not None:
+                store.subscribe(analytics.append)
+                analytics.load_sqlite(store.path)
+            _analytics = analytics
+    return _analytics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise run history")
+    parser.add_argument("--db", default=RUN_DB_PATH)
+    parser.add_argument("--by", nargs="+", default=["browser", "os", "viewport", "webgl_renderer"],
+                        choices=DIMENSIONS)
+    parser.add_argument("--since", type=float, help="Only runs at/after this unix time")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON")
+    args = parser.parse_args()
+
+    analytics = RunAnalytics().load_sqlite(args.db)
+    report = analytics.overview(args.by, since=args.since)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['runs']} runs in {args.db}")
+    for dim, groups in report["by"].items():
+        print(f"\n=== by {dim} ===")
+        print(f"{'value':>40} {'runs':>6} {'success':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for g in groups:
+            lat = g["latency_ms"]
+            print(f"{str(g['value'])[:40]:>40} {g['runs']:>6} {g['success_rate'] * 100:>7.1f}% "
+                  f"{lat['p50'] or 0:>9.0f} {lat['p95'] or 0:>9.0f} {lat['p99'] or 0:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# bench_hot_paths.py
+
+# Offline microbenchmarks for the pure-Python work done on every run: profile
+# generation, spoof-script building, mouse path generation (CDP dispatch and
+# sleeps stubbed out) and the ProfileModel -> BrowserProfile conversion.
+# No browser or network is needed.
+#
+# Run from cloud/:
+#     python -m benchmarks.bench_hot_paths --output bench.json
+#     python -m benchmarks.bench_hot_paths --save-baseline        # record benchmarks/baseline.json
+#     python -m benchmarks.bench_hot_paths --compare              # exit 1 on regressions
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+from unittest import mock
+
+import numpy as np
+
+from profiles.profile import BrowserProfile
+from profiles.profile_generator import generate_random_profile
+from environment.webgl_spoof_cloud import build_webgl_spoof_script_cloud
+from environment.canvas_spoof_cloud import build_canvas_spoof_script
+from environment.audio_spoof_cloud import build_audio_spoof_script
+from environment.navigator_spoof_cloud import build_navigator_spoof_script
+from interactions import mouse_movement_cloud
+from interactions.trajectory_library import TrajectoryLibrary, build_library
+from tls_server import ProfileModel
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+REPEATS = 7
+REGRESSION_THRESHOLD = 0.20     # fail when >20% slower than baseline
+
+
+class NullDriver:
+    """Accepts CDP commands and does nothing, so only path generation is measured."""
+
+    def execute_cdp_cmd(self, cmd, params):
+        return {}
+
+
+def _benchmarks():
+    rng = random.Random(0)      # same inputs on every run
+    raw = generate_random_profile(rng)
+    profile = BrowserProfile(**raw)
+    driver = NullDriver()
+    library = _library()
+
+    return {
+        "generate_random_profile": lambda: generate_random_profile(rng),
+        "build_webgl_spoof_script_cloud": lambda: build_webgl_spoof_script_cloud(profile),
+        "build_canvas_spoof_script": lambda: build_canvas_spoof_script(profile),
+        "build_audio_spoof_script": lambda: build_audio_spoof_script(profile),
+        "build_navigator_spoof_script": lambda: build_navigator_spoof_script(profile),
+        "bezier": lambda: mouse_movement_cloud.bezier(10.0, 120.0, 480.0, 600.0, 0.37),
+        "human_curve_motion_short": lambda: mouse_movement_cloud.human_curve_motion(driver, 600, 400, 640, 420, rng),
+        "human_curve_motion_long": lambda: mouse_movement_cloud.human_curve_motion(driver, 10, 10, 1200, 700, rng),
+        "library_motion_short":
+            lambda: mouse_movement_cloud.human_curve_motion(driver, 600, 400, 640, 420, rng, library=library),
+        "library_motion_long":
+            lambda: mouse_movement_cloud.human_curve_motion(driver, 10, 10, 1200, 700, rng, library=library),
+        "profile_model_to_browser_profile":
+            lambda: BrowserProfile(**ProfileModel.model_validate(raw).model_dump(exclude={"seed"})),
+    }
+
+
+def _library():
+    """A small trajectory library in a temp file, opened memory-mapped like a real one."""
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-trajectories-"), "trajectories.npy")
+    np.save(path, build_library(buckets=16, per_bucket=32))
+    return TrajectoryLibrary(path)
+
+
+def measure(fn):
+    """Per-call timing in microseconds: best and median over REPEATS auto-ranged repeats."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()      # enough calls for a repeat to take >= 0.2 s
+    runs = [t / number * 1e6 for t in timer.repeat(repeat=REPEATS, number=number)]
+
+    return {
+        "best_us": round(min(runs), 3),
+        "median_us": round(statistics.median(runs), 3),
+        "stdev_us": round(statistics.stdev(runs), 3),
+        "calls_per_repeat": number,
+    }
+
+
+def run_all(only=None):
+    results = {}
+    # Sleeps in the mouse path would dominate; the benchmark is about the Python work around them
+    with mock.patch.object(mouse_movement_cloud.time, "sleep", lambda s: None):
+        for name, fn in _benchmarks().items():
+            if only and not any(o in name for o in only):
+                continue
+            results[name] = measure(fn)
+            print(f"{name:>34}: best {results[name]['best_us']:>10.2f} us   "
+                  f"median {results[name]['median_us']:>10.2f} us")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return the benchmarks whose best time regressed by more than `threshold`."""
+    regressions = []
+    print(f"\n{'benchmark':>34} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:>34} {'-':>10} {r['best_us']:>10.2f}      new")
+            continue
+
+        change = r["best_us"] / base["best_us"] - 1
+        flag = " REGRESSION" if change > threshold else ""
+        print(f"{name:>34} {base['best_us']:>10.2f} {r['best_us']:>10.2f} {change * 100:>+7.1f}%{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for per-run hot paths")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--only", nargs="*", help="Run only benchmarks whose name contains one of these")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline, exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": run_all(args.only),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first")
+            sys.exit(2)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# capture.py
+
+# Screenshots straight from CDP (Page.captureScreenshot) instead of
+# WebDriver's full-window save_screenshot. Capture can be limited to a clip
+# region, so each frame encodes fewer pixels:
+#
+# SCREENSHOT_CLIP     unset: the whole viewport
+#                     "x,y,width,height": a fixed rectangle (CSS pixels)
+#                     anything else: a CSS selector; the frame is that element's box
+#                     (the viewport when the element isn't on the page)
+# SCREENSHOT_FORMAT   "png" (default), "jpeg" or "webp"
+# SCREENSHOT_QUALITY  0-100 for jpeg/webp (default 80)
+
+import base64
+import os
+
+from selenium.webdriver.common.by import By
+
+SCREENSHOT_CLIP = os.environ.get("SCREENSHOT_CLIP", "").strip()
+SCREENSHOT_FORMAT = os.environ.get("SCREENSHOT_FORMAT", "png")
+SCREENSHOT_QUALITY = int(os.environ.get("SCREENSHOT_QUALITY", "80"))
+
+
+def parse_clip(spec):
+    """(x, y, width, height) for a rectangle spec, the selector string for anything else, None if empty."""
+    if not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) == 4:
+        try:
+            x, y, w, h = (float(p) for p in parts)
+        except ValueError:
+            return spec
+        if w <= 0 or h <= 0:
+            raise ValueError(f"SCREENSHOT_CLIP {spec!r}: width and height must be positive")
+        return x, y, w, h
+    return spec
+
+
+_clip = parse_clip(SCREENSHOT_CLIP)
+
+
+def _region(x, y, w, h):
+    return {"x": x, "y": y, "width": w, "height": h, "scale": 1}
+
+
+def _clip_region(driver, clip):
+    if clip is None:
+        return None
+    if isinstance(clip, str):
+        found = driver.find_elements(By.CSS_SELECTOR, clip)
+        if not found:
+            return None
+        rect = found[0].rect
+        if not rect["width"] or not rect["height"]:
+            return None
+        x, y, w, h = rect["x"], rect["y"], rect["width"], rect["height"]
+    else:
+        x, y, w, h = clip
+    return _region(x, y, w, h)
+
+
+def _screenshot_params(region, fmt, quality):
+    params = {"format": fmt}
+    if fmt != "png":
+        params["quality"] = quality
+    if region is not None:
+        params["clip"] = region
+    return params
+
+
+def capture_screenshot(driver, clip=_clip, fmt=SCREENSHOT_FORMAT, quality=SCREENSHOT_QUALITY):
+    """Encoded image bytes of the current page, limited to `clip` (see parse_clip())."""
+    params = _screenshot_params(_clip_region(driver, clip), fmt, quality)
+    return base64.b64decode(driver.execute_cdp_cmd("Page.captureScreenshot", params)["data"])
+
+
+async def capture_screenshot_async(page, clip=_clip, fmt=SCREENSHOT_FORMAT, quality=SCREENSHOT_QUALITY):
+    """capture_screenshot() for a cdp_client.CDPPage (DRIVER_BACKEND=cdp)."""
+    region = None
+    if isinstance(clip, str):
+        rect = await page.element_rect(clip, document=True)
+        if rect and rect["width"] and rect["height"]:
+            region = _region(rect["x"], rect["y"], rect["width"], rect["height"])
+    elif clip is not None:
+        region = _region(*clip)
+    return await page.screenshot(_screenshot_params(region, fmt, quality))
@@ -0,0 +1,343 @@
+# cdp_client.py
+
+# Chrome DevTools Protocol straight from asyncio, without chromedriver in the
+# middle (DRIVER_BACKEND=cdp). One Chrome per process is started with
+# --remote-debugging-port and reached over a single websocket. Every run
+# gets its own browser context (separate cookies, storage and cache, like an
+# incognito window) with one page in it, attached as a flat session on that
+# same socket. So one event loop drives any number of concurrent runs
+# without a thread or an HTTP hop per command.
+#
+# CHROME_BINARY          Chrome to launch (default: chrome / google-chrome / chromium on PATH)
+# CDP_COMMAND_TIMEOUT    seconds to wait for any single command (default 30)
+# CDP_LAUNCH_TIMEOUT     seconds to wait for Chrome to open its debugging port (default 20)
+
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from environment.driver_service import base_chrome_options, dev_shm_usable
+
+CHROME_BINARY = os.environ.get("CHROME_BINARY")
+CDP_COMMAND_TIMEOUT = float(os.environ.get("CDP_COMMAND_TIMEOUT", "30"))
+CDP_LAUNCH_TIMEOUT = float(os.environ.get("CDP_LAUNCH_TIMEOUT", "20"))
+
+_BINARY_NAMES = ("chrome", "google-chrome", "google-chrome-stable", "chromium", "chromium-browser")
+
+logger = logging.getLogger(__name__)
+
+_browser = None
+_browser_lock = asyncio.Lock()
+
+
+class CDPError(Exception):
+    """A command answered with an error, or the connection went away before it answered."""
+
+    def __init__(self, method, message, code=None):
+        super().__init__(f"{method}: {message}")
+        self.method = method
+        self.code = code
+
+
+# ---- Connection ----
+
+class CDPConnection:
+    """One DevTools websocket; commands are matched to answers by id, events routed by session."""
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._ids = itertools.count(1)
+        self._pending = {}                      # id -> (method, future)
+        self._listeners = defaultdict(list)     # (session id, event) -> callbacks
+        self._reader = asyncio.create_task(self._read())
+
+    @classmethod
+    async def open(cls, url):
+        # Screenshots and trace chunks easily exceed the default 1 MiB frame limit
+        return cls(await connect(url, max_size=None, ping_interval=None, open_timeout=CDP_LAUNCH_TIMEOUT))
+
+    @property
+    def closed(self):
+        return self._reader.done()
+
+    async def send(self, method, params=None, session_id=None, timeout=CDP_COMMAND_TIMEOUT):
+        if self.closed:
+            raise CDPError(method, "connection closed")
+        msg_id = next(self._ids)
+        message = {"id": msg_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = (method, future)
+        try:
+            await self._ws.send(json.dumps(message))
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise CDPError(method, f"no answer within {timeout:g}s") from None
+        finally:
+            self._pending.pop(msg_id, None)
+
+    def on(self, event, callback, session_id=None):
+        """Call `callback(params)` for every `event` on the session; returns a remover."""
+        key = (session_id, event)
+        self._listeners[key].append(callback)
+        return lambda: self._listeners[key].remove(callback) if callback in self._listeners[key] else None
+
+    async def _read(self):
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                if "id" in message:
+                    method, future = self._pending.get(message["id"], (None, None))
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        error = message["error"]
+                        future.set_exception(CDPError(method, error.get("message"), error.get("code")))
+                    else:
+                        future.set_result(message.get("result", {}))
+                    continue
+                for callback in list(self._listeners.get((message.get("sessionId"), message.get("method")), ())):
+                    try:
+                        callback(message.get("params", {}))
+                    except Exception:
+                        logger.warning("CDP event handler failed", exc_info=True,
+                                       extra={"event": message.get("method")})
+        except ConnectionClosed:
+            pass
+        finally:
+            for method, future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CDPError(method, "connection closed"))
+
+    async def close(self):
+        await self._ws.close()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
+# ---- Pages ----
+
+class CDPPage:
+    """One run's page: a target in its own browser context, attached as a flat session."""
+
+    def __init__(self, browser, context_id, target_id, session_id):
+        self.browser = browser
+        self.connection = browser.connection
+        self.context_id = context_id
+        self.target_id = target_id
+        self.session_id = session_id
+
+    @property
+    def socket_url(self):
+        """Page-level DevTools websocket, for a second client such as the screencast recorder."""
+        return f"ws://{self.browser.address}/devtools/page/{self.target_id}"
+
+    async def send(self, method, params=None, timeout=CDP_COMMAND_TIMEOUT):
+        return await self.connection.send(method, params, self.session_id, timeout)
+
+    def on(self, event, callback):
+        return self.connection.on(event, callback, self.session_id)
+
+    async def wait_for(self, event, timeout=CDP_COMMAND_TIMEOUT, trigger=None):
+        """Params of the next `event`; `trigger` (a coroutine) is awaited after listening starts."""
+        future = asyncio.get_running_loop().create_future()
+        remove = self.on(event, lambda params: future.done() or future.set_result(params))
+        try:
+            if trigger is not None:
+                await trigger
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise CDPError(event, f"not received within {timeout:g}s") from None
+        finally:
+            remove()
+
+    async def navigate(self, url, timeout=CDP_COMMAND_TIMEOUT):
+        """Load `url` and wait for its load event."""
+        result = {}
+
+        async def start():
+            result.update(await self.send("Page.navigate", {"url": url}, timeout))
+            if result.get("errorText"):
+                raise CDPError("Page.navigate", f"{url}: {result['errorText']}")
+
+        await self.wait_for("Page.loadEventFired", timeout, start())
+        return result
+
+    async def evaluate(self, expression, await_promise=False):
+        """Value of a JavaScript expression in the page (JSON-serialisable results only)."""
+        result = await self.send("Runtime.evaluate", {"expression": expression, "returnByValue": True,
+                                                      "awaitPromise": await_promise})
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CDPError("Runtime.evaluate", details.get("exception", {}).get("description") or details["text"])
+        return result["result"].get("value")
+
+    async def element_rect(self, selector, document=False):
+        """{"x", "y", "width", "height"} of the first `selector` match, or None.
+
+        CSS pixels relative to the viewport (what input events use), or to the
+        document with `document` (what a screenshot clip uses).
+        """
+        offset = "window.scrollX, window.scrollY" if document else "0, 0"
+        return await self.evaluate(
+            f"(() => {{ const e = document.querySelector({json.dumps(selector)});"
+            f" if (!e) return null; const r = e.getBoundingClientRect(); const [dx, dy] = [{offset}];"
+            f" return {{x: r.x + dx, y: r.y + dy, width: r.width, height: r.height}}; }})()")
+
+    async def title(self):
+        return await self.evaluate("document.title")
+
+    async def type_text(self, selector, text):
+        """Focus the element and type `text` as key events (what send_keys does)."""
+        await self.evaluate(f"document.querySelector({json.dumps(selector)}).focus()")
+        for char in text:
+            await self.send("Input.dispatchKeyEvent", {"type": "keyDown", "text": char, "key": char})
+            await self.send("Input.dispatchKeyEvent", {"type": "keyUp", "key": char})
+
+    async def screenshot(self, params):
+        """Decoded Page.captureScreenshot image for the given params (format, quality, clip)."""
+        return base64.b64decode((await self.send("Page.captureScreenshot", params))["data"])
+
+    async def collect_trace(self, timeout=10.0):
+        """Stop a Tracing.start()ed recording and return its trace events."""
+        events = []
+        remove = self.on("Tracing.dataCollected", lambda params: events.extend(params.get("value", ())))
+        try:
+            await self.wait_for("Tracing.tracingComplete", timeout, self.send("Tracing.end"))
+        finally:
+            remove()
+        return events
+
+
+# ---- Browser ----
+
+def chrome_binary():
+    if CHROME_BINARY:
+        return CHROME_BINARY
+    for name in _BINARY_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise RuntimeError("no Chrome found on PATH; set CHROME_BINARY")
+
+
+class CDPBrowser:
+    """A Chrome process and the one connection every page of this process goes through."""
+
+    def __init__(self, process, connection, address, user_data_dir):
+        self.process = process
+        self.connection = connection
+        self.address = address
+        self.user_data_dir = user_data_dir
+
+    @classmethod
+    async def launch(cls, extra_args=()):
+        user_data_dir = tempfile.mkdtemp(prefix="cdp-chrome-", dir="/dev/shm" if dev_shm_usable() else None)
+        args = [*base_chrome_options().arguments, *extra_args, f"--user-data-dir={user_data_dir}",
+                "--remote-debugging-port=0", "about:blank"]
+        process = await asyncio.create_subprocess_exec(chrome_binary(), *args, stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.DEVNULL)
+        try:
+            address, path = await cls._debugging_endpoint(process, user_data_dir)
+            connection = await CDPConnection.open(f"ws://{address}{path}")
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+            raise
+        logger.info("chrome started for CDP", extra={"pid": process.pid, "address": address})
+        return cls(process, connection, address, user_data_dir)
+
+    @staticmethod
+    async def _debugging_endpoint(process, user_data_dir):
+        # Chrome writes the port it picked and the browser target path to DevToolsActivePort
+        marker = os.path.join(user_data_dir, "DevToolsActivePort")
+        loop = asyncio.get_running_loop()
+        give_up = loop.time() + CDP_LAUNCH_TIMEOUT
+        while loop.time() < give_up:
+            if process.returncode is not None:
+                raise RuntimeError(f"chrome exited with {process.returncode} during startup")
+            try:
+                with open(marker) as f:
+                    port, path = f.read().split()[:2]
+                return f"127.0.0.1:{port}", path
+            except (FileNotFoundError, ValueError):
+                await asyncio.sleep(0.05)
+        raise RuntimeError(f"chrome did not open a debugging port within {CDP_LAUNCH_TIMEOUT:g}s")
+
+    @property
+    def alive(self):
+        return self.process.returncode is None and not self.connection.closed
+
+    async def new_page(self, width=1280, height=800, proxy=None):
+        """A blank page in a fresh browser context."""
+        params = {"disposeOnDetach": True}
+        if proxy:
+            params["proxyServer"] = proxy
+        context_id = (await self.connection.send("Target.createBrowserContext", params))["browserContextId"]
+        try:
+            target_id = (await self.connection.send("Target.createTarget", {
+                "url": "about:blank", "browserContextId": context_id, "width": width, "height": height,
+            }))["targetId"]
+            session_id = (await self.connection.send("Target.attachToTarget", {
+                "targetId": target_id, "flatten": True,
+            }))["sessionId"]
+        except BaseException:
+            await self.dispose_context(context_id)
+            raise
+        return CDPPage(self, context_id, target_id, session_id)
+
+    async def dispose_context(self, context_id):
+        """Close a context and everything in it; a browser that is already gone is not an error."""
+        if not self.alive:
+            return
+        try:
+            await self.connection.send("Target.disposeBrowserContext", {"browserContextId": context_id})
+        except CDPError:
+            logger.warning("could not dispose browser context", exc_info=True, extra={"context": context_id})
+
+    async def close(self):
+        try:
+            if not self.connection.closed:
+                try:
+                    await self.connection.send("Browser.close", timeout=5)
+                except CDPError:
+                    pass
+                await self.connection.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        finally:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+async def get_cdp_browser(extra_args=()):
+    """This process's Chrome, (re)started on first use or after it died."""
+    global _browser
+    async with _browser_lock:
+        if _browser is None or not _browser.alive:
+            if _browser is not None:
+                logger.warning("CDP chrome went away; restarting", extra={"pid": _browser.process.pid})
+                await _browser.close()
+            _browser = await CDPBrowser.launch(extra_args)
+    return _browser
+
+
+async def close_cdp_browser():
+    global _browser
+    async with _browser_lock:
+        if _browser is not None:
+            await _browser.close()
+            _browser = None
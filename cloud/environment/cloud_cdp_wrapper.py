@@ -0,0 +1,82 @@
+# cloud_cdp_wrapper.py
+
+# DRIVER_BACKEND=cdp counterpart of cloud_selenium_wrapper: the same spoofing
+# applied to a page of the process-wide CDP Chrome instead of a chromedriver
+# session. UA and language are per-page overrides here, since the browser
+# (and its command line) is shared by every run.
+
+from environment.webgl_spoof_cloud import build_webgl_spoof_script_cloud
+from environment.canvas_spoof_cloud import build_canvas_spoof_script
+from environment.audio_spoof_cloud import build_audio_spoof_script
+from environment.navigator_spoof_cloud import build_navigator_spoof_script
+from environment.asset_cache import asset_cache_address, asset_cache_spki
+from environment.cdp_client import get_cdp_browser
+from observability.tracing import TRACE_CATEGORIES, span
+
+
+def _launch_args():
+    # The asset cache re-signs HTTPS; trust only its CA (browser-wide flag, so set at launch)
+    spki = asset_cache_spki() if asset_cache_address() else None
+    return (f"--ignore-certificate-errors-spki-list={spki}",) if spki else ()
+
+
+async def prepare_cdp_browser():
+    """Start this process's Chrome ahead of the first run."""
+    await get_cdp_browser(_launch_args())
+
+
+async def create_cdp_page(profile, trace=False):
+
+    browser = await get_cdp_browser(_launch_args())
+    cache_proxy = asset_cache_address()
+
+    with span("cdp.new_context", cat="cdp"):
+        page = await browser.new_page(1280, 800, proxy=f"http://{cache_proxy}" if cache_proxy else None)
+
+    try:
+        await page.send("Page.enable")
+        if trace:
+            await page.send("Performance.enable", {"timeDomain": "timeTicks"})
+            await page.send("Tracing.start", {"categories": TRACE_CATEGORIES, "transferMode": "ReportEvents"})
+
+        with span("cdp.emulation", cat="cdp"):
+            # ---- UA + language spoof ----
+            await page.send("Emulation.setUserAgentOverride",
+                            {"userAgent": profile.user_agent, "acceptLanguage": profile.language})
+
+            # ---- Timezone spoof ----
+            await page.send("Emulation.setTimezoneOverride", {"timezoneId": profile.timezone})
+
+            # ---- Override device metrics ----
+            await page.send(
+                "Emulation.setDeviceMetricsOverride",
+                {
+                    "width": profile.viewport[0],
+                    "height": profile.viewport[1],
+                    "deviceScaleFactor": 1,
+                    "mobile": profile.hardware_type == "mobile"
+                }
+            )
+
+        # ---- Inject spoofing scripts ----
+
+        scripts = [
+            build_webgl_spoof_script_cloud(profile),
+            build_canvas_spoof_script(profile),
+            build_audio_spoof_script(profile),
+            build_navigator_spoof_script(profile)
+        ]
+
+        with span("cdp.inject_scripts", cat="cdp", scripts=len(scripts)):
+            for script in scripts:
+                await page.send("Page.addScriptToEvaluateOnNewDocument", {"source": script})
+    except BaseException:
+        await release_cdp_page(page)
+        raise
+
+    return page
+
+
+async def release_cdp_page(page):
+    """Close the run's browser context (and its page); the browser stays up for the next run."""
+    await page.browser.dispose_context(page.context_id)
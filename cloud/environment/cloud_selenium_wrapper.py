@@ -1,21 +1,27 @@
 # cloud_selenium_wrapper.py
-import os
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 
 from environment.webgl_spoof_cloud import build_webgl_spoof_script_cloud
 from environment.canvas_spoof_cloud import build_canvas_spoof_script
 from environment.audio_spoof_cloud import build_audio_spoof_script
 from environment.navigator_spoof_cloud import build_navigator_spoof_script
+from environment.asset_cache import asset_cache_address, asset_cache_spki
+from observability.tracing import browser_trace_options, span
+from environment.driver_service import (
+    SharedServiceChrome,
+    base_chrome_options,
+    clone_user_data_dir,
+    get_driver_service,
+    remove_user_data_dir,
+)
 
-def create_cloud_driver(profile):
+def create_cloud_driver(profile, trace=False):
+
+    service = get_driver_service()
+    user_data_dir = clone_user_data_dir()
 
     # ---- Chrome options ----
-    chrome_opts = Options()
-    chrome_opts.add_argument("--headless=new")
-    chrome_opts.add_argument("--no-sandbox")
-    chrome_opts.add_argument("--disable-dev-shm-usage")
-    chrome_opts.add_argument("--disable-gpu")
+    chrome_opts = base_chrome_options()
+    chrome_opts.add_argument(f"--user-data-dir={user_data_dir}")
 
     # UA spoof
     chrome_opts.add_argument(f"--user-agent={profile.user_agent}")
@@ -23,25 +29,53 @@ def create_cloud_driver(profile):
     # Language + locale spoof
     chrome_opts.add_argument(f"--lang={profile.language}")
 
-    # Timezone spoof via environment variable
-    os.environ["TZ"] = profile.timezone
+    # Shared static-asset cache (optional)
+    cache_proxy = asset_cache_address()
+    if cache_proxy:
+        chrome_opts.add_argument(f"--proxy-server=http://{cache_proxy}")
+        # Trust only the cache's CA for its re-signed HTTPS assets
+        spki = asset_cache_spki()
+        if spki:
+            chrome_opts.add_argument(f"--ignore-certificate-errors-spki-list={spki}")
+
+    # Browser-side trace for this session (observability.tracing)
+    if trace:
+        browser_trace_options(chrome_opts)
+
+    # ---- Launch Chrome on the shared chromedriver ----
+    try:
+        with span("chrome.start"):
+            driver = SharedServiceChrome(service, chrome_opts)
+    except Exception:
+        remove_user_data_dir(user_data_dir)
+        raise
+    driver.user_data_dir = user_data_dir
 
-    # ---- Launch Chrome ----
-    driver = webdriver.Chrome(options=chrome_opts)
+    if trace:
+        driver.execute_cdp_cmd("Performance.enable", {"timeDomain": "timeTicks"})
 
-    # ---- Apply viewport ----
-    driver.set_window_size(1280, 800)
+    with span("cdp.emulation", cat="cdp"):
+        # ---- Apply viewport ----
+        driver.set_window_size(1280, 800)
+
+        # ---- Timezone spoof ----
+        # Per-session CDP override: Chrome inherits the shared chromedriver's
+        # environment, so setting TZ in this process no longer reaches it
+        driver.execute_cdp_cmd(
+            "Emulation.setTimezoneOverride",
+            {"timezoneId": profile.timezone}
+        )
 
-    # ---- Override device metrics ----
-    driver.execute_cdp_cmd(
-        "Emulation.setDeviceMetricsOverride",
-        {
-            "width": profile.viewport[0],
-            "height": profile.viewport[1],
-            "deviceScaleFactor": 1,
-            "mobile": profile.hardware_type == "mobile"
-        }
-    )
+        # ---- Override device metrics ----
+        driver.execute_cdp_cmd(
+            "Emulation.setDeviceMetricsOverride",
+            {
+                "width": profile.viewport[0],
+                "height": profile.viewport[1],
+                "deviceScaleFactor": 1,
+                "mobile": profile.hardware_type == "mobile"
+            }
+        )
 
     # ---- Inject spoofing scripts ----
 
@@ -52,10 +86,19 @@ def create_cloud_driver(profile):
         build_navigator_spoof_script(profile)
     ]
 
-    for script in scripts:
-        driver.execute_cdp_cmd(
-            "Page.addScriptToEvaluateOnNewDocument",
-            {"source": script}
-        )
+    with span("cdp.inject_scripts", cat="cdp", scripts=len(scripts)):
+        for script in scripts:
+            driver.execute_cdp_cmd(
+                "Page.addScriptToEvaluateOnNewDocument",
+                {"source": script}
+            )
 
     return driver
+
+
+def release_cloud_driver(driver):
+    """Quit the session and drop its cloned user-data dir."""
+    try:
+        driver.quit()
+    finally:
+        remove_user_data_dir(getattr(driver, "user_data_dir", None))
@@ -0,0 +1,157 @@
+# driver_service.py
+
+# One long-lived chromedriver shared by every session, plus Chrome user-data
+# dirs cloned from a pre-initialised template onto tmpfs. Together they cut a
+# chromedriver spawn and a cold profile build out of every launch.
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.common.driver_finder import DriverFinder
+from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+
+logger = logging.getLogger(__name__)
+
+# /dev/shm smaller than this (docker defaults to 64 MB) can't hold Chrome's
+# shared memory, so we fall back to --disable-dev-shm-usage and /tmp.
+MIN_DEV_SHM_BYTES = 512 * 1024 * 1024
+
+PROFILE_ROOT = os.environ.get("CHROME_PROFILE_ROOT")
+
+# Chrome leaves these behind while running; never clone them
+_PROFILE_LOCKS = ("SingletonLock", "SingletonSocket", "SingletonCookie", "lockfile")
+
+_service = None
+_browser_path = None
+_template_dir = None
+_lock = threading.Lock()
+
+
+# ---- Shared chromedriver ----
+
+class SharedServiceChrome(webdriver.Chrome):
+    """Chrome session on the shared chromedriver. quit() ends the session but leaves the service up."""
+
+    def __init__(self, service, options):
+        self.service = service
+        self.options = options
+
+        executor = ChromiumRemoteConnection(
+            remote_server_addr=service.service_url,
+            browser_name="chrome",
+            vendor_prefix="goog",
+            keep_alive=True,
+            ignore_proxy=options._ignore_local_proxy,
+        )
+        RemoteWebDriver.__init__(self, command_executor=executor, options=options)
+        self._is_remote = False
+
+    def quit(self):
+        self.service = None     # stopped by shutdown_driver_service() instead
+        super().quit()
+
+
+def get_driver_service():
+    """Start (once) and return the shared chromedriver Service."""
+    global _service, _browser_path
+    with _lock:
+        if _service is None:
+            service = Service()
+            finder = DriverFinder(service, Options())
+            service.path = service.env_path() or finder.get_driver_path()
+            _browser_path = finder.get_browser_path() or None
+            service.start()
+            _service = service
+            logger.info("shared chromedriver listening", extra={"url": service.service_url})
+    return _service
+
+
+def shutdown_driver_service():
+    global _service
+    with _lock:
+        if _service is not None:
+            _service.stop()
+            _service = None
+
+
+# ---- tmpfs-backed user-data dirs ----
+
+def dev_shm_usable():
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:
+        return False
+    return st.f_frsize * st.f_blocks >= MIN_DEV_SHM_BYTES
+
+
+def _profile_root():
+    if PROFILE_ROOT:
+        root = PROFILE_ROOT
+    elif dev_shm_usable():
+        root = "/dev/shm/chrome-profiles"
+    else:
+        root = os.path.join(tempfile.gettempdir(), "chrome-profiles")
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def base_chrome_options():
+    """Flags shared by every cloud Chrome, template included."""
+    opts = Options()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--no-sandbox")
+    if not dev_shm_usable():
+        opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--no-first-run")
+    opts.add_argument("--no-default-browser-check")
+    if _browser_path:
+        opts.binary_location = _browser_path
+    return opts
+
+
+def prepare_profile_template():
+    """Launch Chrome once against an empty dir so it lays down a full profile, then keep it as the template."""
+    global _template_dir
+    service = get_driver_service()
+
+    with _lock:
+        if _template_dir is not None:
+            return _template_dir
+
+        # Per process: with several workers, each builds and owns its own template
+        template = os.path.join(_profile_root(), f"template-{os.getpid()}")
+        shutil.rmtree(template, ignore_errors=True)
+
+        opts = base_chrome_options()
+        opts.add_argument(f"--user-data-dir={template}")
+        driver = SharedServiceChrome(service, opts)
+        try:
+            driver.get("about:blank")
+        finally:
+            driver.quit()
+
+        _template_dir = template
+        logger.info("chrome profile template ready", extra={"path": template})
+        return template
+
+
+def clone_user_data_dir():
+    """Copy the template into a fresh per-session user-data dir and return its path."""
+    template = prepare_profile_template()
+    target = os.path.join(_profile_root(), f"session-{uuid.uuid4().hex}")
+    shutil.copytree(template, target, symlinks=True, ignore=shutil.ignore_patterns(*_PROFILE_LOCKS))
+    return target
+
+
+def remove_user_data_dir(path):
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
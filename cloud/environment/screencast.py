@@ -0,0 +1,224 @@
+# screencast.py
+
+# CAPTURE_MODE=screencast: record the run with CDP Page.startScreencast instead
+# of stopping for four screenshots. A background thread holds its own
+# DevTools connection to the page (selenium's execute_cdp_cmd can't receive
+# events), acks every frame, keeps at most SCREENCAST_FPS of them per second
+# in a ring buffer of SCREENCAST_BUFFER_FRAMES (the newest frame held back by
+# that cap is kept once the interval is up, so the final page state is never
+# lost), and when the browser goes away hands the frames to a single
+# background encoder. The flow never waits on any of it: steps are only
+# marked on the timeline.
+#
+# The artifact is an mp4 when ffmpeg is on PATH, otherwise a zip of the JPEG
+# frames with a manifest.json (frame times and step marks).
+
+import base64
+import collections
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+import requests
+import websocket
+
+from observability import metrics
+
+CAPTURE_MODE = os.environ.get("CAPTURE_MODE", "screenshots")       # "screenshots" or "screencast"
+SCREENCAST_FPS = float(os.environ.get("SCREENCAST_FPS", "5"))
+SCREENCAST_BUFFER_FRAMES = int(os.environ.get("SCREENCAST_BUFFER_FRAMES", "300"))
+SCREENCAST_QUALITY = int(os.environ.get("SCREENCAST_QUALITY", "60"))
+SCREENCAST_MAX_WIDTH = int(os.environ.get("SCREENCAST_MAX_WIDTH", "960"))
+
+FFMPEG = shutil.which("ffmpeg")
+
+FRAMES = metrics.counter("screencast_frames_total", "Screencast frames by fate (kept, rate_limited, overwritten)")
+ENCODE_SECONDS = metrics.histogram("screencast_encode_seconds", "Background encoding time per run, by format")
+
+logger = logging.getLogger(__name__)
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="screencast-encode")
+    return _encoder
+
+
+def _page_socket_url(driver):
+    """DevTools websocket of the session's page, from the debugger address chromedriver reports."""
+    address = driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+    targets = requests.get(f"http://{address}/json/list", timeout=5).json()
+    return next(t["webSocketDebuggerUrl"] for t in targets if t["type"] == "page")
+
+
+class Screencast:
+    """One run's recording. start() and stop() return immediately."""
+
+    def __init__(self, directory, fps=SCREENCAST_FPS, buffer_frames=SCREENCAST_BUFFER_FRAMES):
+        self.id = uuid.uuid4().hex
+        self.directory = directory
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self.frames = collections.deque(maxlen=buffer_frames)     # (timestamp, jpeg bytes)
+        self.marks = []                                           # (timestamp, step label)
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def link(self):
+        return f"/screencast/{self.id}"
+
+    def start(self, driver):
+        self.start_socket(_page_socket_url(driver))
+
+    def start_socket(self, url):
+        """start() given the page's DevTools websocket directly (a cdp_client.CDPPage's socket_url)."""
+        self.started_at = time.time()
+        open(encoding_marker(self.directory, self.id), "w").close()
+        self._thread = threading.Thread(target=self._record, args=(url,), name=f"screencast-{self.id[:8]}",
+                                        daemon=True)
+        self._thread.start()
+
+    def mark(self, label):
+        """Note a flow step on the timeline (what a screenshot used to capture)."""
+        self.marks.append((time.time(), label))
+
+    def stop(self):
+        self._stop.set()
+
+    # ---- Recording thread ----
+
+    def _record(self, url):
+        try:
+            self._receive(url)
+        except Exception:
+            logger.warning("screencast connection failed", exc_info=True)
+        _get_encoder().submit(self._encode)
+
+    def _receive(self, url):
+        ws = websocket.create_connection(url, timeout=5, suppress_origin=True)
+        ids = itertools.count(1)
+        last_kept = 0.0
+        # Newest frame that came too soon after the last kept one. Chrome only sends frames when the
+        # page changes, so it is kept once the interval is up: the final state must make the recording.
+        pending = None
+        try:
+            ws.send(json.dumps({"id": next(ids), "method": "Page.startScreencast", "params": {
+                "format": "jpeg", "quality": SCREENCAST_QUALITY, "maxWidth": SCREENCAST_MAX_WIDTH}}))
+            ws.settimeout(0.2)
+            while not self._stop.is_set():
+                if pending is not None and time.time() - last_kept >= self.min_interval:
+                    self._keep(*pending)
+                    last_kept, pending = time.time(), None
+                try:
+                    message = json.loads(ws.recv())
+                except websocket.WebSocketTimeoutException:
+                    continue
+                if message.get("method") != "Page.screencastFrame":
+                    continue
+                params = message["params"]
+                ws.send(json.dumps({"id": next(ids), "method": "Page.screencastFrameAck",
+                                    "params": {"sessionId": params["sessionId"]}}))
+
+                ts = params["metadata"].get("timestamp") or time.time()
+                if ts - last_kept < self.min_interval:
+                    if pending is not None:
+                        FRAMES.inc(fate="rate_limited")
+                    pending = (ts, params["data"])
+                    continue
+                self._keep(ts, params["data"])
+                last_kept, pending = ts, None
+            ws.send(json.dumps({"id": next(ids), "method": "Page.stopScreencast"}))
+        except (websocket.WebSocketConnectionClosedException, ConnectionError):
+            pass    # the browser closed under us; keep what we have
+        finally:
+            ws.close()
+            if pending is not None:
+                self._keep(*pending)
+
+    def _keep(self, ts, data):
+        if len(self.frames) == self.frames.maxlen:
+            FRAMES.inc(fate="overwritten")
+        self.frames.append((ts, base64.b64decode(data)))
+        FRAMES.inc(fate="kept")
+
+    # ---- Encoding (background executor) ----
+
+    def _encode(self):
+        started = time.perf_counter()
+        frames = list(self.frames)
+        kind = "mp4" if FFMPEG and frames else "zip"
+        try:
+            target = os.path.join(self.directory, f"{self.id}.screencast.{kind}")
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            os.close(fd)
+            try:
+                if kind == "mp4":
+                    self._encode_mp4(frames, tmp)
+                else:
+                    self._encode_zip(frames, tmp)
+                os.replace(tmp, target)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            ENCODE_SECONDS.observe(time.perf_counter() - started, format=kind)
+        except Exception:
+            logger.warning("screencast encoding failed", exc_info=True, extra={"screencast": self.id})
+        finally:
+            os.unlink(encoding_marker(self.directory, self.id))
+            self.frames.clear()
+
+    def _encode_mp4(self, frames, path):
+        # Frames only arrive when the page changes; repeat each one for as long as it was on screen
+        fps = 1.0 / self.min_interval if self.min_interval else 10.0
+        cmd = [FFMPEG, "-loglevel", "error", "-y", "-f", "image2pipe", "-framerate", f"{fps:g}", "-c:v", "mjpeg",
+               "-i", "-", "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", "-c:v", "libx264", "-preset", "veryfast",
+               "-pix_fmt", "yuv420p", "-movflags", "+faststart", "-f", "mp4", path]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            for (ts, data), nxt in zip(frames, frames[1:] + [None]):
+                repeat = max(1, round((nxt[0] - ts) * fps)) if nxt else 1
+                for _ in range(repeat):
+                    proc.stdin.write(data)
+        finally:
+            proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with {proc.returncode}")
+
+    def _encode_zip(self, frames, path):
+        start = self.started_at
+        manifest = {"id": self.id, "fps_cap": 1.0 / self.min_interval if self.min_interval else None,
+                    "frames": [], "marks": [{"t": round(ts - start, 3), "step": label} for ts, label in self.marks]}
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:     # JPEGs don't compress further
+            for i, (ts, data) in enumerate(frames):
+                name = f"frames/{i:05d}.jpg"
+                zf.writestr(name, data)
+                manifest["frames"].append({"file": name, "t": round(ts - start, 3)})
+            zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+
+def encoding_marker(directory, capture_id):
+    return os.path.join(directory, f"{capture_id}.screencast.encoding")
+
+
+def screencast_file(directory, capture_id):
+    """(path, media type) of a finished screencast, or (None, None)."""
+    for kind, media_type in (("mp4", "video/mp4"), ("zip", "application/zip")):
+        path = os.path.join(directory, f"{capture_id}.screencast.{kind}")
+        if os.path.exists(path):
+            return path, media_type
+    return None, None
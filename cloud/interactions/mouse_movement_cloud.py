@@ -1,11 +1,23 @@
 # mouse_movement_cloud.py
 
+import asyncio
 import random
 import time
 import math
 from selenium.webdriver.common.by import By
 
+from interactions.trajectory_library import get_trajectory_library
+from observability.tracing import span
+
 # ---- Chrome DevTools Protocol (CDP) used due to use of headless Chrome ----
+# Every random draw (paths, jitter, click timing) comes from the `rng` passed
+# in, so a run seeded with random.Random(seed) replays exactly.
+# `cancel` (optional) is checked on every step so an abandoned run stops
+# mid-movement instead of finishing the gesture.
+# With TRAJECTORY_LIBRARY set, moves replay a precomputed curve instead of
+# drawing a new one (see trajectory_library.py).
+# Paths are plain (x, y, delay) iterators, so the asyncio functions at the
+# bottom (DRIVER_BACKEND=cdp) replay exactly the same gestures.
 
 def cdp_move(driver, x, y):
     driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
@@ -15,23 +27,24 @@ def cdp_move(driver, x, y):
     })
 
 
-def cdp_click(driver, x, y):
-    driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
-        "type": "mousePressed",
-        "x": int(x),
-        "y": int(y),
-        "button": "left",
-        "clickCount": 1
-    })
-    time.sleep(random.uniform(0.03, 0.10))
+def cdp_click(driver, x, y, rng=random):
+    with span("mouse.click", cat="cdp"):
+        driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
+            "type": "mousePressed",
+            "x": int(x),
+            "y": int(y),
+            "button": "left",
+            "clickCount": 1
+        })
+        time.sleep(rng.uniform(0.03, 0.10))
 
-    driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
-        "type": "mouseReleased",
-        "x": int(x),
-        "y": int(y),
-        "button": "left",
-        "clickCount": 1
-    })
+        driver.execute_cdp_cmd("Input.dispatchMouseEvent", {
+            "type": "mouseReleased",
+            "x": int(x),
+            "y": int(y),
+            "button": "left",
+            "clickCount": 1
+        })
 
 
 def bezier(p0, p1, p2, p3, t):
@@ -44,8 +57,11 @@ def bezier(p0, p1, p2, p3, t):
     )
 
 
-def human_curve_motion(driver, sx, sy, tx, ty):
+def curve_path(sx, sy, tx, ty, rng=random):
+    """(steps, iterator of (x, y, delay)) for a fresh eased Bezier move; the last item settles on the target.
 
+    Draws from `rng` lazily, in the same order as stepping through the move.
+    """
 
     # Distance to target affects speed
     dist = math.dist((sx, sy), (tx, ty))
@@ -54,46 +70,78 @@ def human_curve_motion(driver, sx, sy, tx, ty):
     steps = int(max(25, min(120, dist / 4)))
 
     # Control points create a subtle curve
-    cp1 = (sx + (tx - sx) * 0.3 + random.uniform(-60, 60),
-           sy + (ty - sy) * 0.3 + random.uniform(-60, 60))
+    cp1 = (sx + (tx - sx) * 0.3 + rng.uniform(-60, 60),
+           sy + (ty - sy) * 0.3 + rng.uniform(-60, 60))
 
-    cp2 = (sx + (tx - sx) * 0.6 + random.uniform(-60, 60),
-           sy + (ty - sy) * 0.6 + random.uniform(-60, 60))
+    cp2 = (sx + (tx - sx) * 0.6 + rng.uniform(-60, 60),
+           sy + (ty - sy) * 0.6 + rng.uniform(-60, 60))
 
     # Optional overshoot
-    overshoot_strength = random.uniform(5, 18)
-    tx_overshoot = tx + random.uniform(-overshoot_strength, overshoot_strength)
-    ty_overshoot = ty + random.uniform(-overshoot_strength, overshoot_strength)
+    overshoot_strength = rng.uniform(5, 18)
+    tx_overshoot = tx + rng.uniform(-overshoot_strength, overshoot_strength)
+    ty_overshoot = ty + rng.uniform(-overshoot_strength, overshoot_strength)
 
-    # Execute full movement
-    for i in range(1, steps + 1):
-        t = i / steps
+    # Delay also scales with distance
+    base_delay = max(0.002, min(0.012, dist / 6000))
+
+    def points():
+        for i in range(1, steps + 1):
+            t = i / steps
+
+            # Smooth acceleration → fast middle → slow end
+            ease = math.sin((t * math.pi) / 2)
+
+            x = bezier(sx, cp1[0], cp2[0], tx_overshoot, ease)
+            y = bezier(sy, cp1[1], cp2[1], ty_overshoot, ease)
 
-        # Smooth acceleration → fast middle → slow end
-        ease = math.sin((t * math.pi) / 2)
+            jitter_delay = rng.uniform(0, 0.003)
+            yield x, y, base_delay + jitter_delay
 
-        x = bezier(sx, cp1[0], cp2[0], tx_overshoot, ease)
-        y = bezier(sy, cp1[1], cp2[1], ty_overshoot, ease)
+        # Minor settle at exact target
+        yield tx, ty, rng.uniform(0.02, 0.05)
 
-        cdp_move(driver, x, y)
+    return steps, points()
 
-        # Delay also scales with distance
-        base_delay = max(0.002, min(0.012, dist / 6000))
-        jitter_delay = random.uniform(0, 0.003)
-        time.sleep(base_delay + jitter_delay)
 
-    # Minor settle at exact target
-    cdp_move(driver, tx, ty)
-    time.sleep(random.uniform(0.02, 0.05))
+def library_path(library, sx, sy, tx, ty, rng=random):
+    """Same as curve_path(), along a curve picked from a TrajectoryLibrary."""
+    points, delays, settle = library.pick(sx, sy, tx, ty, rng)
 
+    def steps():
+        for (x, y), delay in zip(points.tolist(), delays.tolist()):
+            yield x, y, delay
+        yield tx, ty, settle
 
-def find_box(driver):
+    return len(points), steps()
+
+
+def motion_path(sx, sy, tx, ty, rng=random, library=None):
+    """(steps, path, source): from `library`, else the TRAJECTORY_LIBRARY one, else a fresh curve."""
+    library = library or get_trajectory_library()
+    if library is not None:
+        return (*library_path(library, sx, sy, tx, ty, rng), "library")
+    return (*curve_path(sx, sy, tx, ty, rng), "live")
+
+
+def human_curve_motion(driver, sx, sy, tx, ty, rng=random, cancel=None, library=None):
+    steps, path, source = motion_path(sx, sy, tx, ty, rng, library)
+
+    # Execute full movement
+    with span("mouse.move", cat="cdp", steps=steps, source=source):
+        for x, y, delay in path:
+            if cancel:
+                cancel.check()
+            cdp_move(driver, x, y)
+            time.sleep(delay)
+
+
+def find_box(driver, rng=random, cancel=None):
     metrics = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})
     width = metrics["layoutViewport"]["clientWidth"]
     height = metrics["layoutViewport"]["clientHeight"]
 
-    sx = random.randint(0, width - 1)
-    sy = random.randint(0, height - 1)
+    sx = rng.randint(0, width - 1)
+    sy = rng.randint(0, height - 1)
 
     box = driver.find_element(By.CSS_SELECTOR, ".captcha-input")
     rect = box.rect
@@ -101,12 +149,12 @@ def find_box(driver):
     tx = rect['x'] + rect['width'] / 2
     ty = rect['y'] + rect['height'] / 2
 
-    human_curve_motion(driver, sx, sy, tx, ty)
-    cdp_click(driver, tx, ty)
+    human_curve_motion(driver, sx, sy, tx, ty, rng, cancel)
+    cdp_click(driver, tx, ty, rng)
     return box, tx, ty
 
 
-def validate(driver, bx, by):
+def validate(driver, bx, by, rng=random, cancel=None):
     # Find the validate button
     btn = driver.find_element(By.CSS_SELECTOR, ".btn-primary")
 
@@ -119,8 +167,93 @@ def validate(driver, bx, by):
     sx = metrics["layoutViewport"]["clientWidth"] / 2
     sy = metrics["layoutViewport"]["clientHeight"] / 2
 
-    human_curve_motion(driver, sx, sy, tx, ty)
-    cdp_click(driver, tx, ty)
+    human_curve_motion(driver, sx, sy, tx, ty, rng, cancel)
+    cdp_click(driver, tx, ty, rng)
+
+    # Give the page time to show the result
+    with span("sleep", seconds=0.3):
+        if cancel:
+            cancel.sleep(0.3)
+        else:
+            time.sleep(0.3)
+
+
+# ---- asyncio, on a cdp_client.CDPPage (DRIVER_BACKEND=cdp) ----
+
+async def cdp_move_async(page, x, y):
+    await page.send("Input.dispatchMouseEvent", {
+        "type": "mouseMoved",
+        "x": int(x),
+        "y": int(y),
+    })
+
+
+async def cdp_click_async(page, x, y, rng=random):
+    with span("mouse.click", cat="cdp"):
+        await page.send("Input.dispatchMouseEvent", {
+            "type": "mousePressed",
+            "x": int(x),
+            "y": int(y),
+            "button": "left",
+            "clickCount": 1
+        })
+        await asyncio.sleep(rng.uniform(0.03, 0.10))
+
+        await page.send("Input.dispatchMouseEvent", {
+            "type": "mouseReleased",
+            "x": int(x),
+            "y": int(y),
+            "button": "left",
+            "clickCount": 1
+        })
+
+
+async def human_curve_motion_async(page, sx, sy, tx, ty, rng=random, cancel=None, library=None):
+    steps, path, source = motion_path(sx, sy, tx, ty, rng, library)
+
+    with span("mouse.move", cat="cdp", steps=steps, source=source):
+        for x, y, delay in path:
+            if cancel:
+                cancel.check()
+            await cdp_move_async(page, x, y)
+            await asyncio.sleep(delay)
+
+
+async def _element_center(page, selector):
+    rect = await page.element_rect(selector)
+    if rect is None:
+        raise LookupError(f"no element matches {selector!r}")
+    return rect['x'] + rect['width'] / 2, rect['y'] + rect['height'] / 2
+
+
+async def find_box_async(page, rng=random, cancel=None):
+    metrics = await page.send("Page.getLayoutMetrics")
+    width = metrics["layoutViewport"]["clientWidth"]
+    height = metrics["layoutViewport"]["clientHeight"]
+
+    sx = rng.randint(0, width - 1)
+    sy = rng.randint(0, height - 1)
+
+    tx, ty = await _element_center(page, ".captcha-input")
+
+    await human_curve_motion_async(page, sx, sy, tx, ty, rng, cancel)
+    await cdp_click_async(page, tx, ty, rng)
+    return tx, ty
+
+
+async def validate_async(page, bx, by, rng=random, cancel=None):
+    tx, ty = await _element_center(page, ".btn-primary")
+
+    metrics = await page.send("Page.getLayoutMetrics")
+    sx = metrics["layoutViewport"]["clientWidth"] / 2
+    sy = metrics["layoutViewport"]["clientHeight"] / 2
+
+    await human_curve_motion_async(page, sx, sy, tx, ty, rng, cancel)
+    await cdp_click_async(page, tx, ty, rng)
 
     # Give the page time to show the result
-    time.sleep(0.3)
+    with span("sleep", seconds=0.3):
+        if cancel:
+            await cancel.sleep_async(0.3)
+        else:
+            await asyncio.sleep(0.3)
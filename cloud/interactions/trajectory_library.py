@@ -0,0 +1,166 @@
+# trajectory_library.py
+
+# Precomputed mouse paths for human_curve_motion(). Instead of drawing a new
+# Bezier curve for every move, a run picks one of many curves built ahead of
+# time and maps it onto its actual start and target with one 2x2 affine
+# transform.
+#
+# The library is a single .npy file of fixed-size records, loaded with
+# mmap_mode="r": workers share the OS page cache and only touch the records
+# they use. Curves are stored normalized, with the start at (0, 0) and the
+# target at (1, 0), and grouped into distance buckets spaced geometrically
+# from MIN_DISTANCE to MAX_DISTANCE. Each record is generated at its bucket's
+# distance with the same draws as the live path (control point jitter,
+# overshoot, step count, per-step delays, final settle), so the step count
+# and timing match a fresh curve of that length.
+#
+# TRAJECTORY_LIBRARY   path of the .npy file; unset: generate every path live
+#
+# Build (from cloud/):
+#     python -m interactions.trajectory_library trajectories.npy --buckets 32 --per-bucket 256
+#
+# A seeded run replays exactly only against the same library file.
+
+import argparse
+import math
+import os
+import threading
+
+import numpy as np
+
+TRAJECTORY_LIBRARY = os.environ.get("TRAJECTORY_LIBRARY", "").strip()
+
+MIN_DISTANCE = 8.0
+MAX_DISTANCE = 2400.0
+MIN_STEPS = 25
+MAX_STEPS = 120
+
+RECORD = np.dtype([
+    ("distance", "<f4"),                    # bucket distance the curve was generated at (px)
+    ("steps", "<u2"),
+    ("points", "<f4", (MAX_STEPS, 2)),      # normalized; rows past `steps` are zero
+    ("delays", "<f4", (MAX_STEPS,)),        # sleep after each step (s)
+    ("settle", "<f4"),                      # pause after the final move onto the target (s)
+])
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def step_count(dist):
+    """Steps for a move of `dist` px: longer moves get more (same rule as the live path)."""
+    return int(max(MIN_STEPS, min(MAX_STEPS, dist / 4)))
+
+
+def base_delay(dist):
+    return max(0.002, min(0.012, dist / 6000))
+
+
+class TrajectoryLibrary:
+    """Read-only view of a library file; pick() is safe to call from any thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = np.load(path, mmap_mode="r")
+        if self.records.dtype != RECORD:
+            raise ValueError(f"{path}: not a trajectory library (dtype {self.records.dtype})")
+
+        # Buckets are contiguous and equally sized; their distances are a geometric series.
+        # Binary search on the sorted distance column only reads a few pages of the file.
+        distance = self.records["distance"]
+        first, last = float(distance[0]), float(distance[-1])
+        self.per_bucket = int(np.searchsorted(distance, first, side="right"))
+        self.buckets = len(self.records) // self.per_bucket
+        self.min_distance = first
+        self._log_ratio = math.log(last / first) / (self.buckets - 1) if self.buckets > 1 else 1.0
+
+    def __len__(self):
+        return len(self.records)
+
+    def bucket(self, dist):
+        """Index of the bucket closest to `dist` in log space (constant time)."""
+        if dist <= self.min_distance:
+            return 0
+        return min(self.buckets - 1, round(math.log(dist / self.min_distance) / self._log_ratio))
+
+    def pick(self, sx, sy, tx, ty, rng):
+        """(points, delays, settle) for a move from (sx, sy) to (tx, ty).
+
+        `points` is a new (steps, 2) float array in page coordinates, the only
+        per-move array besides the 2x2 transform; `delays` is a read-only view
+        into the file.
+        """
+        dx, dy = tx - sx, ty - sy
+        index = self.bucket(math.hypot(dx, dy)) * self.per_bucket + rng.randrange(self.per_bucket)
+        records = self.records
+        steps = int(records["steps"][index])
+
+        # (u, v) -> start + u * (dx, dy) + v * (-dy, dx): rotate and scale the unit move onto the real one
+        transform = np.array(((dx, dy), (-dy, dx)))
+        points = np.empty((steps, 2))
+        np.matmul(records["points"][index, :steps], transform, out=points)
+        points += (sx, sy)
+        return points, records["delays"][index, :steps], float(records["settle"][index])
+
+
+def get_trajectory_library():
+    """The library named by TRAJECTORY_LIBRARY (loaded once), or None when unset."""
+    global _library
+    if not TRAJECTORY_LIBRARY:
+        return None
+    with _library_lock:
+        if _library is None:
+            _library = TrajectoryLibrary(TRAJECTORY_LIBRARY)
+    return _library
+
+
+# ---- Building ----
+
+def build_library(buckets=32, per_bucket=256, seed=0, min_distance=MIN_DISTANCE, max_distance=MAX_DISTANCE):
+    """Array of buckets * per_bucket records (see RECORD), generated in one vectorized pass per bucket."""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(buckets * per_bucket, dtype=RECORD)
+    distances = np.geomspace(min_distance, max_distance, buckets)
+
+    for b, dist in enumerate(distances):
+        dist = float(np.float32(dist))      # the value stored, so loading recovers the same series
+        steps = step_count(dist)
+        n = per_bucket
+        rows = records[b * n:(b + 1) * n]
+
+        # Move from (0, 0) to (dist, 0); control points and overshoot jitter as in human_curve_motion()
+        cp1 = np.column_stack((dist * 0.3 + rng.uniform(-60, 60, n), rng.uniform(-60, 60, n)))
+        cp2 = np.column_stack((dist * 0.6 + rng.uniform(-60, 60, n), rng.uniform(-60, 60, n)))
+        overshoot = rng.uniform(5, 18, n)[:, None]
+        end = np.column_stack((np.full(n, dist), np.zeros(n))) + rng.uniform(-1, 1, (n, 2)) * overshoot
+
+        t = np.arange(1, steps + 1) / steps
+        ease = np.sin(t * np.pi / 2)[None, :, None]
+        u = 1 - ease
+        curve = 3 * u * u * ease * cp1[:, None] + 3 * u * ease * ease * cp2[:, None] + ease ** 3 * end[:, None]
+
+        rows["distance"] = dist
+        rows["steps"] = steps
+        rows["points"][:, :steps] = curve / dist
+        rows["delays"][:, :steps] = base_delay(dist) + rng.uniform(0, 0.003, (n, steps))
+        rows["settle"] = rng.uniform(0.02, 0.05, n)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a precomputed mouse trajectory library")
+    parser.add_argument("output", help="Library file to write (.npy)")
+    parser.add_argument("--buckets", type=int, default=32, help="Distance buckets")
+    parser.add_argument("--per-bucket", type=int, default=256, help="Curves per bucket")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records = build_library(args.buckets, args.per_bucket, args.seed)
+    np.save(args.output, records)
+    size = os.path.getsize(args.output)
+    print(f"{len(records)} trajectories ({args.buckets} buckets x {args.per_bucket}) "
+          f"written to {args.output} ({size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
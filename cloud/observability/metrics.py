@@ -0,0 +1,164 @@
+# metrics.py
+
+# Minimal in-process metrics: labelled counters, gauges and histograms,
+# rendered in the Prometheus text format for GET /metrics. Safe to update
+# from the event loop and from worker threads.
+
+import threading
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}       # sorted label items -> value
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    @staticmethod
+    def _fmt_labels(key, extra=()):
+        items = list(key) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._fmt_labels(k), v) for k, v in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return {self._fmt_labels(k) or "": v for k, v in self._values.items()}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, entry["counts"]):
+                    cumulative += n
+                    out.append((f"{self.name}_bucket{self._fmt_labels(key, [('le', bound)])}", cumulative))
+                out.append((f"{self.name}_bucket{self._fmt_labels(key, [('le', '+Inf')])}", entry["count"]))
+                out.append((f"{self.name}_sum{self._fmt_labels(key)}", round(entry["sum"], 6)))
+                out.append((f"{self.name}_count{self._fmt_labels(key)}", entry["count"]))
+        return out
+
+    def snapshot(self):
+        with self._lock:
+            return {self._fmt_labels(k) or "": {"counts": list(e["counts"]), "sum": e["sum"], "count": e["count"]}
+                    for k, e in self._values.items()}
+
+
+# ---- Registry ----
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, help, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, **kwargs)
+    return metric
+
+
+def counter(name, help):
+    return _register(Counter, name, help)
+
+
+def gauge(name, help):
+    return _register(Gauge, name, help)
+
+
+def histogram(name, help, buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, buckets=buckets)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for m in metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(f"{name} {value}" for name, value in m.samples())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """All metrics as plain dicts (for JSON views)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: {"type": m.kind, "values": m.snapshot()} for m in metrics}
+
+
+def merge_snapshots(snapshots):
+    """Sum snapshot() dicts from several processes into one (counters, gauges and histograms alike)."""
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            out = merged.setdefault(name, {"type": metric["type"], "values": {}})
+            for labels, value in metric["values"].items():
+                if metric["type"] == "histogram":
+                    cur = out["values"].setdefault(labels, {"counts": [0] * len(value["counts"]), "sum": 0.0, "count": 0})
+                    cur["counts"] = [a + b for a, b in zip(cur["counts"], value["counts"])]
+                    cur["sum"] += value["sum"]
+                    cur["count"] += value["count"]
+                else:
+                    out["values"][labels] = out["values"].get(labels, 0) + value
+    return merged
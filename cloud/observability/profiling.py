@@ -0,0 +1,61 @@
+# profiling.py
+
+# Opt-in profiling of a single run. With RUN_PROFILING=1 a client can ask for
+# one /run_flow to be profiled (X-Profile: 1 header or ?profile=1). The
+# blocking browser half of the flow, where the Python time goes, runs under
+# cProfile and the stats are written next to the run's screenshots as
+# <run_id>.prof. A run that doesn't ask pays one flag check.
+#
+# Read a profile with GET /runs/{run_id}/profile?format=text, or download it
+# and open it with `python -m pstats <file>` / snakeviz.
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+
+RUN_PROFILING = os.environ.get("RUN_PROFILING", "0") == "1"
+PROFILE_TOP_N = 40
+
+logger = logging.getLogger(__name__)
+
+# The interpreter allows one active cProfile at a time (3.12+ enforces it),
+# so concurrent profiled runs take turns; a run that finds it busy goes unprofiled.
+_profiler_lock = threading.Lock()
+
+
+def profiling_requested(request) -> bool:
+    """True if the request carries X-Profile: 1 or ?profile=1."""
+    flag = request.headers.get("X-Profile") or request.query_params.get("profile") or ""
+    return flag.lower() in ("1", "true", "yes")
+
+
+def profile_path(directory, run_id):
+    return os.path.join(directory, f"{run_id}.prof")
+
+
+def run_profiled(path, fn, *args):
+    """Call fn(*args) with the calling thread under cProfile and dump the stats to `path`,
+    even if it raises. Runs it unprofiled if another run holds the profiler."""
+    if not _profiler_lock.acquire(blocking=False):
+        logger.info("profiler busy; run not profiled")
+        return fn(*args)
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+        try:
+            return fn(*args)
+        finally:
+            prof.disable()
+            prof.dump_stats(path)
+    finally:
+        _profiler_lock.release()
+
+
+def render_stats(path, sort="cumulative", limit=PROFILE_TOP_N):
+    """The top `limit` functions of a saved profile as pstats text."""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
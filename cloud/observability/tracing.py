@@ -0,0 +1,185 @@
+# tracing.py
+
+# Opt-in per-run trace in the Chrome trace-event format, so Python phases and
+# the browser's own work (navigation, layout, script evaluation of the
+# injected spoofing bundles) line up on one timeline in chrome://tracing or
+# https://ui.perfetto.dev.
+#
+# With RUN_TRACING=1 a client can ask for one /run_flow to be traced
+# (X-Trace: 1 header or ?trace=1). Python side: every PhaseTimer phase plus
+# span() blocks (driver setup, CDP calls, sleeps). Browser side: chromedriver
+# records a Chrome trace for the session (goog:perfLoggingPrefs) that is
+# pulled from the performance log before the browser closes, along with
+# Performance.getMetrics totals. Both sides are put on one clock using the
+# browser's Timestamp metric. The result is written next to the run's
+# screenshots as <run_id>.trace.json.
+#
+# With no trace active, span() costs one context variable lookup.
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+from observability.trace_context import current_trace
+
+RUN_TRACING = os.environ.get("RUN_TRACING", "0") == "1"
+
+# Chrome trace categories recorded for a traced run
+TRACE_CATEGORIES = os.environ.get(
+    "TRACE_CATEGORIES",
+    "devtools.timeline,v8.execute,blink.user_timing,loading,navigation,disabled-by-default-devtools.timeline",
+)
+
+# Performance.getMetrics totals copied into the trace as counters
+BROWSER_METRICS = ("TaskDuration", "ScriptDuration", "LayoutDuration", "RecalcStyleDuration",
+                   "JSHeapUsedSize", "Nodes", "LayoutCount")
+
+_current = contextvars.ContextVar("tracer", default=None)
+
+
+class Tracer:
+    """Collects one run's trace events. Times are monotonic microseconds (the
+    same clock Chrome uses for trace timestamps on Linux)."""
+
+    def __init__(self, name="run"):
+        self.name = name
+        self.pid = os.getpid()      # our process row in the viewer, next to Chrome's own
+        ctx = current_trace()
+        self.trace_id = ctx.trace_id if ctx else None     # the caller's trace (traceparent), if any
+        self.events = []
+        self.clock_offset_us = None     # browser ts + offset = our monotonic us
+        self._browser_events = []
+        self._lock = threading.Lock()
+        self._perf_to_mono = time.monotonic() - time.perf_counter()
+        self._threads = {}
+
+    @staticmethod
+    def now_us():
+        return time.monotonic() * 1e6
+
+    def _tid(self):
+        ident = threading.get_ident()
+        if ident not in self._threads:
+            self._threads[ident] = threading.current_thread().name
+        return ident
+
+    def complete(self, name, start_us, end_us, cat="python", **args):
+        """A finished span from start_us to end_us (monotonic microseconds)."""
+        event = {"name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": max(0.0, end_us - start_us),
+                 "pid": self.pid, "tid": self._tid()}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def complete_perf(self, name, start, end, cat="phase"):
+        """Same as complete() for a pair of time.perf_counter() readings (PhaseTimer's clock)."""
+        self.complete(name, (start + self._perf_to_mono) * 1e6, (end + self._perf_to_mono) * 1e6, cat)
+
+    # ---- Browser side ----
+
+    def collect_browser(self, driver):
+        """Pull the session's Chrome trace and performance totals; call before the browser closes."""
+        before = time.monotonic()
+        metrics = driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]
+        after = time.monotonic()
+        self.add_browser_metrics(metrics, before, after)
+
+        for entry in driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            if message.get("method") == "Tracing.dataCollected":
+                self._browser_events.append(message["params"])
+
+    def add_browser_events(self, events):
+        """Chrome trace events recorded by the caller (DRIVER_BACKEND=cdp traces the page itself)."""
+        self._browser_events.extend(events)
+
+    def add_browser_metrics(self, metrics, before, after):
+        """Performance.getMetrics result, fetched between monotonic times `before` and `after`."""
+        values = {m["name"]: m["value"] for m in metrics}
+        if "Timestamp" in values:
+            self.clock_offset_us = ((before + after) / 2 - values["Timestamp"]) * 1e6
+
+        counters = {k: values[k] for k in BROWSER_METRICS if k in values}
+        if counters:
+            with self._lock:
+                self.events.append({"name": "Performance.getMetrics", "cat": "browser", "ph": "C",
+                                    "ts": (before + after) / 2 * 1e6, "pid": self.pid, "tid": 0,
+                                    "args": counters})
+
+    # ---- Output ----
+
+    def to_dict(self):
+        offset = self.clock_offset_us or 0.0
+        browser = []
+        for event in self._browser_events:
+            if "ts" in event:
+                event = {**event, "ts": event["ts"] + offset}
+            browser.append(event)
+
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": f"python ({self.name})"}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in self._threads.items()]
+        return {
+            "traceEvents": meta + self.events + browser,
+            "displayTimeUnit": "ms",
+            "otherData": {"run": self.name, "trace_id": self.trace_id, "clock_offset_us": self.clock_offset_us,
+                          "browser_events": len(browser)},
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+
+# ---- Active tracer ----
+
+def current_tracer():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def tracing(tracer):
+    """Make `tracer` the active one for the block (follows asyncio.to_thread like any context variable)."""
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def span(name, cat="python", **args):
+    """Record the block as a span on the active trace; does nothing when the run isn't traced."""
+    tracer = _current.get()
+    if tracer is None:
+        yield
+        return
+    start = tracer.now_us()
+    try:
+        yield
+    finally:
+        tracer.complete(name, start, tracer.now_us(), cat, **args)
+
+
+def tracing_requested(request) -> bool:
+    """True if the request carries X-Trace: 1 or ?trace=1."""
+    flag = request.headers.get("X-Trace") or request.query_params.get("trace") or ""
+    return flag.lower() in ("1", "true", "yes")
+
+
+def trace_path(directory, run_id):
+    return os.path.join(directory, f"{run_id}.trace.json")
+
+
+def browser_trace_options(options):
+    """Have chromedriver record a Chrome trace for the session (read back via the performance log)."""
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    options.add_experimental_option("perfLoggingPrefs", {
+        "enableNetwork": False,
+        "enablePage": False,
+        "traceCategories": TRACE_CATEGORIES,
+    })
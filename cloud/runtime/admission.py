@@ -0,0 +1,212 @@
+# admission.py
+
+# Admission control in front of the browser pool. At most BROWSER_POOL_SIZE
+# flows hold a browser at once and up to ADMISSION_QUEUE_SIZE more wait in
+# line, interactive requests ahead of bulk ones. Anything beyond that is
+# rejected immediately with a Retry-After estimate instead of piling up until
+# Chrome launches exhaust the VM's memory.
+#
+# With RUN_PIPELINE=1 a run's browser stages are overlapped across runs
+# (runtime/pipeline.py): up to PIPELINE_PREPARE_SLOTS more flows are admitted
+# to set up and load their page while BROWSER_POOL_SIZE others interact.
+#
+# Everything here runs on the event loop, so no locks are needed.
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import os
+import time
+
+from observability.metrics import counter, gauge, histogram
+from runtime.cancel import FlowCancelled
+
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "2"))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "8"))
+RUN_PIPELINE = os.environ.get("RUN_PIPELINE", "0") == "1"
+PIPELINE_PREPARE_SLOTS = int(os.environ.get("PIPELINE_PREPARE_SLOTS", "1"))
+
+# Lane -> priority (lower is served first)
+LANES = {"interactive": 0, "bulk": 1}
+
+DEFAULT_SERVICE_SECONDS = 30.0      # Retry-After estimate before any run has finished
+MAX_RETRY_AFTER = 300
+
+SLOTS_IN_USE = gauge("browser_slots_in_use", "Browser slots currently held by a flow")
+SLOTS_TOTAL = gauge("browser_slots_total", "Browser pool capacity")
+QUEUE_DEPTH = gauge("admission_queue_depth", "Flows waiting for a browser slot")
+QUEUE_WAIT = histogram("admission_queue_wait_seconds", "Time spent waiting for a browser slot")
+REJECTED = counter("admission_rejected_total", "Flows rejected because the wait queue was full")
+ADMITTED = counter("admission_admitted_total", "Flows that got a browser slot")
+ABANDONED = counter("admission_abandoned_total", "Flows cancelled or past their deadline while queued")
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"browser pool busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class LaneSemaphore:
+    """Counting semaphore whose waiters are served by lane (LANES), then in arrival order.
+
+    A waiter whose CancelToken fires (cancelled, or past its deadline) leaves
+    the queue with FlowCancelled. Also used for the stages of runtime/pipeline.py.
+    """
+
+    def __init__(self, slots):
+        self.slots = max(1, slots)
+        self.in_use = 0
+        self._waiters = []              # heap of [priority, seq, future, lane]
+        self._seq = itertools.count()
+
+    async def acquire(self, lane="interactive", cancel=None):
+        if not self._try_acquire():
+            await self._wait(lane, cancel)
+
+    def _try_acquire(self):
+        """Take a free slot unless someone is already queued for it."""
+        if self.in_use < self.slots and not self._waiters:
+            self.in_use += 1
+            return True
+        return False
+
+    async def _wait(self, lane, cancel):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        entry = [LANES[lane], next(self._seq), fut, lane]
+        heapq.heappush(self._waiters, entry)
+
+        remove_callback = lambda: None
+        timeout = None
+        if cancel is not None:
+            remove_callback = cancel.on_cancel(lambda: loop.call_soon_threadsafe(fut.cancel))
+            timeout = cancel.remaining()
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if fut.done() and not fut.cancelled():
+                # Handed a slot just as we were cancelled: pass it on
+                self.release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if cancel is not None and cancel.cancelled:
+                raise FlowCancelled(cancel.reason) from None
+            raise
+        finally:
+            remove_callback()
+
+    def release(self):
+        """Hand the slot to the next live waiter, or return it."""
+        while self._waiters:
+            _, _, fut, _ = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_use -= 1
+
+    def queued(self):
+        """{lane: waiters still queued}."""
+        queued = {lane: 0 for lane in LANES}
+        for _, _, fut, lane in self._waiters:
+            if not fut.done():
+                queued[lane] += 1
+        return queued
+
+
+class AdmissionController(LaneSemaphore):
+
+    def __init__(self, slots=BROWSER_POOL_SIZE, max_queue=ADMISSION_QUEUE_SIZE):
+        super().__init__(slots)
+        self.max_queue = max(0, max_queue)
+        self._bounded_waiting = 0       # waiters that count against max_queue
+        self._service_s = None          # EWMA of slot hold time, for Retry-After
+        SLOTS_TOTAL.set(self.slots)
+
+    # ---- Acquire / release ----
+
+    async def acquire(self, lane="interactive", bounded=True, cancel=None):
+        """Wait for a browser slot. Bounded callers are rejected when the queue is full;
+        unbounded ones (job items, already admitted as a batch) always wait.
+        A cancelled or expired `cancel` token leaves the queue with FlowCancelled."""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane!r}; expected one of {list(LANES)}")
+
+        start = time.perf_counter()
+        if not self._try_acquire():
+            if bounded and self._bounded_waiting >= self.max_queue:
+                REJECTED.inc(lane=lane)
+                raise AdmissionRejected(self.retry_after())
+            self._bounded_waiting += bounded
+            QUEUE_DEPTH.inc(lane=lane)
+            try:
+                await self._wait(lane, cancel)
+            except FlowCancelled as e:
+                ABANDONED.inc(lane=lane, reason=e.reason)
+                raise
+            finally:
+                self._bounded_waiting -= bounded
+                QUEUE_DEPTH.dec(lane=lane)
+
+        waited = time.perf_counter() - start
+        QUEUE_WAIT.observe(waited, lane=lane)
+        ADMITTED.inc(lane=lane)
+        SLOTS_IN_USE.set(self.in_use)
+        return waited
+
+    def release(self):
+        super().release()
+        SLOTS_IN_USE.set(self.in_use)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane="interactive", bounded=True, cancel=None):
+        """`async with admission.slot(lane) as waited:` holds one browser slot for the block."""
+        waited = await self.acquire(lane, bounded, cancel)
+        start = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self._observe_service(time.perf_counter() - start)
+            self.release()
+
+    # ---- Introspection ----
+
+    def _observe_service(self, seconds):
+        if self._service_s is None:
+            self._service_s = seconds
+        else:
+            self._service_s = 0.8 * self._service_s + 0.2 * seconds
+
+    def retry_after(self):
+        """Rough seconds until a new request would get a slot: queue ahead / slots * mean run time."""
+        service = self._service_s or DEFAULT_SERVICE_SECONDS
+        ahead = len(self._waiters) + 1
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(ahead * service / self.slots)))
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "in_use": self.in_use,
+            "max_queue": self.max_queue,
+            "queued": self.queued(),
+            "mean_run_s": round(self._service_s, 2) if self._service_s else None,
+        }
+
+
+# ---- Process-wide singleton ----
+
+_controller = None
+
+
+def get_admission_controller():
+    global _controller
+    if _controller is None:
+        # Pipelined, a flow also holds a browser while its page is prepared ahead of an interaction slot
+        slots = BROWSER_POOL_SIZE + (max(1, PIPELINE_PREPARE_SLOTS) if RUN_PIPELINE else 0)
+        _controller = AdmissionController(slots)
+    return _controller
@@ -0,0 +1,101 @@
+# cancel.py
+
+# Cooperative cancellation for a flow. A CancelToken carries the request's
+# deadline and is cancelled when the client goes away; the flow checks it
+# between phases and inside the mouse/wait loops (which run in a worker
+# thread, or on the event loop with DRIVER_BACKEND=cdp), so an abandoned run
+# stops promptly and frees its browser slot.
+
+import asyncio
+import os
+import threading
+import time
+
+RUN_DEADLINE_SECONDS = float(os.environ.get("RUN_DEADLINE_SECONDS", "85"))    # under the Pi's 90 s timeout
+MAX_DEADLINE_SECONDS = float(os.environ.get("MAX_DEADLINE_SECONDS", "600"))
+
+DEADLINE_EXCEEDED = "deadline exceeded"
+CLIENT_DISCONNECTED = "client disconnected"
+
+
+class FlowCancelled(Exception):
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            cb()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE_EXCEEDED)
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise FlowCancelled(self.reason)
+
+    def sleep(self, seconds):
+        """time.sleep() that wakes up and raises as soon as the token is cancelled."""
+        remaining = self.remaining()
+        wait = seconds if remaining is None else min(seconds, remaining)
+        self._event.wait(wait)
+        self.check()
+
+    async def sleep_async(self, seconds):
+        """sleep() for coroutines: asyncio.sleep() that ends early and raises once cancelled."""
+        remaining = self.remaining()
+        wait = seconds if remaining is None else min(seconds, remaining)
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        remove = self.on_cancel(lambda: loop.call_soon_threadsafe(woken.set))
+        try:
+            await asyncio.wait_for(woken.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            remove()
+        self.check()
+
+    def on_cancel(self, callback):
+        """Call `callback()` (from whichever thread cancels) once cancelled; returns a remover."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._callbacks.remove(callback) if callback in self._callbacks else None
+        callback()
+        return lambda: None
+
+
+def request_timeout(header_value):
+    """Deadline budget from an X-Request-Deadline header (seconds), else the default."""
+    try:
+        seconds = float(header_value)
+    except (TypeError, ValueError):
+        return RUN_DEADLINE_SECONDS
+    return max(1.0, min(seconds, MAX_DEADLINE_SECONDS))
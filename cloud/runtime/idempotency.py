@@ -0,0 +1,144 @@
+# idempotency.py
+
+# Idempotency-Key support. The first request with a key starts the work as
+# its own task; a duplicate with the same key and body attaches to that task
+# while it runs, or gets the stored result for IDEMPOTENCY_TTL_SECONDS after
+# it finishes. Only successful results are kept, so a retry after a failure,
+# rejection or cancellation starts afresh.
+#
+# A keyed run is only abandoned when every attached client has gone and none
+# has come back within IDEMPOTENCY_GRACE_SECONDS, so a Pi that times out and
+# immediately retries picks the same run back up. For the same reason
+# /run_flow gives a keyed run that much longer than the client's
+# X-Request-Deadline: otherwise the deadline, which the client sets just
+# under its own timeout, would cancel the run (and drop its entry) before
+# the retry arrives.
+#
+# Everything here runs on the event loop, so no locks are needed.
+
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import time
+
+from observability.metrics import counter
+from runtime.cancel import CLIENT_DISCONNECTED
+
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_GRACE_SECONDS = float(os.environ.get("IDEMPOTENCY_GRACE_SECONDS", "10"))
+
+REPLAYS = counter("idempotency_replays_total", "Duplicate submissions served without new work, by outcome")
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+def request_fingerprint(*parts):
+    """Stable hash of the request (path, params, body) a key is bound to."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class _Entry:
+
+    def __init__(self, fingerprint, task, cancel):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.cancel = cancel
+        self.expires_at = None      # set when the task succeeds
+        self.attached = 0
+        self._abandon = None
+
+    def attach(self):
+        """Register a waiting client; returns its (call-once) leave callback."""
+        self.attached += 1
+        if self._abandon is not None:
+            self._abandon.cancel()
+            self._abandon = None
+
+        left = False
+
+        def leave():
+            nonlocal left
+            if not left:
+                left = True
+                self._detach()
+        return leave
+
+    def _detach(self):
+        """A client went away; abandon the run if nobody re-attaches within the grace period."""
+        self.attached -= 1
+        if self.attached == 0 and self.cancel is not None and not self.task.done():
+            self._abandon = asyncio.get_running_loop().call_later(IDEMPOTENCY_GRACE_SECONDS, self._give_up)
+
+    def _give_up(self):
+        if self.attached == 0:
+            self.cancel.cancel(CLIENT_DISCONNECTED)
+
+
+class IdempotencyCache:
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()   # oldest first; finished entries move to the end
+
+    def begin(self, key, fingerprint, start, cancel=None):
+        """Return (entry, replayed). Starts `start()` (a coroutine) as a task for a new key.
+
+        `cancel` is the token the work runs under; it is cancelled once all
+        attached clients have disconnected (see _detach()).
+        """
+        self._purge()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise IdempotencyConflict(f"Idempotency-Key {key!r} was used for a different request")
+            REPLAYS.inc(outcome="completed" if entry.task.done() else "in_flight")
+            return entry, True
+
+        task = asyncio.create_task(start())
+        entry = self._entries[key] = _Entry(fingerprint, task, cancel)
+        task.add_done_callback(lambda t: self._finished(key, entry, t))
+        return entry, False
+
+    async def wait(self, entry):
+        """Wait for the shared result without letting one client's cancellation kill it."""
+        return await asyncio.shield(entry.task)
+
+    def _finished(self, key, entry, task):
+        if self._entries.get(key) is not entry:
+            return
+        if task.cancelled() or task.exception() is not None:
+            del self._entries[key]
+            return
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+
+    def _purge(self):
+        now = time.monotonic()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            expired = entry.expires_at is not None and entry.expires_at <= now
+            if not expired and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ---- Process-wide singleton ----
+
+_cache = None
+
+
+def get_idempotency_cache():
+    global _cache
+    if _cache is None:
+        _cache = IdempotencyCache()
+    return _cache
@@ -0,0 +1,306 @@
+# job_queue.py
+
+# Durable run queue shared by the API process and the worker processes
+# (EXECUTION_MODE=queue). Backed by one SQLite file, so it needs no external
+# service. A worker claims an item by leasing it for VISIBILITY_TIMEOUT
+# seconds and keeps renewing the lease while the run is alive; an item whose
+# lease lapses (worker crashed or was killed) goes back to the queue and is
+# retried, up to MAX_ATTEMPTS.
+#
+# Workers also publish a metrics snapshot here so the API can show one
+# combined view of the whole pool.
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from runtime.admission import BROWSER_POOL_SIZE, DEFAULT_SERVICE_SECONDS, LANES, MAX_RETRY_AFTER
+
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "/tmp/job_queue.sqlite3")
+VISIBILITY_TIMEOUT = float(os.environ.get("VISIBILITY_TIMEOUT", "60"))
+MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", "3"))
+QUEUE_MAX_PENDING_RUNS = int(os.environ.get("QUEUE_MAX_PENDING_RUNS", "32"))   # /run_flow items; jobs use JOB_BACKLOG_SIZE
+WORKER_STALE_SECONDS = 30       # a worker that hasn't reported for this long is considered gone
+
+FINISHED = ("ok", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id           TEXT NOT NULL,
+    item             INTEGER NOT NULL,
+    source           TEXT NOT NULL,
+    lane             TEXT NOT NULL,
+    priority         INTEGER NOT NULL,
+    payload          TEXT NOT NULL,
+    deadline         REAL,
+    state            TEXT NOT NULL,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    worker           TEXT,
+    lease_until      REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result           TEXT,
+    error            TEXT,
+    created_at       REAL NOT NULL,
+    started_at       REAL,
+    finished_at      REAL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_claim ON queue (state, priority, id);
+CREATE INDEX IF NOT EXISTS idx_queue_job ON queue (job_id, item);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id   TEXT PRIMARY KEY,
+    pid         INTEGER,
+    started_at  REAL,
+    updated_at  REAL,
+    metrics     TEXT
+);
+"""
+
+
+class JobQueue:
+
+    def __init__(self, path=JOB_QUEUE_PATH, visibility_timeout=VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        # Short-lived connections: callers run in worker threads and separate processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- Producers (API) ----
+
+    def enqueue(self, payloads, lane="bulk", job_id=None, deadline=None, source="job"):
+        """Queue one item per payload under `job_id`; returns (job_id, item ids).
+
+        `deadline` is an absolute unix time after which the run is pointless;
+        `source` ("run" for /run_flow, "job" for /jobs) lets each be bounded separately.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [
+                conn.execute(
+                    "INSERT INTO queue (job_id, item, source, lane, priority, payload, deadline, state, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+                    (job_id, i, source, lane, LANES[lane], json.dumps(p), deadline, now),
+                ).lastrowid
+                for i, p in enumerate(payloads)
+            ]
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return job_id, ids
+
+    def pending(self, source=None):
+        """Items queued or running (optionally from one source)."""
+        sql = "SELECT COUNT(*) FROM queue WHERE state IN ('queued', 'running')"
+        params = ()
+        if source:
+            sql += " AND source = ?"
+            params = (source,)
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def retry_after(self, pending):
+        """Rough seconds until a new item would start, from the backlog and the live workers' slots."""
+        slots = max(1, sum(w["alive"] for w in self.worker_metrics()) * BROWSER_POOL_SIZE)
+        return max(1, min(MAX_RETRY_AFTER, math.ceil((pending + 1) * DEFAULT_SERVICE_SECONDS / slots)))
+
+    def request_cancel(self, item_id):
+        """Cancel a queued item outright, or flag a running one for its worker to abort."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE queue SET state = 'cancelled', error = 'client disconnected', finished_at = ? "
+                "WHERE id = ? AND state = 'queued'", (time.time(), item_id))
+            conn.execute("UPDATE queue SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (item_id,))
+        finally:
+            conn.close()
+
+    def get(self, item_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM queue WHERE id = ?", (item_id,)).fetchone()
+        finally:
+            conn.close()
+        return _decode(row) if row else None
+
+    def job_status(self, job_id):
+        """Same shape as runtime.jobs.Job.to_dict(), or None for an unknown job."""
+        conn = self._connect()
+        try:
+            rows = [_decode(r) for r in conn.execute(
+                "SELECT * FROM queue WHERE job_id = ? ORDER BY item", (job_id,))]
+        finally:
+            conn.close()
+        if not rows:
+            return None
+
+        runs = []
+        for r in rows:
+            entry = {"index": r["item"], "status": r["state"]}
+            if r["result"]:
+                entry.update(r["result"])
+            if r["error"]:
+                entry["error"] = r["error"]
+            runs.append(entry)
+
+        states = {r["state"] for r in rows}
+        done = states <= set(FINISHED)
+        return {
+            "job_id": job_id,
+            "status": "done" if done else ("queued" if states == {"queued"} else "running"),
+            "created_at": rows[0]["created_at"],
+            "finished_at": max(r["finished_at"] or 0 for r in rows) if done else None,
+            "total": len(rows),
+            "completed": sum(r["state"] == "ok" for r in rows),
+            "failed": sum(r["state"] in ("failed", "cancelled") for r in rows),
+            "runs": runs,
+        }
+
+    # ---- Consumers (workers) ----
+
+    def claim(self, worker_id):
+        """Lease the highest-priority runnable item, or return None.
+
+        Items whose lease has lapsed count as runnable again; ones that have
+        already used up their attempts are failed instead.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE queue SET state = 'failed', error = 'worker lost (visibility timeout)', finished_at = ? "
+                "WHERE state = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            conn.execute(
+                "UPDATE queue SET state = 'cancelled', error = 'client disconnected', finished_at = ? "
+                "WHERE state = 'running' AND lease_until < ? AND cancel_requested = 1", (now, now))
+            conn.execute(
+                "UPDATE queue SET state = 'cancelled', error = 'deadline exceeded', finished_at = ? "
+                "WHERE state = 'queued' AND deadline IS NOT NULL AND deadline < ?", (now, now))
+
+            row = conn.execute(
+                "SELECT * FROM queue "
+                "WHERE (state = 'queued' OR (state = 'running' AND lease_until < ?)) AND cancel_requested = 0 "
+                "ORDER BY priority, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE queue SET state = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started_at = ? WHERE id = ?",
+                (worker_id, now + self.visibility_timeout, now, row["id"]))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        item = _decode(row)
+        item["attempts"] += 1
+        return item
+
+    def heartbeat(self, worker_id, item_ids):
+        """Extend the leases this worker holds; returns the ids whose cancellation was requested."""
+        if not item_ids:
+            return set()
+        marks = ",".join("?" * len(item_ids))
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"UPDATE queue SET lease_until = ? WHERE worker = ? AND state = 'running' AND id IN ({marks})",
+                (time.time() + self.visibility_timeout, worker_id, *item_ids))
+            cancelled = {r[0] for r in conn.execute(
+                f"SELECT id FROM queue WHERE cancel_requested = 1 AND id IN ({marks})", tuple(item_ids))}
+        finally:
+            conn.close()
+        return cancelled
+
+    def complete(self, item_id, worker_id, state, result=None, error=None):
+        """Record the outcome, unless the lease was lost and another worker has the item now."""
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE queue SET state = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND state = 'running'",
+                (state, json.dumps(result) if result is not None else None, error, time.time(), item_id, worker_id))
+        finally:
+            conn.close()
+        return cur.rowcount == 1
+
+    # ---- Worker metrics ----
+
+    def publish_metrics(self, worker_id, snapshot, started_at=None):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM workers WHERE updated_at < ?", (time.time() - 3600,))
+            conn.execute(
+                "INSERT INTO workers (worker_id, pid, started_at, updated_at, metrics) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET updated_at = excluded.updated_at, metrics = excluded.metrics",
+                (worker_id, os.getpid(), started_at or time.time(), time.time(), json.dumps(snapshot)))
+        finally:
+            conn.close()
+
+    def worker_metrics(self):
+        """Every worker's last report, with `alive` set for those seen in the last WORKER_STALE_SECONDS."""
+        conn = self._connect()
+        try:
+            rows = [dict(r) for r in conn.execute("SELECT * FROM workers ORDER BY worker_id")]
+        finally:
+            conn.close()
+        now = time.time()
+        for r in rows:
+            r["metrics"] = json.loads(r["metrics"] or "{}")
+            r["alive"] = now - r["updated_at"] < WORKER_STALE_SECONDS
+        return rows
+
+    def queue_stats(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT lane, state, COUNT(*) AS n FROM queue GROUP BY lane, state").fetchall()
+            oldest = conn.execute("SELECT MIN(created_at) FROM queue WHERE state = 'queued'").fetchone()[0]
+        finally:
+            conn.close()
+        by_state = {}
+        for r in rows:
+            by_state.setdefault(r["state"], {})[r["lane"]] = r["n"]
+        return {"by_state": by_state, "oldest_queued_age_s": round(time.time() - oldest, 1) if oldest else None}
+
+
+def _decode(row):
+    item = dict(row)
+    item["payload"] = json.loads(item["payload"])
+    item["result"] = json.loads(item["result"]) if item["result"] else None
+    return item
+
+
+# ---- Process-wide singleton ----
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+    return _queue
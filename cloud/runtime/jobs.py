@@ -0,0 +1,114 @@
+# jobs.py
+
+# Bulk batch jobs: a list of profiles submitted in one request and run in the
+# "bulk" admission lane, behind any interactive /run_flow traffic. The number
+# of job runs not yet finished is capped (JOB_BACKLOG_SIZE); a batch that
+# would exceed it is rejected as a whole with a Retry-After hint.
+
+import asyncio
+import os
+import time
+import uuid
+
+from observability.metrics import counter, gauge
+from runtime.admission import AdmissionRejected, get_admission_controller
+
+JOB_BACKLOG_SIZE = int(os.environ.get("JOB_BACKLOG_SIZE", "200"))
+MAX_JOBS_KEPT = 1000        # finished jobs beyond this are forgotten, oldest first
+
+JOB_RUNS_PENDING = gauge("job_runs_pending", "Job runs accepted but not yet finished")
+JOBS_SUBMITTED = counter("jobs_submitted_total", "Bulk jobs accepted")
+
+
+class Job:
+
+    def __init__(self, size):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.time()
+        self.finished_at = None
+        self.runs = [{"index": i, "status": "queued"} for i in range(size)]
+        self.tasks = []
+
+    @property
+    def status(self):
+        states = {r["status"] for r in self.runs}
+        if states <= {"ok", "failed"}:
+            return "done"
+        if states == {"queued"}:
+            return "queued"
+        return "running"
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "total": len(self.runs),
+            "completed": sum(r["status"] == "ok" for r in self.runs),
+            "failed": sum(r["status"] == "failed" for r in self.runs),
+            "runs": self.runs,
+        }
+
+
+class JobRegistry:
+
+    def __init__(self, backlog=JOB_BACKLOG_SIZE):
+        self.backlog = backlog
+        self.pending = 0
+        self._jobs = {}     # insertion ordered: oldest first
+
+    def submit(self, items, runner):
+        """Start a job that calls `await runner(item, on_admitted)` for each item.
+
+        The runner calls `on_admitted()` once it holds a browser slot, returns
+        the run's result dict, and raises on failure.
+        """
+        if self.pending + len(items) > self.backlog:
+            raise AdmissionRejected(get_admission_controller().retry_after())
+
+        job = Job(len(items))
+        self._jobs[job.id] = job
+        self._forget_old()
+        self.pending += len(items)
+        JOB_RUNS_PENDING.set(self.pending)
+        JOBS_SUBMITTED.inc()
+
+        for i, item in enumerate(items):
+            job.tasks.append(asyncio.create_task(self._run(job, i, item, runner)))
+        return job
+
+    async def _run(self, job, index, item, runner):
+        entry = job.runs[index]
+        try:
+            entry.update(await runner(item, lambda: entry.update(status="running")))
+            entry["status"] = "ok"
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            self.pending -= 1
+            JOB_RUNS_PENDING.set(self.pending)
+            if job.status == "done":
+                job.finished_at = time.time()
+                job.tasks = []
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _forget_old(self):
+        excess = len(self._jobs) - MAX_JOBS_KEPT
+        for job_id in [j for j, job in self._jobs.items() if job.status == "done"][:max(0, excess)]:
+            del self._jobs[job_id]
+
+
+# ---- Process-wide singleton ----
+
+_registry = None
+
+
+def get_job_registry():
+    global _registry
+    if _registry is None:
+        _registry = JobRegistry()
+    return _registry
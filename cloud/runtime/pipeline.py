@@ -0,0 +1,113 @@
+# pipeline.py
+
+# Overlapped run stages (RUN_PIPELINE=1). A flow's browser work splits into
+#
+#   prepare    create the browser context / driver, apply the spoofing,
+#              navigate to the target and take the "loaded" screenshot
+#   interact   find the box, type, validate, wait for the result, screenshots
+#   teardown   stop the screencast, collect the trace, close the browser
+#
+# and each stage has its own limit instead of one slot for the whole run:
+# while run N is interacting (mostly waiting on the page), run N+1 prepares,
+# so a loaded page is ready the moment an interaction slot frees up.
+#
+#   prepare    PIPELINE_PREPARE_SLOTS; a run keeps its prepare slot until it
+#              gets an interaction slot, so at most that many pages wait ready
+#   interact   BROWSER_POOL_SIZE
+#   teardown   unlimited; it runs after the interaction slot is handed on
+#
+# Each stage is a LaneSemaphore (runtime/admission.py), so waiting runs are
+# served by lane, like admission. Everything here runs on the event loop, so
+# no locks are needed.
+
+import time
+
+from observability.metrics import gauge, histogram
+from runtime.admission import BROWSER_POOL_SIZE, PIPELINE_PREPARE_SLOTS, LaneSemaphore
+
+STAGE_SLOTS = gauge("pipeline_stage_slots", "Capacity of a pipeline stage")
+STAGE_IN_USE = gauge("pipeline_stage_in_use", "Runs holding a slot of a pipeline stage")
+STAGE_WAITING = gauge("pipeline_stage_waiting", "Runs waiting for a slot of a pipeline stage")
+STAGE_WAIT = histogram("pipeline_stage_wait_seconds", "Time spent waiting for a slot of a pipeline stage")
+
+
+class StageGate(LaneSemaphore):
+    """The lane-ordered semaphore of one pipeline stage, with per-stage metrics."""
+
+    def __init__(self, stage, slots):
+        super().__init__(slots)
+        self.stage = stage
+        STAGE_SLOTS.set(self.slots, stage=stage)
+
+    async def acquire(self, lane="interactive", cancel=None):
+        """Wait for a slot; a cancelled or expired `cancel` leaves the queue with FlowCancelled."""
+        start = time.perf_counter()
+        if not self._try_acquire():
+            STAGE_WAITING.inc(stage=self.stage)
+            try:
+                await self._wait(lane, cancel)
+            finally:
+                STAGE_WAITING.dec(stage=self.stage)
+        waited = time.perf_counter() - start
+        STAGE_WAIT.observe(waited, stage=self.stage)
+        STAGE_IN_USE.set(self.in_use, stage=self.stage)
+        return waited
+
+    def release(self):
+        super().release()
+        STAGE_IN_USE.set(self.in_use, stage=self.stage)
+
+    def stats(self):
+        return {"slots": self.slots, "in_use": self.in_use, "waiting": sum(self.queued().values())}
+
+
+class RunPipeline:
+
+    def __init__(self, prepare_slots=PIPELINE_PREPARE_SLOTS, interact_slots=BROWSER_POOL_SIZE):
+        self.prepare_gate = StageGate("prepare", prepare_slots)
+        self.interact_gate = StageGate("interact", interact_slots)
+
+    async def run(self, prepare, interact, teardown, lane="interactive", cancel=None, mark=None):
+        """Run one flow through the stages.
+
+        `prepare()` returns a session, `interact(session)` the flow's outcome,
+        and `teardown(session)` closes it; all three are coroutine functions.
+        `mark(phase)` is called after each wait for a slot ("prepare_wait",
+        "interact_wait"), so a PhaseTimer can book it.
+        """
+        mark = mark or (lambda phase: None)
+
+        await self.prepare_gate.acquire(lane, cancel)
+        mark("prepare_wait")
+        try:
+            session = await prepare()
+            try:
+                # The prepared page waits here, still counted against prepare, until a slot frees
+                await self.interact_gate.acquire(lane, cancel)
+            except BaseException:
+                await teardown(session)
+                raise
+        finally:
+            self.prepare_gate.release()
+        mark("interact_wait")
+
+        try:
+            return await interact(session)
+        finally:
+            self.interact_gate.release()
+            await teardown(session)
+
+    def stats(self):
+        return {"prepare": self.prepare_gate.stats(), "interact": self.interact_gate.stats()}
+
+
+# ---- Process-wide singleton ----
+
+_pipeline = None
+
+
+def get_run_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = RunPipeline()
+    return _pipeline
@@ -0,0 +1,191 @@
+# worker.py
+
+# Worker processes for EXECUTION_MODE=queue. Each process owns its own
+# browsers (chromedriver and profile template, or one Chrome with
+# DRIVER_BACKEND=cdp) and browser pool (BROWSER_POOL_SIZE slots) and pulls
+# runs from the shared SQLite job queue, so flows spread over every core
+# instead of sharing one uvicorn process. Leases are renewed while a run
+# is alive; a crashed worker's runs are picked up by the others once the
+# visibility timeout lapses. A supervisor restarts workers that exit.
+#
+# From cloud/:
+#     python -m runtime.worker --processes 2                # workers only
+#     python -m runtime.worker --processes 2 --serve-api    # workers + the API in queue mode
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+from storage.run_store import close_run_store, get_run_store
+from observability import metrics
+from observability.log import log_context, setup_logging
+from observability.trace_context import new_trace, parse_traceparent, trace_scope
+from runtime.admission import get_admission_controller
+from runtime.cancel import CLIENT_DISCONNECTED, RUN_DEADLINE_SECONDS, CancelToken, FlowCancelled
+from runtime.job_queue import VISIBILITY_TIMEOUT, get_job_queue
+from tls_server import ProfileModel, perform_run, start_browsers, stop_browsers
+
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+
+    def __init__(self, index):
+        self.id = f"{socket.gethostname()}-{index}-{os.getpid()}"
+        self.queue = get_job_queue()
+        self.slots = get_admission_controller().slots
+        self.heartbeat_seconds = min(2.0, VISIBILITY_TIMEOUT / 3)
+        self.started_at = time.time()
+        self.running = {}       # queue item id -> CancelToken
+        self._stop = None
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stop.set)
+
+        await start_browsers()
+        get_run_store()
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info("worker ready", extra={"worker": self.id, "slots": self.slots})
+
+        tasks = set()
+        while not self._stop.is_set():
+            if len(self.running) >= self.slots:
+                await self._pause()
+                continue
+            item = await asyncio.to_thread(self.queue.claim, self.id)
+            if item is None:
+                await self._pause()
+                continue
+            task = asyncio.create_task(self._execute(item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Finish what we hold; anything cut short is re-leased by another worker later
+        logger.info("worker stopping", extra={"worker": self.id, "in_flight": len(tasks)})
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        heartbeat.cancel()
+        await asyncio.to_thread(self._publish)
+        close_run_store()
+        await stop_browsers()
+
+    async def _pause(self):
+        try:
+            await asyncio.wait_for(self._stop.wait(), POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self, item):
+        timeout = item["deadline"] - time.time() if item["deadline"] else RUN_DEADLINE_SECONDS
+        cancel = CancelToken(timeout)
+        self.running[item["id"]] = cancel
+        result, error = None, None
+        payload = item["payload"]
+        profiling = payload.pop("profiling", False)
+        trace = payload.pop("trace", False)
+        trace_ctx = parse_traceparent(payload.pop("traceparent", None)) or new_trace()
+
+        log_fields = {"worker": self.id, "item": item["id"], "job_id": item["job_id"], "attempt": item["attempts"]}
+        with log_context(**log_fields), trace_scope(trace_ctx):
+            try:
+                profile = ProfileModel(**payload)
+                result = await perform_run(profile, item["lane"], bounded=False, cancel=cancel,
+                                           profiling=profiling, trace=trace)
+                state = "ok"
+            except FlowCancelled as e:
+                state, error = "cancelled", e.reason
+            except Exception as e:
+                state, error = "failed", f"{type(e).__name__}: {e}"
+            finally:
+                del self.running[item["id"]]
+
+            if not await asyncio.to_thread(self.queue.complete, item["id"], self.id, state, result, error):
+                logger.warning("lease lost; result discarded")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                cancelled = await asyncio.to_thread(self.queue.heartbeat, self.id, list(self.running))
+                for item_id in cancelled:
+                    token = self.running.get(item_id)
+                    if token is not None:
+                        token.cancel(CLIENT_DISCONNECTED)
+                await asyncio.to_thread(self._publish)
+            except Exception:
+                logger.exception("heartbeat failed", extra={"worker": self.id})
+
+    def _publish(self):
+        self.queue.publish_metrics(self.id, metrics.snapshot(), self.started_at)
+
+
+def _worker_main(index):
+    setup_logging("cloud")
+    asyncio.run(Worker(index).run())
+
+
+def _api_main(host, port):
+    uvicorn.run("tls_server:app", host=host, port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queue worker processes (EXECUTION_MODE=queue)")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Worker processes to run")
+    parser.add_argument("--serve-api", action="store_true", help="Also run the API (uvicorn) in queue mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    setup_logging("cloud")
+    os.environ["EXECUTION_MODE"] = "queue"      # inherited by the API child
+    ctx = multiprocessing.get_context("spawn")
+
+    def start(target, *a):
+        p = ctx.Process(target=target, args=a, daemon=False)
+        p.start()
+        return p
+
+    children = {f"worker-{i}": (start(_worker_main, i), _worker_main, (i,)) for i in range(args.processes)}
+    if args.serve_api:
+        children["api"] = (start(_api_main, args.host, args.port), _api_main, (args.host, args.port))
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("supervisor started", extra={"workers": args.processes, "api": args.serve_api})
+    try:
+        while not stopping:
+            time.sleep(1.0)
+            for name, (proc, target, a) in list(children.items()):
+                if not proc.is_alive() and not stopping:
+                    logger.warning("child exited; restarting", extra={"child": name, "exitcode": proc.exitcode})
+                    children[name] = (start(target, *a), target, a)
+    finally:
+        for proc, _, _ in children.values():
+            if proc.is_alive():
+                proc.terminate()
+        for proc, _, _ in children.values():
+            proc.join(timeout=60)
+
+
+if __name__ == "__main__":
+    main()
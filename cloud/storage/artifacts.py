@@ -0,0 +1,105 @@
+# artifacts.py
+
+# Content-addressed artifact files. A frame is named by the sha256 of its
+# bytes, so a capture identical to one already stored (e.g. "validated" and
+# "result" before the message appears) is not written again; the run just
+# references the existing file. Because a name always means the same bytes,
+# these files are served with a strong ETag (the hash) and as immutable.
+#
+# stream_zip() bundles several files into one zip, produced chunk by chunk
+# for a streaming response instead of being built in memory.
+
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+
+from observability import metrics
+
+STORED = metrics.counter("artifacts_stored_total", "Artifact writes, by whether the content was new or a duplicate")
+STORED_BYTES = metrics.counter("artifact_bytes_written_total", "Bytes written for new artifacts")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+ZIP_CHUNK_BYTES = 64 * 1024
+
+_CONTENT_NAME = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+
+
+def content_name(data, ext):
+    return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+def store_artifact(directory, data, ext):
+    """Write `data` as <sha256>.<ext> unless it is already there; returns the file name."""
+    name = content_name(data, ext)
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        STORED.inc(kind="duplicate")
+        return name
+
+    # Write then rename, so a concurrent reader never sees a partial file
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    STORED.inc(kind="new")
+    STORED_BYTES.inc(len(data))
+    return name
+
+
+def content_etag(name):
+    """Strong ETag for a content-addressed file name, or None for any other name."""
+    m = _CONTENT_NAME.match(name)
+    return f'"{m.group(1)}"' if m else None
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value covers `etag`."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+class _Chunks:
+    """Write-only file object that collects what zipfile writes, for the generator to hand out."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        out = b"".join(self.parts)
+        self.parts.clear()
+        return out
+
+
+def stream_zip(entries, chunk_size=ZIP_CHUNK_BYTES):
+    """Yield a zip archive of `entries` ((name in archive, file path or bytes) pairs) piece by piece.
+
+    Holds at most about one chunk in memory. Files are stored uncompressed: PNG/JPEG/mp4 don't shrink.
+    """
+    out = _Chunks()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf:
+        for name, source in entries:
+            with zf.open(name, "w", force_zip64=True) as dest:
+                if isinstance(source, bytes):
+                    dest.write(source)
+                else:
+                    with open(source, "rb") as f:
+                        while chunk := f.read(chunk_size):
+                            dest.write(chunk)
+                            yield out.take()
+            yield out.take()
+    yield out.take()
@@ -0,0 +1,270 @@
+# run_store.py
+
+# Local SQLite record of every run_flow: profile attributes, seed, phase
+# timings, result and artifact references. Writes are queued and committed in
+# batches by a background thread so the request path never touches the disk.
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RUN_DB_PATH = os.environ.get("RUN_DB_PATH", "/tmp/runs.sqlite3")
+
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0        # seconds a queued record may wait before being written
+MAX_PENDING = 10000         # beyond this, records are dropped (and counted) rather than blocking
+
+# Columns callers may group by -> SQL column
+DIMENSIONS = {
+    "browser": "browser",
+    "version": "version",
+    "os": "os",
+    "hardware_type": "hardware_type",
+    "language": "language",
+    "timezone": "timezone",
+    "viewport": "viewport",
+    "webgl_vendor": "webgl_vendor",
+    "webgl_renderer": "webgl_renderer",
+    "result_type": "result_type",
+}
+
+COLUMNS = (
+    "run_id", "created_at", "browser", "version", "os", "hardware_type", "language",
+    "timezone", "viewport", "webgl_vendor", "webgl_renderer", "tls_client_name",
+    "seed", "status", "result_type", "result_text", "error", "total_ms", "timings", "artifacts",
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id          TEXT PRIMARY KEY,
+    created_at      REAL NOT NULL,
+    browser         TEXT,
+    version         TEXT,
+    os              TEXT,
+    hardware_type   TEXT,
+    language        TEXT,
+    timezone        TEXT,
+    viewport        TEXT,
+    webgl_vendor    TEXT,
+    webgl_renderer  TEXT,
+    tls_client_name TEXT,
+    seed            INTEGER,
+    status          TEXT NOT NULL,
+    result_type     TEXT,
+    result_text     TEXT,
+    error           TEXT,
+    total_ms        REAL,
+    timings         TEXT,
+    artifacts       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (created_at);
+{"".join(f"CREATE INDEX IF NOT EXISTS idx_runs_{c} ON runs ({c}, created_at);" for c in
+         ("browser", "os", "viewport", "webgl_renderer", "result_type"))}
+"""
+
+
+def run_record(run_id, profile, seed, status, result=None, timings=None, artifacts=None, error=None):
+    """Flatten one run into a row dict for RunStore.record()."""
+    result = result or {}
+    timings = timings or {}
+    return {
+        "run_id": run_id,
+        "created_at": time.time(),
+        "browser": profile.name,
+        "version": profile.version,
+        "os": profile.os,
+        "hardware_type": profile.hardware_type,
+        "language": profile.language,
+        "timezone": profile.timezone,
+        "viewport": f"{profile.viewport[0]}x{profile.viewport[1]}",
+        "webgl_vendor": profile.webgl_vendor,
+        "webgl_renderer": profile.webgl_renderer,
+        "tls_client_name": profile.tls_client_name,
+        "seed": seed,
+        "status": status,
+        "result_type": result.get("type"),
+        "result_text": result.get("text"),
+        "error": error,
+        "total_ms": timings.get("total"),
+        "timings": json.dumps(timings),
+        "artifacts": json.dumps(artifacts or {}),
+    }
+
+
+class RunStore:
+
+    def __init__(self, path=RUN_DB_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._pending = queue.Queue(maxsize=MAX_PENDING)
+        self._stop = threading.Event()
+        self._listeners = []
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="run-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- Writes (off the request path) ----
+
+    def record(self, row):
+        """Queue a run for writing. Never blocks; drops (and counts) when the queue is full."""
+        try:
+            self._pending.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        conn = self._connect()
+        sql = f"INSERT OR REPLACE INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+        while not (self._stop.is_set() and self._pending.empty()):
+            batch = self._drain()
+            if not batch:
+                continue
+            try:
+                with conn:
+                    conn.executemany(sql, [tuple(row.get(c) for c in COLUMNS) for row in batch])
+            except Exception:
+                # Locked past the timeout, disk full, an unbindable value: lose this batch, not the writer
+                logger.exception("run store write failed; dropping %d records", len(batch))
+                self.dropped += len(batch)
+            else:
+                self.written += len(batch)
+                for listener in self._listeners:
+                    try:
+                        listener(batch)
+                    except Exception:
+                        logger.exception("run store listener failed")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+        conn.close()
+
+    def _drain(self):
+        """Block for the first row, then collect until the batch fills or the interval expires."""
+        try:
+            batch = [self._pending.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def subscribe(self, listener):
+        """Call `listener(rows)` on the writer thread after each committed batch."""
+        self._listeners.append(listener)
+
+    def flush(self):
+        """Wait until everything queued so far is committed."""
+        self._pending.join()
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+
+    # ---- Queries ----
+
+    def get_run(self, run_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        run = dict(row)
+        run["timings"] = json.loads(run["timings"] or "{}")
+        run["artifacts"] = json.loads(run["artifacts"] or "{}")
+        return run
+
+    def summary_by(self, dimension, since=None, until=None):
+        """Success rate and latency per value of `dimension` (one of DIMENSIONS)."""
+        column = DIMENSIONS.get(dimension)
+        if column is None:
+            raise ValueError(f"Unknown dimension {dimension!r}; expected one of {sorted(DIMENSIONS)}")
+
+        where, params = [], []
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        sql = f"""
+            SELECT {column} AS value,
+                   COUNT(*) AS runs,
+                   SUM(result_type = 'success') AS successes,
+                   SUM(status != 'ok') AS failures,
+                   AVG(total_ms) AS avg_ms,
+                   MIN(total_ms) AS min_ms,
+                   MAX(total_ms) AS max_ms
+            FROM runs {where_sql}
+            GROUP BY {column}
+            ORDER BY runs DESC
+        """
+        conn = self._connect()
+        try:
+            rows = [dict(r) for r in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+        for r in rows:
+            r["success_rate"] = round(r["successes"] / r["runs"], 4) if r["runs"] else 0.0
+            for k in ("avg_ms", "min_ms", "max_ms"):
+                r[k] = round(r[k], 1) if r[k] is not None else None
+        return rows
+
+    def stats(self):
+        return {"path": self.path, "written": self.written, "pending": self._pending.qsize(), "dropped": self.dropped}
+
+
+# ---- Process-wide singleton ----
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_run_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RunStore()
+    return _store
+
+
+def close_run_store():
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
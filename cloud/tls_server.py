@@ -1,31 +1,79 @@
 # tls_server.py
 
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from async_tls_client import AsyncSession
 
 from profiles.profile import BrowserProfile
-from environment.cloud_selenium_wrapper import create_cloud_driver
-from interactions.mouse_movement_cloud import find_box
-from interactions.mouse_movement_cloud import validate
+from environment.cloud_selenium_wrapper import create_cloud_driver, release_cloud_driver
+from environment.cloud_cdp_wrapper import create_cdp_page, prepare_cdp_browser, release_cdp_page
+from environment.cdp_client import CDPError, close_cdp_browser
+from environment.driver_service import prepare_profile_template, shutdown_driver_service
+from environment.asset_cache import asset_cache_stats
+from environment.capture import SCREENSHOT_FORMAT, capture_screenshot, capture_screenshot_async
+from environment.screencast import CAPTURE_MODE, Screencast, encoding_marker, screencast_file
+from storage.artifacts import IMMUTABLE, content_etag, etag_matches, store_artifact, stream_zip
+from storage.run_store import DIMENSIONS, close_run_store, get_run_store, run_record
+from analytics.run_stats import get_run_analytics
+from runtime.admission import LANES, REJECTED, RUN_PIPELINE, AdmissionRejected, get_admission_controller
+from runtime.jobs import JOB_BACKLOG_SIZE, get_job_registry
+from runtime.job_queue import QUEUE_MAX_PENDING_RUNS, get_job_queue
+from runtime.pipeline import get_run_pipeline
+from runtime.cancel import (CancelToken, FlowCancelled, RUN_DEADLINE_SECONDS, DEADLINE_EXCEEDED,
+                            CLIENT_DISCONNECTED, request_timeout)
+from runtime.idempotency import (IDEMPOTENCY_GRACE_SECONDS, IdempotencyConflict, get_idempotency_cache,
+                                 request_fingerprint)
+from observability import metrics
+from observability.log import log_context, log_profile_dump, setup_logging
+from observability.profiling import RUN_PROFILING, profile_path, profiling_requested, render_stats, run_profiled
+from observability.trace_context import (current_trace, format_server_timing, new_trace, parse_traceparent,
+                                         trace_scope)
+from observability.tracing import RUN_TRACING, Tracer, current_tracer, span, trace_path, tracing, tracing_requested
+from interactions.mouse_movement_cloud import find_box, find_box_async
+from interactions.mouse_movement_cloud import validate, validate_async
 
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 
+import asyncio
+import json
+import logging
 import random
+import secrets
 import string
 import uuid
 import os
 import time
 
+logger = logging.getLogger("tls_server")
+
 app = FastAPI()
 
 SCREENSHOT_DIR = "/tmp/screenshots"
+TARGET_URL = os.environ.get("TARGET_URL", "https://group4.kokax.com/")
+
+# "local": this process drives the browsers. "queue": runs go through the shared
+# job queue to runtime.worker processes (python -m runtime.worker --serve-api).
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "local")
+QUEUE_POLL_SECONDS = 0.25
+
+# "selenium": a chromedriver session per run, driven from a worker thread.
+# "cdp": a browser context per run on one shared Chrome, driven over its
+# DevTools websocket from the event loop (environment/cdp_client.py).
+DRIVER_BACKEND = os.environ.get("DRIVER_BACKEND", "selenium")
+RESULT_POLL_SECONDS = 0.1
 
 os.makedirs(SCREENSHOT_DIR, exist_ok=True)
 
+DISCONNECT_POLL_SECONDS = 0.5
+
+RUNS = metrics.counter("runs_total", "Finished flows by status and lane")
+RUN_SECONDS = metrics.histogram("run_seconds", "Flow duration including queue wait, by lane")
+JOB_QUEUE_WAIT = metrics.histogram("job_queue_wait_seconds", "Time a queued run waited for a worker (queue mode)")
+
 class ProfileModel(BaseModel):
     name: str
     version: str
@@ -41,64 +89,765 @@ class ProfileModel(BaseModel):
     audio_seed: int
     tls_client_name: str
     proxy: str | None = None
+    seed: int | None = None     # per-run RNG seed; echoed back so the run can be replayed
+
+
+class JobRequest(BaseModel):
+    profiles: list[ProfileModel]
+
+
+class PhaseTimer:
+    """Accumulates wall time (ms) per flow phase; each mark() closes the phase since the last one."""
+
+    def __init__(self):
+        self.timings = {}
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        ms = (now - self._last) * 1000
+        self.timings[phase] = round(self.timings.get(phase, 0.0) + ms, 1)
+        tracer = current_tracer()
+        if tracer is not None:
+            tracer.complete_perf(phase, self._last, now)
+        self._last = now
+        logger.debug("phase done", extra={"phase": phase, "ms": round(ms, 1)})
+
+    def total(self) -> dict:
+        return {**self.timings, "total": round((time.perf_counter() - self._start) * 1000, 1)}
 
 
 def save_screenshot(driver, label: str) -> str:
-    unique_id = str(uuid.uuid4())
-    filename = f"{label}_{unique_id}.png"
-    full_path = os.path.join(SCREENSHOT_DIR, filename)
-    
-    driver.save_screenshot(full_path)
-    print(f"[Cloud] Saved screenshot: {full_path}")
+    """Capture the (clipped) page and store it by content hash; identical frames share one file."""
+    with span("screenshot", label=label):
+        data = capture_screenshot(driver)
+        filename = store_artifact(SCREENSHOT_DIR, data, SCREENSHOT_FORMAT)
+    logger.debug("screenshot saved", extra={"phase": "screenshots", "label": label, "file": filename})
+
+    return f"/screenshot/{filename}"
+
+
+async def save_screenshot_async(page, label: str) -> str:
+    """save_screenshot() for the CDP backend."""
+    with span("screenshot", label=label):
+        data = await capture_screenshot_async(page)
+        filename = await asyncio.to_thread(store_artifact, SCREENSHOT_DIR, data, SCREENSHOT_FORMAT)
+    logger.debug("screenshot saved", extra={"phase": "screenshots", "label": label, "file": filename})
 
     return f"/screenshot/{filename}"
-    
 
-def wait_for_results(driver):
+
+def _result_message(classes: str, text: str) -> dict:
+    if "success" in classes:
+        return {"type": "success", "text": text}
+    elif "error" in classes:
+        return {"type": "error", "text": text}
+    elif "info" in classes:
+        return {"type": "info", "text": text}
+    else:
+        return {"type": "unknown", "text": text}
+
+
+def wait_for_results(driver, cancel=None):
     """
     Wait for Captcha result msg and return
     """
+    timeout = 8
+    find_message = EC.presence_of_element_located((By.CSS_SELECTOR, ".message"))
+    if cancel is not None:
+        if cancel.remaining() is not None:
+            timeout = min(timeout, cancel.remaining())
+
+        def find_message(d, _find=find_message):
+            cancel.check()
+            return _find(d)
+
     try: 
-        msg = WebDriverWait(driver, 8).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".message"))
-        )
+        msg = WebDriverWait(driver, timeout).until(find_message)
 
         text = msg.text.strip()
 
         classes = msg.get_attribute("class")
 
-        if "success" in classes:
-            return {"type": "success", "text": text}
-        
-        elif "error" in classes:
-            return {"type": "error", "text": text}
-        
-        elif "info" in classes:
-            return {"type": "info", "text": text}
-
-        else:
-            return {"type": "unknown", "text": text}
+        return _result_message(classes, text)
     
+    except FlowCancelled:
+        raise
+
     except Exception:
+        if cancel is not None:
+            cancel.check()      # the wait was cut short by the deadline, not by a missing message
         return {"type": "none_detected", "text": "No result message appeared"}
 
 
+_FIND_MESSAGE = ("(() => { const m = document.querySelector('.message');"
+                 " return m && {classes: m.className, text: m.innerText.trim()}; })()")
+
+
+async def wait_for_results_async(page, cancel: CancelToken) -> dict:
+    """wait_for_results() for the CDP backend: poll the page for the message element."""
+    remaining = cancel.remaining()
+    timeout = 8 if remaining is None else min(8, remaining)
+    loop = asyncio.get_running_loop()
+    give_up = loop.time() + timeout
+    while True:
+        cancel.check()
+        try:
+            msg = await page.evaluate(_FIND_MESSAGE)
+        except CDPError:
+            msg = None
+        if msg:
+            return _result_message(msg["classes"], msg["text"])
+        if loop.time() >= give_up:
+            cancel.check()      # cut short by the deadline, not a missing message
+            return {"type": "none_detected", "text": "No result message appeared"}
+        await cancel.sleep_async(RESULT_POLL_SECONDS)
+
+
+async def start_browsers():
+    """Get the configured driver backend ready before the first run."""
+    if DRIVER_BACKEND == "cdp":
+        await prepare_cdp_browser()
+    else:
+        # Start the shared chromedriver and build the profile template
+        await asyncio.to_thread(prepare_profile_template)
+
+
+async def stop_browsers():
+    if DRIVER_BACKEND == "cdp":
+        await close_cdp_browser()
+    else:
+        shutdown_driver_service()
+
+
+@app.on_event("startup")
+async def warm_up_chrome():
+    setup_logging("cloud")
+    if EXECUTION_MODE == "queue":
+        get_job_queue()     # browsers live in the worker processes
+    else:
+        await start_browsers()
+    get_run_analytics(get_run_store())
+
+
+@app.on_event("shutdown")
+async def stop_chrome_service():
+    await stop_browsers()
+    close_run_store()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text format: admission, queue wait, rejections, run outcomes."""
+    return metrics.render()
+
+
+@app.get("/metrics/cluster")
+def cluster_metrics():
+    """This process plus every worker that reported recently, summed; per-worker liveness and queue depth."""
+    if EXECUTION_MODE != "queue":
+        return {"mode": "local", "workers": [], "totals": metrics.snapshot()}
+
+    queue = get_job_queue()
+    workers = queue.worker_metrics()
+    return {
+        "mode": "queue",
+        "queue": queue.queue_stats(),
+        "workers": [{k: w[k] for k in ("worker_id", "pid", "started_at", "updated_at", "alive")} for w in workers],
+        "totals": metrics.merge_snapshots([metrics.snapshot()] + [w["metrics"] for w in workers if w["alive"]]),
+    }
+
+
+@app.get("/admission")
+def admission_stats():
+    stats = {**get_admission_controller().stats(), "job_runs_pending": get_job_registry().pending}
+    if RUN_PIPELINE:
+        stats["pipeline"] = get_run_pipeline().stats()
+    return stats
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return asset_cache_stats()
+
+
+@app.get("/runs/summary")
+def runs_summary(by: str = "browser", since: float | None = None, until: float | None = None):
+    """Success rate and latency grouped by a profile dimension (browser, os, viewport, webgl_renderer, ...)."""
+    if by not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"'by' must be one of {sorted(DIMENSIONS)}")
+    return {"by": by, "groups": get_run_store().summary_by(by, since, until)}
+
+
+@app.get("/stats")
+def stats(by: str | None = None, since: float | None = None, until: float | None = None):
+    """Vectorised run-history summaries: one dimension with ?by=, else browser/os/viewport/webgl_renderer."""
+    analytics = get_run_analytics(get_run_store())
+    if EXECUTION_MODE == "queue":
+        analytics.load_sqlite(get_run_store().path)     # runs are written by the worker processes
+    try:
+        if by:
+            return {"runs": analytics.n, "by": {by: analytics.summary(by, since, until)}}
+        return analytics.overview(since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/runs/{run_id}")
+def get_run(run_id: str):
+    run = get_run_store().get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    return run
+
+
+@app.get("/runs/{run_id}/profile")
+def get_run_profile(run_id: str, format: str = "prof"):
+    """A profiled run's cProfile stats: the raw .prof file, or ?format=text for the top functions."""
+    path = profile_path(SCREENSHOT_DIR, run_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="no profile for this run")
+    if format == "text":
+        return PlainTextResponse(render_stats(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{run_id}.prof")
+
+
+@app.get("/runs/{run_id}/trace")
+def get_run_trace(run_id: str):
+    """A traced run's Chrome trace-event JSON (load it in chrome://tracing or ui.perfetto.dev)."""
+    path = trace_path(SCREENSHOT_DIR, run_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="no trace for this run")
+    return FileResponse(path, media_type="application/json", filename=f"{run_id}.trace.json")
+
+
+@app.get("/screencast/{capture_id}")
+def get_screencast(capture_id: str):
+    """A run's screencast (mp4, or a zip of frames plus manifest.json); 202 while it is still encoding."""
+    path, media_type = screencast_file(SCREENSHOT_DIR, capture_id)
+    if path is not None:
+        return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+    if os.path.exists(encoding_marker(SCREENSHOT_DIR, capture_id)):
+        return JSONResponse({"status": "encoding"}, status_code=202, headers={"Retry-After": "1"})
+    raise HTTPException(status_code=404, detail="screencast not found")
+
+
+@app.get("/runs/{run_id}/artifacts")
+async def get_run_artifacts(run_id: str):
+    """Every artifact of a run (screenshots, profile, trace, screencast) plus run.json, as one streamed zip."""
+    run = await asyncio.to_thread(get_run_store().get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    entries = await asyncio.to_thread(_artifact_entries, run)
+    return StreamingResponse(stream_zip(entries), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="run_{run_id}.zip"'})
+
+
+def _artifact_entries(run: dict) -> list:
+    """(name in the bundle, path or bytes) for each of the run's artifacts that is still on disk.
+
+    A file referenced by several labels (deduplicated frames) goes in once;
+    run.json maps every label to its file in the bundle.
+    """
+    entries, files, seen = [], {}, {}
+    for label, link in run["artifacts"].items():
+        path = _artifact_path(link)
+        if path is None or not os.path.exists(path):
+            continue
+        if path not in seen:
+            folder = label if label in ("profile", "trace", "screencast") else "screenshots"
+            seen[path] = f"{folder}/{os.path.basename(path)}"
+            entries.append((seen[path], path))
+        files[label] = seen[path]
+    meta = json.dumps({**run, "files": files}, indent=2, default=str).encode()
+    return [("run.json", meta)] + entries
+
+
+def _artifact_path(link: str) -> str | None:
+    """Local file behind an artifact link, or None if it is not one we store."""
+    kind, _, name = link.strip("/").partition("/")
+    if kind == "screenshot":
+        return os.path.join(SCREENSHOT_DIR, os.path.basename(name))
+    if kind == "screencast":
+        return screencast_file(SCREENSHOT_DIR, os.path.basename(name))[0]
+    if kind == "runs":
+        run_id, _, what = name.partition("/")
+        if what == "profile":
+            return profile_path(SCREENSHOT_DIR, os.path.basename(run_id))
+        if what == "trace":
+            return trace_path(SCREENSHOT_DIR, os.path.basename(run_id))
+    return None
+
+
 @app.get("/screenshot/{filename}")
-def get_screenshot(filename: str):
+async def get_screenshot(filename: str, request: Request):
+    """A screenshot. Content-addressed names (<sha256>.<ext>) are immutable: strong ETag,
+    long-lived Cache-Control and 304 for a matching If-None-Match."""
+    filename = os.path.basename(filename)
+    etag = content_etag(filename)
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE} if etag else None
+    if etag and etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+
     full_path = os.path.join(SCREENSHOT_DIR, filename)
-    if not os.path.exists(full_path):
+    if not await asyncio.to_thread(os.path.exists, full_path):
         return {"error" : "screenshot not found"}
-    
-    return FileResponse(full_path)
+
+    return FileResponse(full_path, headers=headers)
+
+
+async def execute_flow(bp: BrowserProfile, rng: random.Random, timer: PhaseTimer, cancel: CancelToken,
+                       profile_to: str | None = None, lane: str = "interactive") -> dict:
+    """Drive one spoofed browser through the CAPTCHA and return what it saw.
+
+    Raises FlowCancelled as soon as `cancel` fires (deadline or client gone).
+    With `profile_to`, the browser half runs under cProfile and its stats are saved there.
+    With RUN_PIPELINE=1 the browser half goes through the stage limits of runtime/pipeline.py.
+    """
+
+    # --- TLS spoofing (AsyncSession with tls_client_name) ---
+    session = AsyncSession(client_identifier=bp.tls_client_name)
+    try:
+        async with session:
+            # Cheap handshake to apply fingerprint
+            await asyncio.wait_for(session.get("https://example.com"), cancel.remaining())
+    except asyncio.TimeoutError:
+        cancel.check()
+        raise
+    timer.mark("tls")
+    cancel.check()
+
+    if RUN_PIPELINE and (profile_to is None or DRIVER_BACKEND == "cdp"):
+        return await drive_pipelined(bp, rng, timer, cancel, lane)
+
+    if DRIVER_BACKEND == "cdp":
+        # Runs on the event loop; run_flow refuses X-Profile for this backend
+        return await drive_browser_cdp(bp, rng, timer, cancel)
+
+    # Selenium calls block; keep them off the event loop so queued requests stay responsive.
+    # A profiled run isn't pipelined: cProfile follows the one thread that runs the whole browser half.
+    if profile_to is None:
+        return await asyncio.to_thread(drive_browser, bp, rng, timer, cancel)
+    return await asyncio.to_thread(run_profiled, profile_to, drive_browser, bp, rng, timer, cancel)
+
+
+async def drive_pipelined(bp: BrowserProfile, rng: random.Random, timer: PhaseTimer, cancel: CancelToken,
+                          lane: str) -> dict:
+    """The browser half split into prepare / interact / teardown stages, overlapped with other runs."""
+    if DRIVER_BACKEND == "cdp":
+        prepare = lambda: open_session_cdp(bp, timer, cancel)
+        interact = lambda s: interact_cdp(s, rng, timer, cancel)
+        teardown = close_session_cdp
+    else:
+        prepare = lambda: asyncio.to_thread(open_session, bp, timer, cancel)
+        interact = lambda s: asyncio.to_thread(interact_session, s, rng, timer, cancel)
+        teardown = lambda s: asyncio.to_thread(close_session, s)
+    return await get_run_pipeline().run(prepare, interact, teardown, lane, cancel, mark=timer.mark)
+
+
+class FlowSession:
+    """A run's browser between stages: its driver (or CDP page), screencast and "loaded" screenshot."""
+
+    def __init__(self, browser, tracer: Tracer | None):
+        self.browser = browser
+        self.tracer = tracer
+        self.recorder = None
+        self.url_loaded = None
+
+    def start_recording(self, start):
+        """Start a screencast with start(recorder); without one, steps are screenshotted."""
+        recorder = Screencast(SCREENSHOT_DIR)
+        try:
+            start(recorder)
+        except Exception:
+            logger.warning("screencast unavailable; taking screenshots", exc_info=True)
+        else:
+            self.recorder = recorder
+
+    def screenshots(self, typed, validated, result) -> dict:
+        return {"loaded": self.url_loaded, "typed": typed, "validated": validated, "result": result}
+
+    def finish(self, outcome: dict) -> dict:
+        if self.recorder is not None:
+            outcome["screenshots"] = {}
+            outcome["screencast"] = self.recorder.link      # encoded after the browser closes
+        return outcome
+
+
+def snapshot(session: FlowSession, label: str) -> str | None:
+    """Screenshot the step, or with a screencast running just mark it on the recording."""
+    if session.recorder is not None:
+        session.recorder.mark(label)
+        return None
+    return save_screenshot(session.browser, label)
+
+
+async def snapshot_async(session: FlowSession, label: str) -> str | None:
+    if session.recorder is not None:
+        session.recorder.mark(label)
+        return None
+    return await save_screenshot_async(session.browser, label)
+
+
+def drive_browser(bp: BrowserProfile, rng: random.Random, timer: PhaseTimer, cancel: CancelToken) -> dict:
+    """Blocking Selenium half of the flow; runs in a worker thread."""
+    session = open_session(bp, timer, cancel)
+    try:
+        return interact_session(session, rng, timer, cancel)
+    finally:
+        close_session(session)
+
+
+def open_session(bp: BrowserProfile, timer: PhaseTimer, cancel: CancelToken) -> FlowSession:
+    """Prepare stage: a spoofed driver with the target loaded."""
+
+    # --- Spoofed Selenium driver in the cloud ---
+    tracer = current_tracer()
+    driver = create_cloud_driver(bp, trace=tracer is not None)
+    timer.mark("launch")
+    session = FlowSession(driver, tracer)
+
+    try:
+        if CAPTURE_MODE == "screencast":
+            session.start_recording(lambda recorder: recorder.start(driver))
+
+        cancel.check()
+        if cancel.remaining() is not None:
+            driver.set_page_load_timeout(max(1, cancel.remaining()))
+        try:
+            driver.get(TARGET_URL)
+        except TimeoutException:
+            cancel.check()      # the load timeout is the run's deadline: report it as cancelled
+            raise
+        timer.mark("load")
+
+        session.url_loaded = snapshot(session, "loaded")
+        timer.mark("screenshots")
+    except BaseException:
+        close_session(session)
+        raise
+    return session
+
+
+def interact_session(session: FlowSession, rng: random.Random, timer: PhaseTimer, cancel: CancelToken) -> dict:
+    """Interact stage: solve the CAPTCHA on the loaded page."""
+    driver = session.browser
+    cancel.check()
+
+    # Find input box, move mouse, click
+    box, bx, by = find_box(driver, rng, cancel)
+    timer.mark("find_box")
+    cancel.check()
+
+    # Type random character
+    char = rng.choice(string.ascii_letters)
+    box.send_keys(char)
+    timer.mark("type")
+
+    url_typed = snapshot(session, "typed")
+    timer.mark("screenshots")
+    cancel.check()
+
+    # Click validate
+    validate(driver, bx, by, rng, cancel)
+    timer.mark("validate")
+
+    url_validated = snapshot(session, "validated")
+    timer.mark("screenshots")
+    with span("sleep", seconds=1.0):
+        cancel.sleep(1.0)
+
+    # Scan result value
+    result = wait_for_results(driver, cancel)
+    timer.mark("wait_result")
+
+    url_result = snapshot(session, "result")
+    timer.mark("screenshots")
+
+    return session.finish({
+        "char_used": char,
+        "title": driver.title,
+        "captcha_result": result,
+        "timings": timer.total(),
+        "screenshots": session.screenshots(url_typed, url_validated, url_result),
+    })
+
+
+def close_session(session: FlowSession):
+    """Teardown stage: stop the recording, collect the browser trace and quit the driver."""
+    if session.recorder is not None:
+        session.recorder.stop()
+    if session.tracer is not None:
+        try:
+            session.tracer.collect_browser(session.browser)
+        except Exception:
+            logger.warning("could not collect the browser trace", exc_info=True)
+    release_cloud_driver(session.browser)
+
+
+async def drive_browser_cdp(bp: BrowserProfile, rng: random.Random, timer: PhaseTimer,
+                            cancel: CancelToken) -> dict:
+    """drive_browser() over a direct DevTools connection (DRIVER_BACKEND=cdp); runs on the event loop."""
+    session = await open_session_cdp(bp, timer, cancel)
+    try:
+        return await interact_cdp(session, rng, timer, cancel)
+    finally:
+        await close_session_cdp(session)
+
+
+async def open_session_cdp(bp: BrowserProfile, timer: PhaseTimer, cancel: CancelToken) -> FlowSession:
+    tracer = current_tracer()
+    page = await create_cdp_page(bp, trace=tracer is not None)
+    timer.mark("launch")
+    session = FlowSession(page, tracer)
+
+    try:
+        if CAPTURE_MODE == "screencast":
+            session.start_recording(lambda recorder: recorder.start_socket(page.socket_url))
+
+        cancel.check()
+        remaining = cancel.remaining()
+        try:
+            await page.navigate(TARGET_URL, timeout=RUN_DEADLINE_SECONDS if remaining is None else max(1, remaining))
+        except CDPError:
+            cancel.check()      # the load timeout is the run's deadline: report it as cancelled
+            raise
+        timer.mark("load")
+
+        session.url_loaded = await snapshot_async(session, "loaded")
+        timer.mark("screenshots")
+    except BaseException:
+        await close_session_cdp(session)
+        raise
+    return session
+
+
+async def interact_cdp(session: FlowSession, rng: random.Random, timer: PhaseTimer, cancel: CancelToken) -> dict:
+    page = session.browser
+    cancel.check()
+
+    # Find input box, move mouse, click
+    bx, by = await find_box_async(page, rng, cancel)
+    timer.mark("find_box")
+    cancel.check()
+
+    # Type random character
+    char = rng.choice(string.ascii_letters)
+    await page.type_text(".captcha-input", char)
+    timer.mark("type")
+
+    url_typed = await snapshot_async(session, "typed")
+    timer.mark("screenshots")
+    cancel.check()
+
+    # Click validate
+    await validate_async(page, bx, by, rng, cancel)
+    timer.mark("validate")
+
+    url_validated = await snapshot_async(session, "validated")
+    timer.mark("screenshots")
+    with span("sleep", seconds=1.0):
+        await cancel.sleep_async(1.0)
+
+    # Scan result value
+    result = await wait_for_results_async(page, cancel)
+    timer.mark("wait_result")
+
+    url_result = await snapshot_async(session, "result")
+    timer.mark("screenshots")
+
+    return session.finish({
+        "char_used": char,
+        "title": await page.title(),
+        "captcha_result": result,
+        "timings": timer.total(),
+        "screenshots": session.screenshots(url_typed, url_validated, url_result),
+    })
+
+
+async def close_session_cdp(session: FlowSession):
+    page = session.browser
+    if session.recorder is not None:
+        session.recorder.stop()
+    if session.tracer is not None:
+        try:
+            before = time.monotonic()
+            metrics = (await page.send("Performance.getMetrics"))["metrics"]
+            session.tracer.add_browser_metrics(metrics, before, time.monotonic())
+            session.tracer.add_browser_events(await page.collect_trace())
+        except Exception:
+            logger.warning("could not collect the browser trace", exc_info=True)
+    await release_cdp_page(page)
+
+
+async def perform_run(profile: ProfileModel, lane: str = "interactive", bounded: bool = True,
+                      on_admitted=None, cancel: CancelToken | None = None, profiling: bool = False,
+                      trace: bool = False) -> dict:
+    """Wait for a browser slot in `lane`, run the flow and record it.
+
+    Raises AdmissionRejected when `bounded` and the wait queue is full, and
+    FlowCancelled when `cancel` fires while queued or running. Without a
+    token the run gets RUN_DEADLINE_SECONDS from the moment it is admitted.
+    With `profiling` / `trace`, the run is profiled / traced and the result
+    links to the output.
+    """
+    run_id = uuid.uuid4().hex
+    profile_to = profile_path(SCREENSHOT_DIR, run_id) if profiling else None
+    tracer = Tracer(run_id) if trace else None
+    timer = PhaseTimer()
+    seed = profile.seed if profile.seed is not None else secrets.randbits(32)
+    rng = random.Random(seed)
+    bp = BrowserProfile(**profile.model_dump(exclude={"seed"}))
+
+    store = get_run_store()
+    with log_context(run_id=run_id, seed=seed, lane=lane), tracing(tracer):
+        async with get_admission_controller().slot(lane, bounded, cancel):
+            timer.mark("queue")
+            if cancel is None:
+                cancel = CancelToken(RUN_DEADLINE_SECONDS)
+            if on_admitted:
+                on_admitted()
+
+            log_profile_dump(logger, bp)
+
+            try:
+                outcome = await execute_flow(bp, rng, timer, cancel, profile_to, lane)
+            except Exception as e:
+                status = "cancelled" if isinstance(e, FlowCancelled) else "failed"
+                timings = timer.total()
+                error = f"{type(e).__name__}: {e}"
+                links = await asyncio.to_thread(_debug_artifacts, run_id, profile_to, tracer)
+                store.record(run_record(run_id, bp, seed, status, timings=timings, error=error, artifacts=links))
+                RUNS.inc(status=status, lane=lane)
+                RUN_SECONDS.observe(timings["total"] / 1000, lane=lane)
+                if status == "cancelled":
+                    logger.info("run finished", extra={"status": status, "error": error, "timings": timings})
+                else:
+                    logger.warning("run finished", exc_info=True, extra={"status": status, "timings": timings})
+                raise
+
+        links = await asyncio.to_thread(_debug_artifacts, run_id, profile_to, tracer)
+        outcome.update(links)
+        artifacts = {**outcome["screenshots"], **links}
+        if "screencast" in outcome:
+            artifacts["screencast"] = outcome["screencast"]
+        store.record(run_record(run_id, bp, seed, "ok", result=outcome["captcha_result"],
+                                timings=outcome["timings"], artifacts=artifacts))
+        RUNS.inc(status="ok", lane=lane)
+        RUN_SECONDS.observe(outcome["timings"]["total"] / 1000, lane=lane)
+        logger.info("run finished", extra={"status": "ok", "result_type": outcome["captcha_result"].get("type"),
+                                           "timings": outcome["timings"]})
+
+    return {"status": "ok", "run_id": run_id, "seed": seed, **outcome}
+
+
+def _debug_artifacts(run_id: str, profile_to: str | None, tracer: Tracer | None) -> dict:
+    """Write the run's trace, if traced, and return links to its profile and trace.
+
+    A requested profile may be missing: the run finds the profiler busy.
+    """
+    links = {}
+    if profile_to is not None and os.path.exists(profile_to):
+        links["profile"] = f"/runs/{run_id}/profile"
+    if tracer is not None:
+        tracer.write(trace_path(SCREENSHOT_DIR, run_id))
+        links["trace"] = f"/runs/{run_id}/trace"
+    return links
+
+
+async def dispatch_run(profile: ProfileModel, lane: str, cancel: CancelToken,
+                       profiling: bool = False, trace: bool = False) -> dict:
+    """Run the flow here, or in queue mode hand it to a worker process and wait for the result."""
+    if EXECUTION_MODE != "queue":
+        return await perform_run(profile, lane, cancel=cancel, profiling=profiling, trace=trace)
+
+    queue = get_job_queue()
+    pending = await asyncio.to_thread(queue.pending, "run")
+    if pending >= QUEUE_MAX_PENDING_RUNS:
+        REJECTED.inc(lane=lane)
+        raise AdmissionRejected(await asyncio.to_thread(queue.retry_after, pending))
+
+    deadline = time.time() + cancel.remaining() if cancel.remaining() is not None else None
+    payload = profile.model_dump()
+    if current_trace() is not None:
+        payload["traceparent"] = current_trace().traceparent
+    if profiling:
+        payload["profiling"] = True
+    if trace:
+        payload["trace"] = True
+    _, [item_id] = await asyncio.to_thread(queue.enqueue, [payload], lane, None, deadline, "run")
+    try:
+        while True:
+            await asyncio.sleep(QUEUE_POLL_SECONDS)
+            cancel.check()
+            item = await asyncio.to_thread(queue.get, item_id)
+            if item["state"] in ("queued", "running"):
+                continue
+
+            waited = item["started_at"] - item["created_at"] if item["started_at"] else None
+            if waited is not None:
+                JOB_QUEUE_WAIT.observe(waited, lane=lane)
+            if item["state"] == "ok":
+                result = item["result"]
+                result["timings"]["job_queue"] = round(waited * 1000, 1)
+                return result
+            if item["state"] == "cancelled":
+                raise FlowCancelled(item["error"])
+            raise RuntimeError(item["error"])
+    except (FlowCancelled, asyncio.CancelledError):
+        await asyncio.to_thread(queue.request_cancel, item_id)
+        raise
+
+
+def _check_lane(lane: str):
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"'lane' must be one of {list(LANES)}")
+
+
+def _busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _idempotent(key: str, response: Response, fingerprint: str, start, cancel: CancelToken | None = None):
+    """Start or join the work for `key`; returns (awaitable result, callback for when this client leaves)."""
+    cache = get_idempotency_cache()
+    try:
+        entry, replayed = cache.begin(key, fingerprint, start, cancel)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return cache.wait(entry), entry.attach()
+
+
+def _server_timing(result: dict, started: float, replayed: bool) -> dict:
+    """Milliseconds this request spent queued (browser slot, plus the job queue in queue mode),
+    in the flow itself, and in total, for the Server-Timing header."""
+    total = (time.perf_counter() - started) * 1000
+    if replayed:
+        return {"total": total}     # the run's phases were spent on an earlier request
+    timings = result["timings"]
+    queue = timings.get("queue", 0.0) + timings.get("job_queue", 0.0)
+    return {"queue": queue, "browser": timings["total"] - timings.get("queue", 0.0), "total": total}
+
+
+async def watch_disconnect(request: Request, on_disconnect):
+    """Call `on_disconnect()` as soon as the client hangs up."""
+    while True:
+        if await request.is_disconnected():
+            logger.info("client disconnected")
+            on_disconnect()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
 
 
 @app.post("/run_flow")
-async def run_flow(profile: ProfileModel):
+async def run_flow(profile: ProfileModel, request: Request, response: Response, lane: str = "interactive"):
     """
     Full end-to-end flow:
     - TLS spoofing (using tls_client_name)
@@ -107,66 +856,119 @@ async def run_flow(profile: ProfileModel):
     - Move mouse to box, type, click validate
     - Scan text and return it
     - Return screenshots URLs of each step
+    - Return per-phase timings (ms), including time queued for a browser
+    - Record the run in the local run store
+
+    Every random choice in the run (path, jitter, click timing, typed char)
+    comes from one RNG seeded by `seed`, so resending the same profile and
+    seed replays the run exactly.
+
+    Runs wait for a browser slot in `lane` ("interactive" ahead of "bulk");
+    when the wait queue is full the request gets 429 with Retry-After.
+
+    The run is abandoned (and its browser released) when the client
+    disconnects or the X-Request-Deadline budget (seconds, default
+    RUN_DEADLINE_SECONDS) runs out, queue time included.
+
+    With an Idempotency-Key header, a retry of the same request joins the
+    run still in flight or gets its stored result instead of starting a new
+    browser; a keyed run survives its client leaving as long as a retry
+    arrives within the grace period. Its deadline is X-Request-Deadline plus
+    IDEMPOTENCY_GRACE_SECONDS for the same reason: a client that gives up at
+    its deadline and retries at once rejoins the run instead of starting
+    another, which also means the first request may answer late.
+
+    With X-Profile: 1 (or ?profile=1) on a server started with RUN_PROFILING=1,
+    the run is profiled and the response links to the stats under "profile"
+    (refused with 403 under DRIVER_BACKEND=cdp).
+    Likewise X-Trace: 1 (or ?trace=1) with RUN_TRACING=1 links a Chrome
+    trace-event file of the run under "trace".
+    """
+    _check_lane(lane)
+    profiling = profiling_requested(request)
+    if profiling and not RUN_PROFILING:
+        raise HTTPException(status_code=403, detail="profiling is disabled on this server (RUN_PROFILING=1)")
+    if profiling and DRIVER_BACKEND == "cdp":
+        # Every run shares the event loop, so cProfile can't separate this one from the others
+        raise HTTPException(status_code=403, detail="profiling is not available with DRIVER_BACKEND=cdp")
+    trace = tracing_requested(request)
+    if trace and not RUN_TRACING:
+        raise HTTPException(status_code=403, detail="tracing is disabled on this server (RUN_TRACING=1)")
+    key = request.headers.get("Idempotency-Key")
+    deadline = request_timeout(request.headers.get("X-Request-Deadline"))
+    if key:
+        # Outlive the client's own timeout by the rejoin grace, so its retry finds the run still going
+        deadline += IDEMPOTENCY_GRACE_SECONDS
+    cancel = CancelToken(deadline)
+    started = time.perf_counter()
+    trace_ctx = parse_traceparent(request.headers.get("traceparent")) or new_trace()
+
+    with trace_scope(trace_ctx):
+        if key:
+            fingerprint = request_fingerprint("/run_flow", lane, profile.model_dump())
+            work, leave = _idempotent(key, response, fingerprint,
+                                      lambda: dispatch_run(profile, lane, cancel, profiling, trace), cancel)
+        else:
+            work, leave = dispatch_run(profile, lane, cancel, profiling, trace), lambda: cancel.cancel(CLIENT_DISCONNECTED)
+
+        watcher = asyncio.create_task(watch_disconnect(request, leave))
+        try:
+            result = await work
+        except AdmissionRejected as e:
+            raise _busy(e)
+        except FlowCancelled as e:
+            raise HTTPException(status_code=504 if e.reason == DEADLINE_EXCEEDED else 499, detail=e.reason)
+        finally:
+            watcher.cancel()
+            leave()
+
+    replayed = response.headers.get("Idempotent-Replayed") == "true"
+    response.headers["Server-Timing"] = format_server_timing(_server_timing(result, started, replayed))
+    response.headers["traceresponse"] = trace_ctx.traceparent
+    return result
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(job: JobRequest, request: Request, response: Response):
+    """Queue a batch of profiles in the bulk lane; poll GET /jobs/{job_id} for results.
+
+    A repeat submission with the same Idempotency-Key returns the original job.
     """
-    bp = BrowserProfile(**profile.model_dump())
+    if not job.profiles:
+        raise HTTPException(status_code=400, detail="'profiles' is empty")
 
-    print("\n[Cloud] Running flow with profile:")
-    for k, v in bp.__dict__.items():
-        print(f"{k}: {v}")
-    print("=================================\n")
+    async def runner(profile, on_admitted):
+        return await perform_run(profile, "bulk", bounded=False, on_admitted=on_admitted)
 
-    # --- TLS spoofing (AsyncSession with tls_client_name) ---
-    session = AsyncSession(client_identifier=bp.tls_client_name)
-    async with session:
-        # Cheap handshake to apply fingerprint
-        await session.get("https://example.com")
-    print("[Cloud] TLS fingerprint applied.")
+    async def submit():
+        if EXECUTION_MODE == "queue":
+            queue = get_job_queue()
+            pending = await asyncio.to_thread(queue.pending, "job")
+            if pending + len(job.profiles) > JOB_BACKLOG_SIZE:
+                raise AdmissionRejected(await asyncio.to_thread(queue.retry_after, pending))
+            job_id, _ = await asyncio.to_thread(queue.enqueue, [p.model_dump() for p in job.profiles], "bulk")
+            return {"job_id": job_id, "status": "queued", "total": len(job.profiles)}
 
-    # --- Spoofed Selenium driver in the cloud ---
-    driver = create_cloud_driver(bp)
-    print("[Cloud] Browser launched with spoofed profile.")
+        submitted = get_job_registry().submit(job.profiles, runner)
+        return {"job_id": submitted.id, "status": submitted.status, "total": len(job.profiles)}
 
+    key = request.headers.get("Idempotency-Key")
     try:
-        driver.get("https://group4.kokax.com/")
-        print(f"[Cloud] Loaded https://group4.kokax.com/")
-
-        url_loaded = save_screenshot(driver, "loaded")
-        
-        # Find input box, move mouse, click
-        box, bx, by = find_box(driver)
-
-        # Type random character
-        char = random.choice(string.ascii_letters)
-        box.send_keys(char)
-
-        url_typed = save_screenshot(driver, "typed")
-
-        # Click validate
-        validate(driver, bx, by)
-
-        url_validated = save_screenshot(driver, "validated")
-        time.sleep(1.0)
-        
-        # Scan result value
-        result = wait_for_results(driver)
-        print(f"[Cloud] CAPTCHA Result:", result)
-
-        url_result = save_screenshot(driver, "result")
-
-
-        return {
-            "status": "ok",
-            "char_used": char,
-            "title": driver.title,
-            "captcha_result": result,
-            "screenshots": {
-                "loaded": url_loaded,
-                "typed": url_typed,
-                "validated": url_validated,
-                "result": url_result
-            }
-        }
-
-    finally:
-        driver.quit()
-        print("[Cloud] Browser closed.")
+        if key:
+            work, _ = _idempotent(key, response, request_fingerprint("/jobs", job.model_dump()), submit)
+            return await work
+        return await submit()
+    except AdmissionRejected as e:
+        raise _busy(e)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    if EXECUTION_MODE == "queue":
+        status = get_job_queue().job_status(job_id)
+    else:
+        job = get_job_registry().get(job_id)
+        status = job.to_dict() if job else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return status
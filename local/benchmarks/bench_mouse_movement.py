@@ -0,0 +1,112 @@
+# bench_mouse_movement.py
+
+# Compares the per-step interaction path (one W3C actions request per step)
+# with the single compiled action chain on a local test page.
+#
+# Run from local/:
+#     python -m benchmarks.bench_mouse_movement --iterations 20
+
+import argparse
+import json
+import statistics
+import time
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+
+from interactions.mouse_movement import (
+    humanlike_click,
+    humanlike_mouse_movement,
+    humanlike_move_and_click,
+)
+
+TEST_PAGE = """data:text/html,
+<html><body style="margin:0">
+  <input class="captcha-input" style="position:absolute;left:300px;top:200px;width:200px;height:30px">
+  <button class="btn-primary" style="position:absolute;left:340px;top:300px">Validate</button>
+</body></html>
+"""
+
+
+def per_step(driver, element):
+    humanlike_mouse_movement(driver, element)
+    humanlike_click(driver)
+
+
+def single_chain(driver, element):
+    humanlike_move_and_click(driver, element)
+
+
+class CommandCounter:
+    """Counts every WebDriver command issued through driver.execute."""
+
+    def __init__(self, driver):
+        self.count = 0
+        self._execute = driver.execute
+
+        def counting_execute(*args, **kwargs):
+            self.count += 1
+            return self._execute(*args, **kwargs)
+
+        driver.execute = counting_execute
+
+
+def run(driver, counter, fn, iterations):
+    elements = [
+        driver.find_element(By.CSS_SELECTOR, ".captcha-input"),
+        driver.find_element(By.CSS_SELECTOR, ".btn-primary"),
+    ]
+
+    timings = []
+    counter.count = 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(driver, elements[i % 2])
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "iterations": iterations,
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "max_ms": round(max(timings) * 1000, 2),
+        "requests_per_click": counter.count / iterations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-step vs single-chain mouse movement")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    opts = Options()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--window-size=1200,850")
+    driver = webdriver.Chrome(options=opts)
+
+    try:
+        driver.get(TEST_PAGE)
+        counter = CommandCounter(driver)
+
+        results = {
+            "per_step": run(driver, counter, per_step, args.iterations),
+            "single_chain": run(driver, counter, single_chain, args.iterations),
+        }
+    finally:
+        driver.quit()
+
+    for name, r in results.items():
+        print(f"{name:>13}: mean {r['mean_ms']:8.2f} ms  p50 {r['p50_ms']:8.2f} ms  "
+              f"max {r['max_ms']:8.2f} ms  {r['requests_per_click']:.0f} requests/click")
+
+    speedup = results["per_step"]["mean_ms"] / results["single_chain"]["mean_ms"]
+    print(f"single_chain is {speedup:.2f}x faster per move+click")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
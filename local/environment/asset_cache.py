@@ -0,0 +1,573 @@
+# asset_cache.py
+
+# Local caching forward proxy shared by every browser on the host. Static
+# assets of the target page (scripts, styles, images, fonts) are kept in a
+# bounded on-disk LRU so fresh Chrome profiles don't re-download them.
+#
+# HTTPS is only cacheable when the proxy can terminate TLS itself, which needs
+# the optional `cryptography` package; without it CONNECT is tunnelled as-is.
+# The intercepting CA is kept in <ASSET_CACHE_DIR>_certs/ca.pem, so Chrome can
+# be told to trust exactly that key (asset_cache_spki()) instead of ignoring
+# certificate errors for every origin, also when the proxy runs separately.
+#
+# The same file lives in cloud/environment/ and local/environment/ (each tree
+# runs on its own); keep the two copies identical.
+
+import argparse
+import base64
+import datetime
+import hashlib
+import http.client
+import json
+import os
+import select
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+
+# ---- Config (env overrides) ----
+
+ASSET_CACHE_ENABLED = os.environ.get("ASSET_CACHE", "0") == "1"
+ASSET_CACHE_PROXY = os.environ.get("ASSET_CACHE_PROXY")     # "host:port" of an already running proxy
+ASSET_CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", "/tmp/asset_cache")
+ASSET_CACHE_MAX_MB = int(os.environ.get("ASSET_CACHE_MAX_MB", "512"))
+
+MAX_ENTRY_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL = 24 * 3600
+UPSTREAM_TIMEOUT = 20
+CA_FILE = "ca.pem"
+
+STATIC_TYPES = ("text/css", "javascript", "image/", "font/", "application/font", "application/wasm")
+STATIC_EXTENSIONS = (".js", ".mjs", ".css", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp",
+                     ".ico", ".woff", ".woff2", ".ttf", ".otf", ".wasm")
+
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+              "proxy-connection", "te", "trailers", "transfer-encoding", "upgrade"}
+
+
+# ---- On-disk LRU ----
+
+class DiskLRUCache:
+    """Size-bounded response cache, one file per entry, evicted least-recently-used first."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._index = OrderedDict()       # key hash -> entry size, oldest first
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0,
+                      "evictions": 0, "bytes_from_cache": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name, st.st_size))
+
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _path(self, h):
+        return os.path.join(self.directory, h)
+
+    @staticmethod
+    def key_hash(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def get(self, url):
+        h = self.key_hash(url)
+        with self._lock:
+            if h not in self._index:
+                self.stats["misses"] += 1
+                return None
+            self._index.move_to_end(h)
+
+        try:
+            with open(self._path(h), "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            self._drop(h)
+            return None
+
+        if meta["expires"] < time.time():
+            self._drop(h)
+            self.count("misses")
+            return None
+
+        os.utime(self._path(h))    # keeps LRU order across restarts
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["bytes_from_cache"] += len(body)
+        return meta["status"], meta["reason"], meta["headers"], body
+
+    def put(self, url, status, reason, headers, body, ttl):
+        h = self.key_hash(url)
+        meta = {"url": url, "status": status, "reason": reason,
+                "headers": headers, "expires": time.time() + ttl}
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(body)
+        size = os.path.getsize(tmp)
+        os.replace(tmp, self._path(h))
+
+        with self._lock:
+            self.total_bytes += size - self._index.pop(h, 0)
+            self._index[h] = size
+            self.stats["stored"] += 1
+            self._evict()
+
+    def _drop(self, h):
+        with self._lock:
+            self.total_bytes -= self._index.pop(h, 0)
+        try:
+            os.remove(self._path(h))
+        except OSError:
+            pass
+
+    def _evict(self):
+        # Caller holds the lock (or is the constructor)
+        while self.total_bytes > self.max_bytes and self._index:
+            h, size = self._index.popitem(last=False)
+            self.total_bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(h))
+            except OSError:
+                pass
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._index),
+                "size_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# ---- TLS interception (optional) ----
+
+class _CertAuthority:
+    """CA that mints per-host leaf certs so HTTPS assets can be cached.
+
+    Created once per cache directory and reused, so its SPKI pin stays valid
+    across restarts and for browsers started by other processes.
+    """
+
+    def __init__(self, directory):
+        self.directory = _ca_directory(directory)
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        os.chmod(self.directory, 0o700)     # holds the CA key; also covers directories made before
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+        self._key, self._ca_cert = self._load_or_create(os.path.join(self.directory, CA_FILE))
+        self._ca_name = self._ca_cert.subject
+
+    @property
+    def spki(self):
+        return _spki_hash(self._ca_cert)
+
+    def _load_or_create(self, path):
+        loaded = _load_ca(path)
+        if loaded is not None:
+            return loaded
+
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "asset-cache local CA")])
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(_utc(-3600)).not_valid_after(_utc(30 * 86400))
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .sign(key, hashes.SHA256())
+        )
+
+        # Private key: owner-only, and published with link() so a concurrent starter either wins or reads ours
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ))
+        try:
+            if os.path.exists(path):
+                os.remove(path)         # expired or unreadable
+            os.link(tmp, path)
+        except FileExistsError:
+            return _load_ca(path) or (key, cert)
+        finally:
+            os.remove(tmp)
+        return key, cert
+
+    def context_for(self, host):
+        with self._lock:
+            ctx = self._contexts.get(host)
+            if ctx is None:
+                ctx = self._contexts[host] = self._build_context(host)
+            return ctx
+
+    def _build_context(self, host):
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)]))
+            .issuer_name(self._ca_name)
+            .public_key(self._key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(_utc(-3600)).not_valid_after(_utc(30 * 86400))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(host)]), critical=False)
+            .sign(self._key, hashes.SHA256())
+        )
+
+        # load_cert_chain() only reads files: stage the chain (it carries the CA key) in a
+        # private temp dir that is gone once the context has it
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        with tempfile.TemporaryDirectory(prefix="asset-cache-") as tmp:
+            cert_path = os.path.join(tmp, "chain.pem")
+            fd = os.open(cert_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(cert.public_bytes(serialization.Encoding.PEM))
+                f.write(self._ca_cert.public_bytes(serialization.Encoding.PEM))
+                f.write(self._key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption(),
+                ))
+            ctx.load_cert_chain(cert_path)
+        return ctx
+
+
+def _utc(offset_seconds):
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=offset_seconds)
+
+
+def _ca_directory(directory):
+    return directory.rstrip("/") + "_certs"
+
+
+def _load_ca(path):
+    """(key, cert) from a CA file with at least a day left, or None."""
+    try:
+        with open(path, "rb") as f:
+            pem = f.read()
+        cert = x509.load_pem_x509_certificate(pem)
+        key = serialization.load_pem_private_key(pem, None)
+    except (OSError, ValueError):
+        return None
+    not_after = getattr(cert, "not_valid_after_utc", None) or \
+        cert.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+    return (key, cert) if not_after > _utc(86400) else None
+
+
+def _spki_hash(cert):
+    """base64(SHA-256(SubjectPublicKeyInfo)), the form --ignore-certificate-errors-spki-list takes."""
+    spki = cert.public_key().public_bytes(serialization.Encoding.DER,
+                                          serialization.PublicFormat.SubjectPublicKeyInfo)
+    return base64.b64encode(hashlib.sha256(spki).digest()).decode()
+
+
+# ---- Proxy ----
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "asset-cache"
+    tunnel_host = None     # set once a CONNECT has been intercepted
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_CONNECT(self):
+        host = self.path
+        ca = self.server.ca
+        if ca is None:
+            return self._blind_tunnel(host)
+
+        self.send_response(200, "Connection Established")
+        self.end_headers()
+
+        hostname = host.rsplit(":", 1)[0]
+        try:
+            tls = ca.context_for(hostname).wrap_socket(self.connection, server_side=True)
+        except (ssl.SSLError, OSError):
+            self.close_connection = True
+            return
+
+        # Keep serving requests from inside the decrypted tunnel
+        self.connection = tls
+        self.rfile = tls.makefile("rb", self.rbufsize)
+        self.wfile = tls.makefile("wb", 0)
+        self.tunnel_host = host
+        self.close_connection = False
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def _blind_tunnel(self, host):
+        hostname, _, port = host.rpartition(":")
+        try:
+            upstream = socket.create_connection((hostname, int(port or 443)), timeout=UPSTREAM_TIMEOUT)
+        except OSError:
+            self.send_error(502)
+            return
+
+        self.server.cache.count("bypassed")
+        self.send_response(200, "Connection Established")
+        self.end_headers()
+
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable, _, errored = select.select(sockets, [], sockets, 60)
+                if errored or not readable:
+                    break
+                for s in readable:
+                    data = s.recv(65536)
+                    if not data:
+                        return
+                    (upstream if s is self.connection else self.connection).sendall(data)
+        finally:
+            upstream.close()
+            self.close_connection = True
+
+    def _target_url(self):
+        if self.tunnel_host:
+            host = self.tunnel_host
+            if host.endswith(":443"):
+                host = host[:-4]
+            return f"https://{host}{self.path}"
+        return self.path
+
+    def do_GET(self):
+        self._proxy(cacheable=("range" not in self.headers))
+
+    def do_HEAD(self):
+        self._proxy(cacheable=False)
+
+    def do_POST(self):
+        self._proxy(cacheable=False)
+
+    do_PUT = do_POST
+    do_DELETE = do_POST
+    do_PATCH = do_POST
+    do_OPTIONS = do_POST
+
+    def _proxy(self, cacheable):
+        url = self._target_url()
+        cache = self.server.cache
+
+        if cacheable:
+            hit = cache.get(url)
+            if hit is not None:
+                status, reason, headers, body = hit
+                return self._reply(status, reason, headers, body, cache_state="HIT")
+        else:
+            cache.count("bypassed")
+
+        try:
+            status, reason, headers, body = self._fetch(url)
+        except (OSError, http.client.HTTPException):
+            self.send_error(502)
+            return
+
+        ttl = _cache_ttl(self.command, url, status, headers, body) if cacheable else None
+        if ttl:
+            cache.put(url, status, reason, headers, body, ttl)
+
+        self._reply(status, reason, headers, body, cache_state="MISS")
+
+    def _fetch(self, url):
+        parts = urlsplit(url)
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(parts.netloc, timeout=UPSTREAM_TIMEOUT)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = self.rfile.read(length) if length else None
+
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        try:
+            conn.request(self.command, path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+            out_headers = [(k, v) for k, v in resp.getheaders() if k.lower() not in HOP_BY_HOP]
+            return resp.status, resp.reason, out_headers, body
+        finally:
+            conn.close()
+
+    def _reply(self, status, reason, headers, body, cache_state):
+        self.send_response(status, reason)
+        for k, v in headers:
+            if k.lower() != "content-length":
+                self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Asset-Cache", cache_state)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+def _cache_ttl(method, url, status, headers, body):
+    """Return how long a response may be cached for, or None if it shouldn't be."""
+    if method != "GET" or status != 200 or len(body) > MAX_ENTRY_BYTES:
+        return None
+
+    h = {k.lower(): v for k, v in headers}
+    if "set-cookie" in h or h.get("vary", "").strip() == "*":
+        return None
+
+    cache_control = h.get("cache-control", "").lower()
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+
+    content_type = h.get("content-type", "").lower()
+    path = urlsplit(url).path.lower()
+    if not (any(t in content_type for t in STATIC_TYPES) or path.endswith(STATIC_EXTENSIONS)):
+        return None
+
+    for directive in cache_control.split(","):
+        name, _, value = directive.strip().partition("=")
+        if name == "max-age" and value.isdigit():
+            return int(value) or None
+
+    return DEFAULT_TTL
+
+
+class AssetCacheProxy:
+    """Threaded forward proxy in front of a DiskLRUCache."""
+
+    def __init__(self, host="127.0.0.1", port=0, directory=ASSET_CACHE_DIR, max_mb=ASSET_CACHE_MAX_MB):
+        self.cache = DiskLRUCache(directory, max_mb * 1024 * 1024)
+        self.server = ThreadingHTTPServer((host, port), _ProxyHandler)
+        self.server.daemon_threads = True
+        self.server.cache = self.cache
+        self.server.ca = _CertAuthority(directory) if x509 is not None else None
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def intercepts_tls(self):
+        return self.server.ca is not None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        return {"address": self.address, "intercepts_tls": self.intercepts_tls, **self.cache.snapshot()}
+
+
+# ---- Process-wide singleton ----
+
+_proxy = None
+_proxy_lock = threading.Lock()
+
+
+def get_asset_cache():
+    """Start (once) and return the in-process proxy, or None when caching is disabled."""
+    global _proxy
+    if not ASSET_CACHE_ENABLED:
+        return None
+    with _proxy_lock:
+        if _proxy is None:
+            _proxy = AssetCacheProxy().start()
+    return _proxy
+
+
+def asset_cache_address():
+    """Proxy address drivers should route through, or None to go direct."""
+    if ASSET_CACHE_PROXY:
+        return ASSET_CACHE_PROXY
+    proxy = get_asset_cache()
+    return proxy.address if proxy else None
+
+
+def asset_cache_spki():
+    """Pin of the proxy's CA for Chrome's --ignore-certificate-errors-spki-list, or None.
+
+    Chrome then accepts the re-signed asset certificates (leaf certs share the
+    CA key) and still validates every other certificate. A separately run
+    proxy (ASSET_CACHE_PROXY) is found through its CA file, so it must use the
+    same ASSET_CACHE_DIR. None when the proxy doesn't intercept TLS.
+    """
+    if ASSET_CACHE_PROXY:
+        if x509 is None:
+            return None
+        loaded = _load_ca(os.path.join(_ca_directory(ASSET_CACHE_DIR), CA_FILE))
+        return _spki_hash(loaded[1]) if loaded else None
+    proxy = get_asset_cache()
+    if proxy is None or proxy.server.ca is None:
+        return None
+    return proxy.server.ca.spki
+
+
+def asset_cache_stats():
+    if _proxy is None:
+        return {"enabled": bool(ASSET_CACHE_PROXY), "external": ASSET_CACHE_PROXY}
+    return {"enabled": True, **_proxy.stats()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the shared asset cache proxy")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--dir", default=ASSET_CACHE_DIR)
+    parser.add_argument("--max-mb", type=int, default=ASSET_CACHE_MAX_MB)
+    args = parser.parse_args()
+
+    proxy = AssetCacheProxy(args.host, args.port, args.dir, args.max_mb)
+    print(f"[Cache] Listening on {proxy.address} (TLS interception: {proxy.intercepts_tls})")
+    try:
+        proxy.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("[Cache] Final stats:", json.dumps(proxy.cache.snapshot()))
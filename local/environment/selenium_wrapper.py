@@ -1,8 +1,10 @@
 # selenium_wrapper.py
+from selenium.webdriver import ChromeOptions
 from selenium_uniq_driver import UniqDriver, HardwareType, SoftwareName, OperatingSystem
 from .webgl_spoof import build_webgl_spoof_script
+from .asset_cache import asset_cache_address
 
-def create_selenium_driver(profile):
+def create_selenium_driver(profile, headless=False):
     # Map OS → selenium-uniq-driver enum
     os_map = {
         "windows": OperatingSystem.WINDOWS,
@@ -20,11 +22,23 @@ def create_selenium_driver(profile):
         operating_system=os_map.get(profile.os, OperatingSystem.WINDOWS)
     )
 
+    if headless:
+        opts = ChromeOptions()
+        opts.add_argument("--headless=new")
+        opts.add_argument("--window-size=1200,850")
+        driver_creator.set_options(opts)
+
     # Optional proxy
+    cache_proxy = asset_cache_address()
     if profile.proxy:
         host, port, user, password = profile.proxy
         driver_creator.set_proxy(host, port, user, password, "http")
 
+    # Otherwise chain selenium-wire through the shared asset cache (optional)
+    elif cache_proxy:
+        host, port = cache_proxy.rsplit(":", 1)
+        driver_creator.set_proxy(host, port, "", "", "http")
+
     # Entropy modules activates fingerprint spoofing
     entropy = [
         "user_agent_and_language",
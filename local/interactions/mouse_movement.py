@@ -4,10 +4,64 @@ import math
 
 from selenium.webdriver.common.actions.pointer_input import PointerInput
 from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from selenium.webdriver.common.actions.mouse_button import MouseButton
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+# ---- Single action chain ----
+# The whole move + click is compiled into one W3C action sequence and sent in
+# one request, instead of one perform() (one chromedriver round-trip) per step.
+
+def element_center(driver, element):
+    # Use real viewport coordinates
+    rect = driver.execute_script(
+        "return arguments[0].getBoundingClientRect();",
+        element
+    )
+    return rect["left"] + rect["width"] / 2, rect["top"] + rect["height"] / 2
+
+
+def add_move_actions(pointer, target_x, target_y, steps=12, rng=random):
+    """Append the jittered approach onto the target, each move carrying its own duration (ms)."""
+
+    # Start at the target location
+    pointer.create_pointer_move(duration=0, x=int(target_x), y=int(target_y))
+
+    for i in range(1, steps + 1):
+        t = i / steps
+
+        x = target_x + rng.uniform(-1, 1)
+        y = target_y + rng.uniform(-1, 1)
+
+        delay = 0.015 + math.sin(t * math.pi) * 0.015
+        pointer.create_pointer_move(duration=int(delay * 1000), x=int(x), y=int(y))
+
+    # Settle
+    pointer.create_pause(0.05)
+
+
+def add_click_actions(pointer, rng=random):
+    """Append hesitation, press, hold and release."""
+    pointer.create_pause(rng.uniform(0.10, 0.20))
+    pointer.create_pointer_down(button=MouseButton.LEFT)
+    pointer.create_pause(rng.uniform(0.05, 0.10))
+    pointer.create_pointer_up(MouseButton.LEFT)
+    pointer.create_pause(0.10)
+
+
+def humanlike_move_and_click(driver, element, steps=12, rng=random):
+    target_x, target_y = element_center(driver, element)
+
+    pointer = PointerInput("mouse", "mouse")
+    add_move_actions(pointer, target_x, target_y, steps, rng)
+    add_click_actions(pointer, rng)
+
+    ActionBuilder(driver, mouse=pointer).perform()
+
+
+# ---- Per-step variants (one round-trip per step, kept for benchmarking) ----
+
 def humanlike_mouse_movement(driver, element, steps=12):
 
     # Use real viewport coordinates
@@ -66,7 +120,7 @@ def humanlike_click(driver):
     time.sleep(0.10)
 
 
-def find_box(driver):
+def find_box(driver, rng=random):
     
     # Find text insert box
     box = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.CSS_SELECTOR, ".captcha-input")))
@@ -75,13 +129,12 @@ def find_box(driver):
     time.sleep(0.2)
 
     # Move to the input box + click
-    humanlike_mouse_movement(driver, box) 
-    humanlike_click(driver)
+    humanlike_move_and_click(driver, box, rng=rng)
 
     return box
 
 
-def validate(driver):
+def validate(driver, rng=random):
 
     # Find validate button
     validate_btn = WebDriverWait(driver, 10).until(EC.visibility_of_element_located((By.CSS_SELECTOR, ".btn-primary")))
@@ -90,5 +143,4 @@ def validate(driver):
     driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", validate_btn)
     time.sleep(0.2)
 
-    humanlike_mouse_movement(driver, validate_btn)
-    humanlike_click(driver)
\ No newline at end of file
+    humanlike_move_and_click(driver, validate_btn, rng=rng)
\ No newline at end of file
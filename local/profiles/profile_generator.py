@@ -34,21 +34,21 @@ WEBGL_ANDROID = [
     ("Google Inc.", "ANGLE (Google Pixel 6, Vulkan 1.1)")
 ]
 
-def seed():
-    return random.randint(100000, 999999)
+def seed(rng=random):
+    return rng.randint(100000, 999999)
 
 # --------------------------
 # PROFILE GENERATORS
 # --------------------------
 
-def windows_chrome():
-    v = str(random.choice(CHROME_VERSIONS))
+def windows_chrome(rng=random):
+    v = str(rng.choice(CHROME_VERSIONS))
     ua = (
         f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
         f"AppleWebKit/537.36 (KHTML, like Gecko) "
         f"Chrome/{v}.0.0.0 Safari/537.36"
     )
-    vendor, renderer = random.choice(WEBGL_DESKTOP)
+    vendor, renderer = rng.choice(WEBGL_DESKTOP)
 
     return {
         "name": "chrome",
@@ -56,28 +56,28 @@ def windows_chrome():
         "os": "windows",
         "hardware_type": "desktop",
         "user_agent": ua,
-        "language": random.choice(
+        "language": rng.choice(
             ["en-US", "en-GB", "fr-FR", "de-DE", "es-ES", "it-IT", "pl-PL"]
         ),
-        "timezone": random.choice(TZ_US + TZ_EU),
-        "viewport": random.choice(DESKTOP_VIEWPORTS),
+        "timezone": rng.choice(TZ_US + TZ_EU),
+        "viewport": rng.choice(DESKTOP_VIEWPORTS),
         "webgl_vendor": vendor,
         "webgl_renderer": renderer,
-        "canvas_seed": seed(),
-        "audio_seed": seed(),
+        "canvas_seed": seed(rng),
+        "audio_seed": seed(rng),
         "tls_client_name": f"chrome_{v}",
         "proxy": None
     }
 
 
-def windows_edge():
-    v = str(random.choice(EDGE_VERSIONS))
+def windows_edge(rng=random):
+    v = str(rng.choice(EDGE_VERSIONS))
     ua = (
         f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
         f"AppleWebKit/537.36 (KHTML, like Gecko) "
         f"Chrome/{v}.0.0.0 Safari/537.36 Edg/{v}.0.0.0"
     )
-    vendor, renderer = random.choice(WEBGL_DESKTOP)
+    vendor, renderer = rng.choice(WEBGL_DESKTOP)
 
     return {
         "name": "edge",
@@ -85,26 +85,26 @@ def windows_edge():
         "os": "windows",
         "hardware_type": "desktop",
         "user_agent": ua,
-        "language": random.choice(["en-US", "en-GB"]),
-        "timezone": random.choice(TZ_US),
-        "viewport": random.choice(DESKTOP_VIEWPORTS),
+        "language": rng.choice(["en-US", "en-GB"]),
+        "timezone": rng.choice(TZ_US),
+        "viewport": rng.choice(DESKTOP_VIEWPORTS),
         "webgl_vendor": vendor,
         "webgl_renderer": renderer,
-        "canvas_seed": seed(),
-        "audio_seed": seed(),
+        "canvas_seed": seed(rng),
+        "audio_seed": seed(rng),
         "tls_client_name": f"edge_{v}",
         "proxy": None
     }
 
 
-def android_chrome():
-    v = str(random.choice(CHROME_ANDROID_VERSIONS))
+def android_chrome(rng=random):
+    v = str(rng.choice(CHROME_ANDROID_VERSIONS))
     ua = (
         f"Mozilla/5.0 (Linux; Android 13; SM-G991B) "
         f"AppleWebKit/537.36 (KHTML, like Gecko) "
         f"Chrome/{v}.0.0.0 Mobile Safari/537.36"
     )
-    vendor, renderer = random.choice(WEBGL_ANDROID)
+    vendor, renderer = rng.choice(WEBGL_ANDROID)
 
     return {
         "name": "chrome_mobile",
@@ -113,25 +113,25 @@ def android_chrome():
         "hardware_type": "mobile",
         "user_agent": ua,
         "language": "en-US",
-        "timezone": random.choice(TZ_US + TZ_EU),
-        "viewport": random.choice(ANDROID_VIEWPORTS),
+        "timezone": rng.choice(TZ_US + TZ_EU),
+        "viewport": rng.choice(ANDROID_VIEWPORTS),
         "webgl_vendor": vendor,
         "webgl_renderer": renderer,
-        "canvas_seed": seed(),
-        "audio_seed": seed(),
+        "canvas_seed": seed(rng),
+        "audio_seed": seed(rng),
         "tls_client_name": f"chrome_{v}_android",
         "proxy": None
     }
 
 
-def android_webview():
-    v = str(random.choice(ANDROID_WEBVIEW_VERSIONS))
+def android_webview(rng=random):
+    v = str(rng.choice(ANDROID_WEBVIEW_VERSIONS))
     ua = (
         f"Mozilla/5.0 (Linux; Android 11; Mi 9T Pro) "
         f"AppleWebKit/537.36 (KHTML, like Gecko) "
         f"Version/4.0 Chrome/{v}.0.0.0 Mobile Safari/537.36"
     )
-    vendor, renderer = random.choice(WEBGL_ANDROID)
+    vendor, renderer = rng.choice(WEBGL_ANDROID)
 
     return {
         "name": "android_webview",
@@ -140,12 +140,12 @@ def android_webview():
         "hardware_type": "mobile",
         "user_agent": ua,
         "language": "es-ES",
-        "timezone": random.choice(TZ_EU),
-        "viewport": random.choice(ANDROID_VIEWPORTS),
+        "timezone": rng.choice(TZ_EU),
+        "viewport": rng.choice(ANDROID_VIEWPORTS),
         "webgl_vendor": vendor,
         "webgl_renderer": renderer,
-        "canvas_seed": seed(),
-        "audio_seed": seed(),
+        "canvas_seed": seed(rng),
+        "audio_seed": seed(rng),
         "tls_client_name": f"android_webview_{v}",
         "proxy": None
     }
@@ -161,7 +161,10 @@ GENERATORS = [
     android_webview
 ]
 
-def generate_random_profile():
-    """Return ONE randomly selected profile config."""
-    gen = random.choice(GENERATORS)
-    return gen()
+def generate_random_profile(rng=random):
+    """Return ONE randomly selected profile config.
+
+    Pass a seeded random.Random to make the profile reproducible.
+    """
+    gen = rng.choice(GENERATORS)
+    return gen(rng)
@@ -4,61 +4,193 @@ import asyncio
 import random
 import string
 import argparse
+import json
+import logging
+import os
+import secrets
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
 
 from profiles.profile_generator import generate_random_profile
 from profiles.profile import BrowserProfile
 from environment.selenium_wrapper import create_selenium_driver
 from environment.tls_wrapper import create_tls_client
+from environment.asset_cache import get_asset_cache
 from interactions.mouse_movement import find_box
 from interactions.mouse_movement import validate
+from observability.log import log_context, log_profile_dump, setup_logging
+
+
+TARGET_URL = "https://group4.kokax.com/"
 
+logger = logging.getLogger("start")
+
+
+def read_result(driver, timeout=8):
+    """Return the CAPTCHA result message type and text, if one appears."""
+    try:
+        msg = WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".message"))
+        )
+        classes = msg.get_attribute("class") or ""
+        for kind in ("success", "error", "info"):
+            if kind in classes:
+                return {"type": kind, "text": msg.text.strip()}
+        return {"type": "unknown", "text": msg.text.strip()}
 
+    except Exception:
+        return {"type": "none_detected", "text": "No result message appeared"}
 
-async def main():
+
+async def run_flow(url, seed, headless=False):
+
+    # One RNG per run: identity, mouse path and typed char all replay from `seed`
+    rng = random.Random(seed)
 
     # Generate a new identity
-    raw_profile = generate_random_profile()
+    raw_profile = generate_random_profile(rng)
     profile = BrowserProfile(**raw_profile)
 
     # Display BOT realistic characteristics
-    print("\n=== Starting browser with profile ===")
-    for k, v in profile.__dict__.items():
-        print(f"{k}: {v}")
-    print("====================================\n")
+    log_profile_dump(logger, profile)
 
     # Launch Selenium
-    driver = create_selenium_driver(profile)
+    driver = create_selenium_driver(profile, headless=headless)
 
     try:
         # Load Page
-        driver.get("https://group4.kokax.com/")
-        print("Browser launched and loaded https://group4.kokax.com/")
+        driver.get(url)
+        logger.debug("page loaded", extra={"url": url})
 
         # Match TLS & enforce WebGL injection
         tls_client = await create_tls_client(profile)
-        print("TLS client initialized.")
+        logger.debug("tls client initialized")
 
         # Allow the page to render
         time.sleep(0.05)
-        
+
         # Find the box & move to it
-        box= find_box(driver)
+        box= find_box(driver, rng)
 
         # Insert random character
-        random_char = random.choice(string.ascii_letters)
+        random_char = rng.choice(string.ascii_letters)
         box.send_keys(random_char)
 
         # Validate Answer
-        validate(driver)
+        validate(driver, rng)
 
-        # Wait so you can interact with the browser
-        input("Press Enter to close the browser...")
+        return {
+            "seed": seed,
+            "profile": profile.name,
+            "os": profile.os,
+            "viewport": list(profile.viewport),
+            "char_used": random_char,
+            "captcha_result": read_result(driver),
+        }
 
     finally:
         driver.quit()
-        print("Browser closed.")
+
+
+def run_one(index, url, seed, headless):
+    """Process-pool entry point: one full flow, timed, never raising."""
+    setup_logging("local")     # no-op unless this is a fresh pool worker
+    start = time.perf_counter()
+    with log_context(run=index, seed=seed):
+        try:
+            result = asyncio.run(run_flow(url, seed, headless=headless))
+            status = "ok"
+        except Exception as e:
+            logger.warning("run failed", exc_info=True)
+            result = {"seed": seed, "error": f"{type(e).__name__}: {e}"}
+            status = "failed"
+
+    return {"run": index, "status": status, "latency_s": round(time.perf_counter() - start, 3), **result}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(runs, wall_s):
+    latencies = sorted(r["latency_s"] for r in runs if r["status"] == "ok")
+    outcomes = {}
+    for r in runs:
+        kind = r.get("captcha_result", {}).get("type", r["status"])
+        outcomes[kind] = outcomes.get(kind, 0) + 1
+
+    return {
+        "runs": len(runs),
+        "ok": sum(r["status"] == "ok" for r in runs),
+        "failed": sum(r["status"] != "ok" for r in runs),
+        "outcomes": outcomes,
+        "wall_s": round(wall_s, 3),
+        "throughput_runs_per_min": round(len(runs) / wall_s * 60, 2) if wall_s else None,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run spoofed-browser CAPTCHA flows")
+    parser.add_argument("-n", "--runs", type=int, default=1, help="Total number of runs")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="Runs executing at once")
+    parser.add_argument("--headless", action="store_true", help="Run Chrome without a window")
+    parser.add_argument("--url", default=TARGET_URL, help="Target page")
+    parser.add_argument("-o", "--output", default="results.json", help="Where to write the results summary")
+    parser.add_argument("--seed", type=int, help="Base seed; run i uses seed + i (replays a previous batch)")
+    args = parser.parse_args()
+
+    setup_logging("local")
+    base_seed = args.seed if args.seed is not None else secrets.randbits(32)
+
+    # One cache proxy in this process for every worker to share
+    cache = get_asset_cache()
+    if cache:
+        os.environ["ASSET_CACHE_PROXY"] = cache.address
+
+    concurrency = max(1, min(args.concurrency, args.runs))
+    runs = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_one, i, args.url, base_seed + i, args.headless)
+            for i in range(args.runs)
+        ]
+        for fut in as_completed(futures):
+            r = fut.result()
+            runs.append(r)
+            outcome = r.get("captcha_result", {}).get("type", r.get("error"))
+            print(f"[{len(runs)}/{args.runs}] run {r['run']}: {r['status']} in {r['latency_s']}s ({outcome})")
+    wall_s = time.perf_counter() - start
+
+    runs.sort(key=lambda r: r["run"])
+    summary = summarize(runs, wall_s)
+    summary["base_seed"] = base_seed
+    if cache:
+        summary["asset_cache"] = cache.stats()
+
+    with open(args.output, "w") as f:
+        json.dump({"summary": summary, "runs": runs}, f, indent=2)
+
+    print("\n=== Summary ===")
+    print(json.dumps(summary, indent=2))
+    print(f"Results written to {args.output}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,93 @@
+# cloud_client.py
+import os
+
+import requests
+
+from observability.trace_context import new_trace, parse_server_timing
+
+CLOUD_URL = os.environ.get("CLOUD_URL", "https://rasp-pi.fly.dev")
+REQUEST_TIMEOUT = 90
+
+
+def run_flow(profile, base_url=CLOUD_URL, timeout=REQUEST_TIMEOUT, session=None, seed=None, lane=None,
+             idempotency_key=None, trace=None):
+    """POST a BrowserProfile to the cloud server's /run_flow and return the raw response.
+
+    `seed` fixes the server-side RNG for the run; the server picks one (and
+    echoes it back) when omitted. `lane="bulk"` queues behind interactive
+    runs. A busy server answers 429 with a Retry-After header.
+
+    The server is told to give up a second before we do (X-Request-Deadline),
+    so a run we have stopped waiting for does not keep a browser busy.
+
+    Resending with the same `idempotency_key` joins the server's in-flight run
+    (or gets its stored result) instead of launching another browser. A keyed
+    run is kept going IDEMPOTENCY_GRACE_SECONDS (server side, default 10) past
+    the deadline above, so a retry right after a timeout still rejoins it.
+
+    The request carries a W3C `traceparent` from `trace` (a new trace when
+    omitted) so the server's logs for the run share our trace_id; see
+    timing_breakdown() for reading its Server-Timing answer.
+    """
+    headers = {
+        "X-Request-Deadline": str(max(1, timeout - 1)),
+        "traceparent": (trace or new_trace()).traceparent,
+    }
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+
+    http = session or requests
+    return http.post(
+        f"{base_url.rstrip('/')}/run_flow",
+        json=profile_payload(profile, seed),
+        params={"lane": lane} if lane else None,
+        headers=headers,
+        timeout=timeout
+    )
+
+
+def profile_payload(profile, seed=None):
+    """JSON body for one run: the profile's fields, plus the run seed if given."""
+    payload = dict(profile.__dict__)
+    if seed is not None:
+        payload["seed"] = seed
+    return payload
+
+
+def submit_job(payloads, base_url=CLOUD_URL, timeout=REQUEST_TIMEOUT, session=None, idempotency_key=None):
+    """POST a batch of profile payloads to /jobs (bulk lane); the 202 body carries the job_id.
+
+    Resending with the same `idempotency_key` returns the original job.
+    """
+    headers = {"traceparent": new_trace().traceparent}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    http = session or requests
+    return http.post(f"{base_url.rstrip('/')}/jobs", json={"profiles": payloads}, headers=headers,
+                     timeout=timeout)
+
+
+def get_job(job_id, base_url=CLOUD_URL, timeout=REQUEST_TIMEOUT, session=None):
+    """GET /jobs/{job_id}: the job's status and per-run results (404 once the server has forgotten it)."""
+    http = session or requests
+    return http.get(f"{base_url.rstrip('/')}/jobs/{job_id}", timeout=timeout)
+
+
+def timing_breakdown(resp, client_ms=None):
+    """Split a run_flow round trip (ms) into network, server queue, browser and other server time.
+
+    Server-side parts come from the response's Server-Timing header; network
+    is whatever of the round trip the server didn't account for. A replayed
+    idempotent response only reports the server total.
+    """
+    server = parse_server_timing(resp.headers.get("Server-Timing"))
+    round_trip = resp.elapsed.total_seconds() * 1000
+    out = {"client": client_ms, "round_trip": round(round_trip, 1)}
+    if "total" in server:
+        out["network"] = round(max(0.0, round_trip - server["total"]), 1)
+        out["server"] = server["total"]
+        if "queue" in server and "browser" in server:
+            out["queue"] = server["queue"]
+            out["browser"] = server["browser"]
+            out["server_other"] = round(max(0.0, server["total"] - server["queue"] - server["browser"]), 1)
+    return out
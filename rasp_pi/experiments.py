@@ -0,0 +1,199 @@
+# experiments.py
+
+# Runs a declarative experiment matrix (generator x viewport x repetition)
+# against the cloud server in parallel. Every completed cell is appended to a
+# JSONL checkpoint, so an interrupted sweep resumes where it stopped.
+#
+#     python experiments.py matrix.json --base-url http://127.0.0.1:8000 --parallel 4
+#
+# matrix.json:
+#     {
+#       "name": "viewport-sweep",
+#       "generators": ["windows_chrome", "android_chrome"],    # or "all"
+#       "viewports": "all",           # "all": every viewport of the generator's device class
+#                                     # "default": whatever the generator picks
+#                                     # or {"desktop": [[1920, 1080]], "mobile": "all"}
+#       "repetitions": 5,
+#       "base_seed": 1000
+#     }
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from profiles.profile import BrowserProfile
+from profiles.profile_generator import GENERATORS, DESKTOP_VIEWPORTS, ANDROID_VIEWPORTS
+from cloud_client import CLOUD_URL, REQUEST_TIMEOUT, run_flow
+
+GENERATORS_BY_NAME = {g.__name__: g for g in GENERATORS}
+VIEWPORTS_BY_HARDWARE = {"desktop": DESKTOP_VIEWPORTS, "mobile": ANDROID_VIEWPORTS}
+
+
+def cell_seed(base_seed, key):
+    """Stable per-cell seed, so a resumed or repeated sweep sends identical runs."""
+    digest = hashlib.sha256(f"{base_seed}:{key}".encode()).digest()
+    return int.from_bytes(digest[:4], "big")
+
+
+def _viewports_for(gen, spec):
+    hardware = gen(random.Random(0))["hardware_type"]
+    if isinstance(spec, dict):
+        spec = spec.get(hardware, "default")
+    if spec == "default":
+        return [None]
+    if spec == "all":
+        return list(VIEWPORTS_BY_HARDWARE[hardware])
+    return [tuple(v) for v in spec]
+
+
+def expand_matrix(matrix):
+    """Turn the matrix into an ordered list of job cells."""
+    names = matrix.get("generators", "all")
+    if names == "all":
+        names = list(GENERATORS_BY_NAME)
+
+    unknown = [n for n in names if n not in GENERATORS_BY_NAME]
+    if unknown:
+        raise ValueError(f"Unknown generators {unknown}; expected some of {list(GENERATORS_BY_NAME)}")
+
+    base_seed = matrix.get("base_seed", 0)
+    name_tag = matrix.get("name", "experiment")
+    cells = []
+    for name in names:
+        gen = GENERATORS_BY_NAME[name]
+        for viewport in _viewports_for(gen, matrix.get("viewports", "default")):
+            for rep in range(matrix.get("repetitions", 1)):
+                vp = f"{viewport[0]}x{viewport[1]}" if viewport else "default"
+                key = f"{name}|{vp}|{rep}"
+                cells.append({
+                    "key": key,
+                    "generator": name,
+                    "viewport": viewport,
+                    "rep": rep,
+                    "seed": cell_seed(base_seed, key),
+                    # resuming while a cell is still running server-side rejoins it
+                    "idempotency_key": hashlib.sha256(f"{name_tag}:{base_seed}:{key}".encode()).hexdigest()[:32],
+                })
+    return cells
+
+
+class Checkpoint:
+    """Append-only JSONL of finished cells; each line is flushed and fsynced."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue        # torn last line from a crash
+                    self.done[entry["key"]] = entry
+
+    def record(self, entry):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.done[entry["key"]] = entry
+
+
+def run_cell(cell, base_url, timeout):
+    gen = GENERATORS_BY_NAME[cell["generator"]]
+    raw = gen(random.Random(cell["seed"]))
+    if cell["viewport"]:
+        raw["viewport"] = tuple(cell["viewport"])
+    profile = BrowserProfile(**raw)
+
+    start = time.perf_counter()
+    resp = run_flow(profile, base_url, timeout=timeout, seed=cell["seed"], lane="bulk",
+                    idempotency_key=cell["idempotency_key"])
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    resp.raise_for_status()
+    data = resp.json()
+
+    return {
+        **cell,
+        "viewport": f"{profile.viewport[0]}x{profile.viewport[1]}",
+        "latency_ms": latency_ms,
+        "run_id": data.get("run_id"),
+        "result_type": data.get("captcha_result", {}).get("type"),
+        "timings": data.get("timings", {}),
+        "finished_at": time.time(),
+    }
+
+
+def summarize(entries):
+    groups = defaultdict(lambda: {"runs": 0, "successes": 0, "latencies": []})
+    for e in entries:
+        g = groups[(e["generator"], e["viewport"])]
+        g["runs"] += 1
+        g["successes"] += e["result_type"] == "success"
+        g["latencies"].append(e["latency_ms"])
+
+    print(f"\n{'generator':>18} {'viewport':>10} {'runs':>5} {'success':>8} {'median ms':>10}")
+    for (gen, vp), g in sorted(groups.items()):
+        lat = sorted(g["latencies"])
+        print(f"{gen:>18} {vp:>10} {g['runs']:>5} {g['successes'] / g['runs'] * 100:>7.1f}% "
+              f"{lat[len(lat) // 2]:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a CAPTCHA experiment matrix")
+    parser.add_argument("matrix", help="Matrix JSON file")
+    parser.add_argument("--base-url", default=CLOUD_URL, help="Server to run against, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--parallel", type=int, default=2, help="Cells in flight at once")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--checkpoint", help="JSONL progress file (default: <matrix name>.checkpoint.jsonl)")
+    args = parser.parse_args()
+
+    with open(args.matrix) as f:
+        matrix = json.load(f)
+
+    cells = expand_matrix(matrix)
+    checkpoint = Checkpoint(args.checkpoint or f"{matrix.get('name', 'experiment')}.checkpoint.jsonl")
+    todo = [c for c in cells if c["key"] not in checkpoint.done]
+    print(f"[PI] {len(cells)} cells, {len(cells) - len(todo)} already done, {len(todo)} to run "
+          f"against {args.base_url} with {args.parallel} in parallel")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+        futures = {pool.submit(run_cell, c, args.base_url, args.timeout): c for c in todo}
+        try:
+            for i, fut in enumerate(as_completed(futures), 1):
+                cell = futures[fut]
+                try:
+                    entry = fut.result()
+                except (requests.RequestException, ValueError) as e:
+                    failed += 1
+                    print(f"[{i}/{len(todo)}] {cell['key']}: failed ({e}); will rerun on resume")
+                    continue
+                checkpoint.record(entry)
+                print(f"[{i}/{len(todo)}] {cell['key']}: {entry['result_type']} in {entry['latency_ms']:.0f} ms")
+        except KeyboardInterrupt:
+            # Drop the queued cells here; leaving the block would otherwise run the rest of the matrix
+            pool.shutdown(wait=False, cancel_futures=True)
+            print("\n[PI] Interrupted; completed cells are checkpointed, rerun the same command to resume "
+                  "(waiting for the cells in flight)")
+            raise
+
+    keys = {c["key"] for c in cells}
+    summarize([e for k, e in checkpoint.done.items() if k in keys])
+    if failed:
+        print(f"\n{failed} cell(s) failed and are not checkpointed; rerun to retry them")
+
+
+if __name__ == "__main__":
+    main()
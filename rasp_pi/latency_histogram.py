@@ -0,0 +1,83 @@
+# latency_histogram.py
+
+# HDR-style log-linear histogram. Values are bucketed with a constant relative
+# error (~1/SUB_BUCKETS) from microseconds up to minutes, so recording is O(1),
+# memory stays small and percentiles stay accurate in the tail.
+
+from collections import defaultdict
+
+SUB_BUCKETS = 256         # power of two; relative error <= 2 / SUB_BUCKETS
+_SUB_BITS = SUB_BUCKETS.bit_length() - 1
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = defaultdict(int)     # bucket index -> count (sparse)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    @staticmethod
+    def _index(us):
+        if us < SUB_BUCKETS:
+            return us
+        shift = us.bit_length() - _SUB_BITS
+        return shift * SUB_BUCKETS + (us >> shift)
+
+    @staticmethod
+    def _upper_us(index):
+        """Highest value that lands in a bucket (what HDR reports for a percentile)."""
+        shift, sub = divmod(index, SUB_BUCKETS)
+        if shift == 0:
+            return sub
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value_ms):
+        us = max(0, int(value_ms * 1000))
+        self.counts[self._index(us)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.min_ms = value_ms if self.min_ms is None else min(self.min_ms, value_ms)
+        self.max_ms = value_ms if self.max_ms is None else max(self.max_ms, value_ms)
+
+    def merge(self, other):
+        for idx, n in other.counts.items():
+            self.counts[idx] += n
+        self.count += other.count
+        self.total_ms += other.total_ms
+        for attr, pick in (("min_ms", min), ("max_ms", max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            if theirs is not None:
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= target:
+                return min(self._upper_us(idx) / 1000, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2),
+            "min_ms": round(self.min_ms, 2),
+            "p50_ms": round(self.percentile(50), 2),
+            "p90_ms": round(self.percentile(90), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "p999_ms": round(self.percentile(99.9), 2),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+    def buckets(self):
+        """(upper bound ms, count) pairs for plotting / re-aggregation."""
+        return [(self._upper_us(idx) / 1000, self.counts[idx]) for idx in sorted(self.counts)]
@@ -0,0 +1,243 @@
+# load_test.py
+
+# Load generator for the cloud /run_flow service, built on the Pi client and
+# profile generator.
+#
+# Open loop: requests arrive at a target rate whether or not earlier ones have
+# returned. Latency is measured from each request's *intended* send time, so
+# queueing behind a saturated server is counted instead of hidden.
+#     python load_test.py --mode open --rates 0.05,0.1,0.2 --duration 120
+#
+# Closed loop: N workers, each sending its next request when the last returns.
+#     python load_test.py --mode closed --workers 1,2,4 --duration 120
+#
+# Each stage (one rate / worker count) reports p50/p95/p99 latency, error
+# rate, per-phase server timings and achieved throughput; the highest
+# achieved throughput across stages is reported as the saturation throughput.
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from profiles.profile_generator import generate_random_profile
+from profiles.profile import BrowserProfile
+from cloud_client import CLOUD_URL, REQUEST_TIMEOUT, run_flow
+from latency_histogram import LatencyHistogram
+
+# A stage counts as saturated once it completes less than this share of the
+# offered rate (open loop) or adding workers gains less than this (closed loop)
+SATURATION_RATIO = 0.9
+MAX_ERROR_RATE = 0.05
+
+_local = threading.local()
+
+
+def _session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+class StageStats:
+
+    def __init__(self, label, offered_rps=None, workers=None):
+        self.label = label
+        self.offered_rps = offered_rps
+        self.workers = workers
+        self.latency = LatencyHistogram()
+        self.phases = defaultdict(LatencyHistogram)
+        self.outcomes = Counter()      # CAPTCHA result types
+        self.errors = Counter()        # transport / HTTP failures
+        self.sent = 0
+        self.started = time.perf_counter()
+        self.last_done = self.started
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms, data=None, error=None):
+        with self._lock:
+            self.last_done = time.perf_counter()
+            if error:
+                self.errors[error] += 1
+                return
+
+            self.latency.record(latency_ms)
+            self.outcomes[data.get("captcha_result", {}).get("type", "unknown")] += 1
+            for phase, ms in data.get("timings", {}).items():
+                self.phases[phase].record(ms)
+
+    def report(self):
+        completed = self.latency.count
+        failed = sum(self.errors.values())
+        elapsed = max(self.last_done - self.started, 1e-9)
+
+        return {
+            "stage": self.label,
+            "offered_rps": self.offered_rps,
+            "workers": self.workers,
+            "sent": self.sent,
+            "completed": completed,
+            "failed": failed,
+            "error_rate": round(failed / (completed + failed), 4) if completed + failed else 0.0,
+            "elapsed_s": round(elapsed, 2),
+            "achieved_rps": round(completed / elapsed, 4),
+            "latency": self.latency.summary(),
+            "phases": {name: h.summary() for name, h in sorted(self.phases.items())},
+            "outcomes": dict(self.outcomes),
+            "errors": dict(self.errors),
+        }
+
+
+def send_one(stats, base_url, timeout, intended_start=None):
+    """Issue one run_flow with a fresh profile and record it against the stage."""
+    profile = BrowserProfile(**generate_random_profile())
+    start = intended_start if intended_start is not None else time.perf_counter()
+
+    try:
+        resp = run_flow(profile, base_url, timeout=timeout, session=_session())
+        latency_ms = (time.perf_counter() - start) * 1000
+        if resp.status_code != 200:
+            stats.record(latency_ms, error=f"http_{resp.status_code}")
+            return
+        stats.record(latency_ms, data=resp.json())
+
+    except requests.Timeout:
+        stats.record(None, error="timeout")
+    except requests.ConnectionError:
+        stats.record(None, error="connection")
+    except ValueError:
+        stats.record(None, error="bad_json")
+    except requests.RequestException as e:
+        # ChunkedEncodingError, TooManyRedirects, ...: nobody reads the futures, so count it here
+        stats.record(None, error=type(e).__name__)
+
+
+def run_open_stage(base_url, rate, duration, timeout, max_in_flight, arrival, rng):
+    stats = StageStats(f"open@{rate}rps", offered_rps=rate)
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        start = time.perf_counter()
+        next_send = start
+        while next_send - start < duration:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            futures.append(pool.submit(send_one, stats, base_url, timeout, next_send))
+            stats.sent += 1
+            next_send += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+
+        wait(futures)
+
+    return stats
+
+
+def run_closed_stage(base_url, workers, duration, timeout):
+    stats = StageStats(f"closed@{workers}w", workers=workers)
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                stats.sent += 1
+            send_one(stats, base_url, timeout)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return stats
+
+
+def mark_saturation(mode, stages):
+    """Flag saturated stages and return the saturation throughput (best achieved rps)."""
+    prev = None
+    for s in stages:
+        if mode == "open":
+            saturated = s["achieved_rps"] < SATURATION_RATIO * s["offered_rps"]
+        else:
+            saturated = prev is not None and s["achieved_rps"] < prev["achieved_rps"] / SATURATION_RATIO
+        s["saturated"] = saturated or s["error_rate"] > MAX_ERROR_RATE
+        prev = s
+
+    return max((s["achieved_rps"] for s in stages), default=0.0)
+
+
+def print_report(report):
+    print(f"\n=== Load test against {report['base_url']} ({report['mode']} loop) ===")
+    print(f"{'stage':>16} {'sent':>6} {'ok':>6} {'err%':>6} {'rps':>8} "
+          f"{'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}  sat")
+    for s in report["stages"]:
+        lat = s["latency"]
+        print(f"{s['stage']:>16} {s['sent']:>6} {s['completed']:>6} {s['error_rate'] * 100:>6.1f} "
+              f"{s['achieved_rps']:>8.3f} {lat.get('p50_ms', 0):>10.0f} {lat.get('p95_ms', 0):>10.0f} "
+              f"{lat.get('p99_ms', 0):>10.0f}  {'yes' if s['saturated'] else ''}")
+
+    last = report["stages"][-1]
+    if last["phases"]:
+        print(f"\nPer-phase server time, last stage ({last['stage']}):")
+        for phase, h in last["phases"].items():
+            print(f"{phase:>16}  p50 {h['p50_ms']:>9.0f} ms  p95 {h['p95_ms']:>9.0f} ms  p99 {h['p99_ms']:>9.0f} ms")
+
+    print(f"\nSaturation throughput: {report['saturation_rps']:.3f} runs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the cloud run_flow service")
+    parser.add_argument("--base-url", default=CLOUD_URL, help="Server to test, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=["open", "closed"], default="closed")
+    parser.add_argument("--rates", default="0.05", help="Open loop: comma-separated target rates (req/s)")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Open loop: client-side concurrency cap")
+    parser.add_argument("--workers", default="1", help="Closed loop: comma-separated worker counts")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per stage")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--seed", type=int, help="Seed for Poisson arrivals")
+    parser.add_argument("--output", help="Write the full JSON report here")
+    args = parser.parse_args()
+
+    # Wakes an auto-stopped fly machine before timing starts
+    try:
+        requests.get(f"{args.base_url.rstrip('/')}/health", timeout=args.timeout)
+    except requests.RequestException as e:
+        print(f"[PI] Warning: health check failed: {e}")
+
+    rng = random.Random(args.seed)
+    stages = []
+    if args.mode == "open":
+        for rate in (float(r) for r in args.rates.split(",")):
+            print(f"[PI] Stage open loop at {rate} req/s for {args.duration}s...")
+            stats = run_open_stage(args.base_url, rate, args.duration, args.timeout,
+                                   args.max_in_flight, args.arrival, rng)
+            stages.append(stats.report())
+    else:
+        for workers in (int(w) for w in args.workers.split(",")):
+            print(f"[PI] Stage closed loop with {workers} workers for {args.duration}s...")
+            stats = run_closed_stage(args.base_url, workers, args.duration, args.timeout)
+            stages.append(stats.report())
+
+    report = {
+        "base_url": args.base_url,
+        "mode": args.mode,
+        "stages": stages,
+        "saturation_rps": mark_saturation(args.mode, stages),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
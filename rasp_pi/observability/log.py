@@ -0,0 +1,192 @@
+# log.py
+
+# Structured logging. Every record is one JSON object per line: time, level,
+# logger, message, plus context fields (run_id, phase, ...) bound with
+# log_context() and any `extra=` fields. Handlers only enqueue; a background
+# QueueListener thread does the formatting and the stdout write, so logging
+# never blocks a run.
+#
+# LOG_LEVEL          root level (default INFO)
+# LOG_LEVELS         per-logger overrides, e.g. "start_pi=DEBUG,experiments=WARNING"
+# LOG_FORMAT         "json" (default) or "text" for local reading
+# LOG_DUMP_RATE      verbose per-run dumps (full profile) allowed per second; beyond
+# LOG_DUMP_BURST     a burst of this size they are sampled away and counted
+
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_DUMP_RATE = float(os.environ.get("LOG_DUMP_RATE", "1"))
+LOG_DUMP_BURST = float(os.environ.get("LOG_DUMP_BURST", "5"))
+
+# Attributes every LogRecord has; anything else on a record came from extra= or the context
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_context = contextvars.ContextVar("log_context", default={})
+_listener = None
+_listener_pid = None        # a forked child inherits _listener but not its thread
+_setup_lock = threading.Lock()
+
+
+# ---- Context ----
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """Attach fields (run_id, phase, ...) to every record logged inside the block.
+
+    Context variables follow asyncio tasks and asyncio.to_thread(), so fields
+    bound in a request handler also appear on records from the worker thread.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+
+    def filter(self, record):
+        for k, v in _context.get().items():
+            if not hasattr(record, k):
+                setattr(record, k, v)
+        return True
+
+
+# ---- Formatting ----
+
+class JsonFormatter(logging.Formatter):
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in vars(record).items():
+            if k not in _RECORD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def __init__(self, service):
+        super().__init__("%(asctime)s %(levelname)-5s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith("_")}
+        return f"{line} {json.dumps(fields, default=str)}" if fields else line
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread; only the message and
+    traceback are rendered up front, since args and exc_info may not outlive the call."""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# ---- Setup ----
+
+def setup_logging(service, level=None, fmt=None, stream=None):
+    """Route the root logger through a non-blocking queue.
+
+    Safe to call more than once, and again in a forked child (which needs its own writer thread).
+    """
+    global _listener, _listener_pid
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+
+        formatter = (TextFormatter if (fmt or LOG_FORMAT) == "text" else JsonFormatter)(service)
+        sink = logging.StreamHandler(stream or sys.stdout)
+        sink.setFormatter(formatter)
+
+        records = queue.SimpleQueue()
+        handler = _EnqueueHandler(records)
+        handler.addFilter(_ContextFilter())
+
+        root = logging.getLogger()
+        root.handlers[:] = [handler]
+        root.setLevel(level or LOG_LEVEL)
+        for spec in filter(None, (s.strip() for s in LOG_LEVELS.split(","))):
+            name, _, lvl = spec.partition("=")
+            logging.getLogger(name.strip()).setLevel(lvl.strip().upper())
+
+        _listener = logging.handlers.QueueListener(records, sink)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
+
+
+# ---- Sampling of verbose dumps ----
+
+class DumpSampler:
+    """Token bucket: lets `rate` dumps per second through (bursts up to `burst`), drops the rest."""
+
+    def __init__(self, rate=LOG_DUMP_RATE, burst=LOG_DUMP_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.dropped = 0
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.dropped += 1
+            return False
+
+
+_dump_sampler = DumpSampler()
+
+
+def log_profile_dump(logger, profile, **fields):
+    """Log every profile field for a run, sampled so a burst of runs doesn't flood the log."""
+    if not logger.isEnabledFor(logging.INFO) or not _dump_sampler.allow():
+        return
+    logger.info("profile", extra={"profile": dict(vars(profile)), "dumps_sampled_out": _dump_sampler.dropped,
+                                  **fields})
@@ -0,0 +1,94 @@
+# trace_context.py
+
+# W3C Trace Context (https://www.w3.org/TR/trace-context/) between the Pi and
+# the cloud. The Pi starts a trace and sends it as a `traceparent` header.
+# The server adopts it, so its log records and per-run traces carry the Pi's
+# trace_id. The server reports where its time went in a Server-Timing header
+# (queue, browser, total), and the Pi subtracts that from its own round trip
+# to get client / network / queue / browser time.
+
+import contextlib
+import contextvars
+import re
+import secrets
+
+from observability.log import log_context
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$")
+_ZERO_TRACE = "0" * 32
+_ZERO_SPAN = "0" * 16
+
+_current = contextvars.ContextVar("trace_context", default=None)
+
+
+class TraceContext:
+
+    def __init__(self, trace_id, span_id, parent_id=None, flags="01"):
+        self.trace_id = trace_id
+        self.span_id = span_id          # our span
+        self.parent_id = parent_id      # the caller's span, if the trace came in from outside
+        self.flags = flags
+
+    @property
+    def traceparent(self):
+        """Header value naming our span as the parent of whatever we call next."""
+        return f"00-{self.trace_id}-{self.span_id}-{self.flags}"
+
+    def child(self):
+        return TraceContext(self.trace_id, new_span_id(), self.span_id, self.flags)
+
+
+def new_span_id():
+    return secrets.token_hex(8)
+
+
+def new_trace():
+    return TraceContext(secrets.token_hex(16), new_span_id())
+
+
+def parse_traceparent(value):
+    """TraceContext continuing the caller's trace, or None if the header is missing or malformed."""
+    m = _TRACEPARENT.match((value or "").strip().lower())
+    if not m:
+        return None
+    version, trace_id, parent_id, flags, rest = m.groups()
+    if version == "ff" or (version == "00" and rest) or trace_id == _ZERO_TRACE or parent_id == _ZERO_SPAN:
+        return None
+    return TraceContext(trace_id, new_span_id(), parent_id, flags)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def trace_scope(ctx):
+    """Make `ctx` the current trace and tag every log record in the block with it."""
+    token = _current.set(ctx)
+    try:
+        with log_context(trace_id=ctx.trace_id, span_id=ctx.span_id, parent_span_id=ctx.parent_id):
+            yield ctx
+    finally:
+        _current.reset(token)
+
+
+# ---- Server-Timing ----
+
+def format_server_timing(timings):
+    """Server-Timing header value from {name: milliseconds}."""
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items() if ms is not None)
+
+
+def parse_server_timing(value):
+    """{name: milliseconds} from a Server-Timing header; metrics without a duration are skipped."""
+    out = {}
+    for metric in (value or "").split(","):
+        name, *params = [p.strip() for p in metric.split(";")]
+        for p in params:
+            key, _, dur = p.partition("=")
+            if name and key == "dur":
+                try:
+                    out[name] = float(dur)
+                except ValueError:
+                    pass
+    return out
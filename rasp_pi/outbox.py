@@ -0,0 +1,324 @@
+# outbox.py
+
+# Durable local queue of runs the Pi wants the cloud to do, and of their
+# results. Nothing is lost while the cloud app is stopped (fly auto-stop) or
+# unreachable: a run goes into the outbox (one SQLite file) and a background
+# Flusher sends whatever is pending as POST /jobs batches whenever the server
+# answers, then polls the jobs and stores each run's result next to its
+# profile.
+#
+# Row states:
+#   pending    waiting to be sent
+#   sending    assigned to a batch; the POST may or may not have reached the
+#              server, so the batch is resent with the same Idempotency-Key
+#   submitted  accepted as part of job_id; waiting for its result
+#   done / failed   (failed also covers a batch the server refused with a 4xx)
+#
+# OUTBOX_PATH          SQLite file (default: outbox.sqlite3 next to this script)
+# FLUSH_BATCH_SIZE     runs per POST /jobs (default 10)
+# FLUSH_INTERVAL       seconds between polls while online (default 5)
+# FLUSH_MAX_BACKOFF    longest wait between attempts while offline (default 300)
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+from cloud_client import CLOUD_URL, get_job, submit_job
+
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "outbox.sqlite3"))
+FLUSH_BATCH_SIZE = int(os.environ.get("FLUSH_BATCH_SIZE", "10"))
+FLUSH_INTERVAL = float(os.environ.get("FLUSH_INTERVAL", "5"))
+FLUSH_MAX_BACKOFF = float(os.environ.get("FLUSH_MAX_BACKOFF", "300"))
+
+# Gateway errors mean fly's proxy couldn't reach (or wake) the app: treat like a connection error
+UNREACHABLE_STATUSES = (502, 503, 504)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    seed         INTEGER,
+    payload      TEXT NOT NULL,
+    state        TEXT NOT NULL,
+    batch_key    TEXT,
+    batch_index  INTEGER,
+    job_id       TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    result       TEXT,
+    error        TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_state ON runs (state, id);
+CREATE INDEX IF NOT EXISTS idx_runs_job ON runs (job_id, batch_index);
+"""
+
+logger = logging.getLogger("outbox")
+
+
+class Unreachable(Exception):
+    """The cloud didn't answer (connection error, timeout or a gateway error)."""
+
+
+def gateway_error(resp):
+    """True for a 502/503/504 from the proxy in front of the app rather than from the app itself.
+
+    The app answers errors with FastAPI's {"detail": ...} JSON, e.g. the 504 of
+    a run that hit its X-Request-Deadline: the server was reached and has
+    recorded that run, so it must not be sent again.
+    """
+    if resp.status_code not in UNREACHABLE_STATUSES:
+        return False
+    try:
+        body = resp.json()
+    except ValueError:
+        return True
+    return not (isinstance(body, dict) and "detail" in body)
+
+
+class Outbox:
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        # Short-lived connections: the producer loop and the flusher run in different threads
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add(self, payload, seed=None):
+        """Queue one run (a /run_flow-style profile payload); returns its row id."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "INSERT INTO runs (seed, payload, state, created_at, updated_at) VALUES (?, ?, 'pending', ?, ?)",
+                (seed, json.dumps(payload), now, now),
+            ).lastrowid
+        finally:
+            conn.close()
+
+    def counts(self):
+        """{state: rows}."""
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM runs GROUP BY state").fetchall())
+        finally:
+            conn.close()
+
+    def backlog(self):
+        """Runs not finished yet (pending, sending or submitted)."""
+        counts = self.counts()
+        return sum(n for state, n in counts.items() if state not in ("done", "failed"))
+
+    def results(self, since_id=0):
+        """Finished runs with id > since_id, oldest first."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, seed, state, job_id, result, error, created_at, updated_at FROM runs "
+                                "WHERE id > ? AND state IN ('done', 'failed') ORDER BY id", (since_id,))
+            return [{**dict(r), "result": json.loads(r["result"]) if r["result"] else None} for r in rows]
+        finally:
+            conn.close()
+
+    # ---- Flusher side ----
+
+    def next_batch(self, limit=FLUSH_BATCH_SIZE):
+        """(batch key, [(row id, payload)]) to send next, or (None, []) when nothing is pending.
+
+        A batch that was assigned but never confirmed comes first, with its
+        original key, so a POST that did reach the server is not submitted twice.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT batch_key FROM runs WHERE state = 'sending' ORDER BY id LIMIT 1").fetchone()
+            if row:
+                key = row["batch_key"]
+            else:
+                ids = [r["id"] for r in conn.execute(
+                    "SELECT id FROM runs WHERE state = 'pending' ORDER BY id LIMIT ?", (limit,))]
+                if not ids:
+                    conn.execute("COMMIT")
+                    return None, []
+                key = uuid.uuid4().hex
+                now = time.time()
+                conn.executemany(
+                    "UPDATE runs SET state = 'sending', batch_key = ?, batch_index = ?, updated_at = ? WHERE id = ?",
+                    [(key, i, now, row_id) for i, row_id in enumerate(ids)])
+            rows = conn.execute("SELECT id, payload FROM runs WHERE batch_key = ? AND state = 'sending' "
+                                "ORDER BY batch_index", (key,)).fetchall()
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return key, [(r["id"], json.loads(r["payload"])) for r in rows]
+
+    def mark_submitted(self, batch_key, job_id):
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE runs SET state = 'submitted', job_id = ?, attempts = attempts + 1, updated_at = ? "
+                         "WHERE batch_key = ? AND state = 'sending'", (job_id, time.time(), batch_key))
+        finally:
+            conn.close()
+
+    def fail_batch(self, batch_key, error):
+        """Give up on a batch the server refused; returns how many runs it held."""
+        conn = self._connect()
+        try:
+            return conn.execute("UPDATE runs SET state = 'failed', error = ?, attempts = attempts + 1, updated_at = ? "
+                                "WHERE batch_key = ? AND state = 'sending'", (error, time.time(), batch_key)).rowcount
+        finally:
+            conn.close()
+
+    def submitted_jobs(self):
+        """Job ids with runs still waiting for a result."""
+        conn = self._connect()
+        try:
+            return [r[0] for r in conn.execute(
+                "SELECT DISTINCT job_id FROM runs WHERE state = 'submitted' ORDER BY id")]
+        finally:
+            conn.close()
+
+    def complete_job(self, job_id, runs):
+        """Store the finished entries of a GET /jobs/{job_id} answer against their rows; returns how many were new."""
+        now = time.time()
+        finished = [r for r in runs if r.get("status") in ("ok", "failed", "cancelled")]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            stored = conn.executemany(
+                "UPDATE runs SET state = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND batch_index = ? AND state = 'submitted'",
+                [("done" if r["status"] == "ok" else "failed", json.dumps(r), r.get("error"), now, job_id, r["index"])
+                 for r in finished]).rowcount
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return stored
+
+    def requeue_job(self, job_id):
+        """Send a job's unfinished runs again (the server restarted and forgot the job)."""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "UPDATE runs SET state = 'pending', batch_key = NULL, batch_index = NULL, job_id = NULL, "
+                "updated_at = ? WHERE job_id = ? AND state = 'submitted'", (time.time(), job_id)).rowcount
+        finally:
+            conn.close()
+
+
+class Flusher:
+    """Background thread that drains an Outbox into the cloud in batches.
+
+    While the server answers it sends every pending batch and polls
+    submitted jobs each FLUSH_INTERVAL. While it doesn't, attempts back off
+    exponentially up to FLUSH_MAX_BACKOFF. wake() (called after adding work)
+    sends straight away while online.
+    """
+
+    def __init__(self, outbox, base_url=CLOUD_URL, batch_size=FLUSH_BATCH_SIZE, interval=FLUSH_INTERVAL,
+                 max_backoff=FLUSH_MAX_BACKOFF):
+        self.outbox = outbox
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.online = None
+        self._session = requests.Session()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="outbox-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            try:
+                self.flush()
+                delay = self.interval
+            except Unreachable as e:
+                delay = min(self.max_backoff, max(self.interval, delay * 2))
+                logger.debug("cloud unreachable; will retry", extra={"error": str(e), "retry_in": delay,
+                                                                    "backlog": self.outbox.backlog()})
+            except Exception:
+                logger.exception("outbox flush failed")
+                delay = min(self.max_backoff, max(self.interval, delay * 2))
+            if self.online is False:
+                # New work doesn't shorten the backoff; it is sent with the next successful attempt
+                self._stop.wait(delay)
+            else:
+                self._wake.wait(delay)
+            self._wake.clear()
+
+    def _set_online(self, online):
+        if online != self.online:
+            logger.info("cloud online" if online else "cloud offline", extra={"url": self.base_url})
+        self.online = online
+
+    def _call(self, fn, *args, **kwargs):
+        try:
+            resp = fn(*args, base_url=self.base_url, session=self._session, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self._set_online(False)
+            raise Unreachable(type(e).__name__) from e
+        if gateway_error(resp):
+            self._set_online(False)
+            raise Unreachable(f"HTTP {resp.status_code}")
+        self._set_online(True)
+        return resp
+
+    def flush(self):
+        """Send all pending batches, then collect finished results; raises Unreachable when offline."""
+        while not self._stop.is_set():
+            key, rows = self.outbox.next_batch(self.batch_size)
+            if not rows:
+                break
+            resp = self._call(submit_job, [payload for _, payload in rows], idempotency_key=key)
+            if resp.status_code == 429:
+                # Server backlog is full; leave the batch as it is and collect results meanwhile
+                logger.info("server busy; batch held", extra={"retry_after": resp.headers.get("Retry-After")})
+                break
+            if 400 <= resp.status_code < 500:
+                # Resending won't change the answer, and a batch stuck in 'sending' would block the rest
+                failed = self.outbox.fail_batch(key, f"HTTP {resp.status_code}: {resp.text[:500]}")
+                logger.warning("batch rejected", extra={"http_status": resp.status_code, "runs": failed})
+                continue
+            resp.raise_for_status()
+            job_id = resp.json()["job_id"]
+            self.outbox.mark_submitted(key, job_id)
+            logger.info("batch submitted", extra={"job_id": job_id, "runs": len(rows)})
+
+        for job_id in self.outbox.submitted_jobs():
+            resp = self._call(get_job, job_id)
+            if resp.status_code == 404:
+                requeued = self.outbox.requeue_job(job_id)
+                logger.warning("job unknown to the server; requeued", extra={"job_id": job_id, "runs": requeued})
+                continue
+            resp.raise_for_status()
+            finished = self.outbox.complete_job(job_id, resp.json()["runs"])
+            if finished:
+                logger.info("job results stored", extra={"job_id": job_id, "finished": finished})
@@ -0,0 +1,44 @@
+# profile_buffer.py
+import queue
+import random
+import secrets
+import threading
+
+from profiles.profile import BrowserProfile
+from profiles.profile_generator import generate_random_profile
+
+PROFILE_BUFFER_SIZE = 32
+
+
+class ProfileBuffer:
+    """Background producer keeping up to `size` ready (seed, BrowserProfile) pairs.
+
+    take() hands out a pre-generated profile, so callers never wait on
+    generation; the producer blocks while the buffer is full.
+    """
+
+    def __init__(self, size=PROFILE_BUFFER_SIZE):
+        self._ready = queue.Queue(maxsize=size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, name="profile-producer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def take(self, timeout=None):
+        return self._ready.get(timeout=timeout)
+
+    def _produce(self):
+        while not self._stop.is_set():
+            seed = secrets.randbits(32)
+            item = (seed, BrowserProfile(**generate_random_profile(random.Random(seed))))
+            while not self._stop.is_set():
+                try:
+                    self._ready.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
@@ -1,31 +1,181 @@
 # start_pi.py
+
+# One run:           python start_pi.py
+#     Sends a fresh profile to /run_flow. If the cloud can't be reached (app
+#     stopped, network down) the run is kept in the outbox instead of lost.
+# Continuous:        python start_pi.py --continuous --interval 60
+#     Queues a pre-generated profile every interval; a background flusher
+#     sends the outbox to POST /jobs in batches whenever the cloud answers.
+# Drain the outbox:  python start_pi.py --flush
+#
+# OUTBOX_MAX_BACKLOG caps unfinished runs in the outbox; --continuous waits
+# rather than queue more.
+
+import argparse
+import logging
+import os
+import random
+import secrets
+import time
+import uuid
+
 import requests
 
 from profiles.profile_generator import generate_random_profile
 from profiles.profile import BrowserProfile
+from profiles.profile_buffer import ProfileBuffer
+from cloud_client import CLOUD_URL, profile_payload, run_flow, timing_breakdown
+from observability.log import log_context, log_profile_dump, setup_logging
+from observability.trace_context import new_trace, trace_scope
+from outbox import FLUSH_INTERVAL, Flusher, Outbox, Unreachable, gateway_error
+
+RETRIES = 3
+RETRY_BACKOFF = 2.0     # seconds, doubled per attempt
+OUTBOX_MAX_BACKLOG = int(os.environ.get("OUTBOX_MAX_BACKLOG", "500"))
+
+logger = logging.getLogger("start_pi")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Send generated profiles to the cloud CAPTCHA runner")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--continuous", action="store_true", help="Keep queueing runs; flush them in batches")
+    mode.add_argument("--flush", action="store_true", help="Send the outbox and wait for its results, then exit")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between runs with --continuous")
+    args = parser.parse_args()
+
+    setup_logging("pi")
+    outbox = Outbox()
+    if args.continuous:
+        run_continuous(outbox, args.interval)
+    elif args.flush:
+        drain(outbox)
+    else:
+        run_once(outbox)
+
+
+def run_once(outbox):
+    started = time.perf_counter()
+
+    # One seed drives the whole run: profile here, path/timing on the server.
+    # Set RUN_SEED to replay a previous run.
+    seed = int(os.environ["RUN_SEED"]) if os.environ.get("RUN_SEED") else secrets.randbits(32)
 
     # Generate the profile
-    raw = generate_random_profile()
+    raw = generate_random_profile(random.Random(seed))
     profile = BrowserProfile(**raw)
 
-    print("\n=== Generated Browser Profile ===")
-    for k, v in profile.__dict__.items():
-        print(f"{k}: {v}")
-    print("=================================\n")
+    # Same key on every attempt: a retry rejoins the run instead of starting another.
+    # One trace for the whole run; the server tags its records with the same trace_id.
+    key = uuid.uuid4().hex
+    with log_context(seed=seed, idempotency_key=key), trace_scope(new_trace()) as trace:
+        log_profile_dump(logger, profile)
+        logger.debug("sending profile to cloud", extra={"url": CLOUD_URL})
+        client_ms = (time.perf_counter() - started) * 1000
+        try:
+            resp, attempts = send(profile, seed, key, trace)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            resp, attempts = None, RETRIES + 1
+            error = type(e).__name__
+        else:
+            error = f"HTTP {resp.status_code}"
+        if resp is None or gateway_error(resp):
+            row = outbox.add(profile_payload(profile, seed), seed)
+            logger.warning("cloud unreachable; run kept in outbox",
+                           extra={"error": error, "attempts": attempts, "outbox_id": row})
+            return
+
+        # Where the time went: here, on the wire, queued on the server, in the browser.
+        # Time outside the last round trip is spent retrying (or, without retries, still on our side).
+        total_ms = (time.perf_counter() - started) * 1000
+        timing = timing_breakdown(resp)
+        outside = max(0.0, total_ms - client_ms - timing["round_trip"])
+        timing["client"] = round(client_ms + (outside if attempts == 1 else 0.0), 1)
+        timing["retries"] = round(outside, 1) if attempts > 1 else 0.0
+        timing["total"] = round(total_ms, 1)
+        logger.info("cloud response", extra={"http_status": resp.status_code, "timing_ms": timing,
+                                             "response": resp.json()})
+
+    # The cloud is up: hand over anything left from earlier offline runs
+    if outbox.backlog():
+        try:
+            Flusher(outbox).flush()
+        except Unreachable:
+            pass
+
+
+def run_continuous(outbox, interval):
+    """Queue one buffered profile per interval; the flusher sends them whenever the cloud answers."""
+    profiles = ProfileBuffer().start()
+    flusher = Flusher(outbox)
+    flusher.start()
+    logger.info("continuous mode", extra={"interval": interval, "url": CLOUD_URL, "outbox": outbox.counts()})
+    try:
+        while True:
+            next_at = time.monotonic() + interval
+            if outbox.backlog() >= OUTBOX_MAX_BACKLOG:
+                logger.warning("outbox full; not queueing", extra={"backlog": OUTBOX_MAX_BACKLOG})
+            else:
+                seed, profile = profiles.take()
+                with log_context(seed=seed):
+                    log_profile_dump(logger, profile)
+                    row = outbox.add(profile_payload(profile, seed), seed)
+                    logger.debug("run queued", extra={"outbox_id": row})
+                flusher.wake()
+            time.sleep(max(0.0, next_at - time.monotonic()))
+    except KeyboardInterrupt:
+        logger.info("stopping; unsent runs stay in the outbox", extra={"outbox": outbox.counts()})
+    finally:
+        profiles.stop()
+        flusher.stop(timeout=10)
+
+
+def drain(outbox):
+    """Flush until every queued run has a result, logging results as they arrive."""
+    flusher = Flusher(outbox)
+    seen = max((r["id"] for r in outbox.results()), default=0)
+    logger.info("draining outbox", extra={"url": CLOUD_URL, "outbox": outbox.counts()})
+    delay = FLUSH_INTERVAL
+    while outbox.backlog():
+        try:
+            flusher.flush()
+            delay = FLUSH_INTERVAL
+        except Unreachable:
+            delay = min(flusher.max_backoff, delay * 2)
+        except requests.HTTPError as e:
+            logger.warning("outbox flush failed; will retry", extra={"error": str(e)})
+            delay = min(flusher.max_backoff, delay * 2)
+        for r in outbox.results(since_id=seen):
+            seen = r["id"]
+            logger.info("run finished", extra={"outbox_id": r["id"], "seed": r["seed"], "state": r["state"],
+                                               "response": r["result"]})
+        if outbox.backlog():
+            time.sleep(delay)
+    logger.info("outbox drained", extra={"outbox": outbox.counts()})
+
+
+def send(profile, seed, key, trace):
+    """POST the profile, retrying connection errors and 429s with the same Idempotency-Key.
 
-    print("[PI] Sending profile to cloud automation server...")
+    Returns the final response and the number of attempts it took.
+    """
+    for attempt in range(RETRIES + 1):
+        try:
+            resp = run_flow(profile, CLOUD_URL, seed=seed, idempotency_key=key, trace=trace.child())
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == RETRIES:
+                raise
+            logger.warning("request failed; retrying", extra={"error": type(e).__name__, "attempt": attempt + 1})
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            continue
 
-    resp = requests.post(
-        "https://rasp-pi.fly.dev/run_flow",
-        json=profile.__dict__,
-        timeout=90
-    )
+        if resp.status_code == 429 and attempt < RETRIES:
+            wait = float(resp.headers.get("Retry-After", RETRY_BACKOFF))
+            logger.info("server busy; retrying", extra={"retry_after": wait, "attempt": attempt + 1})
+            time.sleep(wait)
+            continue
+        return resp, attempt + 1
 
-    print("[PI] Cloud response:", resp.json())
-    return
 
 if __name__ == "__main__":
     main()